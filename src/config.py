@@ -1,12 +1,50 @@
+import os
+import shutil
+
 EXP_COLS = ['time','valid_time','fxx','t','prate','sde','tp', 'sdswrf','suswrf','sdlwrf','sulwrf', 'point_id','t2m','r2','si10','wdir10','max_10si']
 REQ_COLS = ['time','valid_time','fxx','point_id']
 
+# Months not fetched or simulated
+SUMMER_MONTHS = [6,7,8,9]
+
+# Valid (min, max) of fetched variables, values outside of them are replaced by remove_outliers
+OUTLIER_BOUNDS = (-10, 1000)
+# Bounds of single variables, overriding OUTLIER_BOUNDS
+VAR_OUTLIER_BOUNDS: dict[str, tuple[float, float]] = {}
+
 COORDS_SUBSET_FP = "../data/FAC/zones/grid_coords_subset.geojson"
 COORDS_FP = "../data/FAC/zones/grid_coords.geojson"
 TIFS_FP = "../data/FAC/tif"
 LOC_TIFS_FP = "src/util/loc_tif.json"
 SNO_FP = "data/input/sno"
 
+# SNOWPACK binary (The SNOWPACK_BIN environment variable, else `snowpack` on the PATH, else a macOS install) and
+# the ini file each simulation's ini is made from
+SNOWPACK_BIN = os.getenv("SNOWPACK_BIN") or shutil.which("snowpack") or "/Applications/Snowpack/bin/snowpack"
+SNOWPACK_INI = "data/input/avyIO.ini"
+# Decimals of the values csv_to_smet writes, and the value written for missing data
+SMET_PRECISION = 4
+SMET_NODATA = -999
+# Each simulation runs in its own directory under here
+SIM_WORK_DIR = "data/sim_work"
+# SNOWPACK state of each station at the end of its last run, see CheckpointStore
+SIM_CHECKPOINT_DIR = "data/sim_checkpoints"
+
+GRIB_CACHE_DIR = "~/data/avy_grib_cache"
+GRIB_CACHE_MAX_BYTES = 20 * 1024**3
+
+# HRRR archive in Zarr format, used by ZarrSource
+HRRR_ZARR_URL = "s3://hrrrzarr"
+
+# Northwest Montana (min lat, min lon, max lat, max lon), the region CubeStore keeps of every HRRR field
+CUBE_BOUNDS = (47.5, -115.5, 49.0, -113.0)
+HRRR_CUBE_DIR = "~/data/avy_hrrr_cube"
+
+# How point values are taken from the grid ("nearest", "idw" or "bilinear"), and where the weights of each
+# coordinate set are cached
+POINT_INTERPOLATION = "nearest"
+POINT_WEIGHTS_DIR = "~/data/avy_point_weights"
+
 SURF_REG = r":(?:TMP|SNOD|PRATE|APCP|.*WRF|RH|ASNOW):surface"
 M2_REG = r":(?:TMP|RH):2 m"
 WIND_REG = r":WIND|GRD:10 m above"
@@ -0,0 +1,240 @@
+import argparse
+import logging
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import EXP_COLS, REGS
+from src.herbie.fetch_pool import FetchJob, FetchPool
+from src.herbie.grib_cache import GribCache
+from src.herbie.herbie_fetch import HerbieFetcher
+from src.herbie.merge import legacy_merge, merge_frames
+from src.herbie.retry import RetryPolicy
+from src.herbie.sources import LocalSource
+
+SCENARIOS = ["season backfill", "daily forecast"]
+MERGE_SCENARIO = "day merge"
+BACKENDS = ["local", "zarr"]
+
+def make_coords(n_points: int, source: LocalSource, seed: int = 0) -> pd.DataFrame:
+    """Creates random points inside the grid of the given source.
+
+    Args:
+        n_points (int): Number of points
+        source (LocalSource): Source the points are fetched from
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: Points with 'id', 'latitude' and 'longitude' columns
+    """
+    rng = np.random.default_rng(seed)
+    min_lat, min_lon, max_lat, max_lon = source.bounds
+    return pd.DataFrame({
+        'id': np.arange(n_points) + 1,
+        'latitude': rng.uniform(min_lat, max_lat, n_points),
+        'longitude': rng.uniform(min_lon, max_lon, n_points),
+    })
+
+def scenario_intervals(scenario: str, days: int, start: datetime) -> tuple[list[tuple[datetime, datetime]], list[int]]:
+    """Gets the intervals and fxx fetched by a scenario.
+
+    Args:
+        scenario (str): One of `SCENARIOS`
+        days (int): Number of days to fetch
+        start (datetime): First day
+
+    Returns:
+        tuple[list[tuple[datetime, datetime]], list[int]]: Intervals and fxx
+    """
+    if scenario == "season backfill":
+        # Analysis hours in 6 hour intervals, like fetch_data with start_date and n_days
+        intervals = []
+        for day in range(days):
+            for i in range(4):
+                interval_start = start + timedelta(days=day, hours=6*i)
+                intervals.append((interval_start, interval_start + timedelta(hours=5)))
+        return intervals, [1]
+    if scenario == "daily forecast":
+        # One 00Z run per day with fxx 1-24, like fetch_missing_forecast_data
+        return [(start + timedelta(days=day), start + timedelta(days=day)) for day in range(days)], list(range(1, 25))
+    raise ValueError(f"Unknown scenario {scenario}, must be one of {SCENARIOS}")
+
+def run_scenario(scenario: str, source_dir: str, n_points: int = 60, days: int = 3, latency: float = 0.5, jitter: float = 0.5,
+                 failure_rate: float = 0.0, max_workers: Optional[int] = None, prefetch: int = 2, metrics_file: Optional[str] = None,
+                 backend: str = "local", coalesce: bool = False, request_latency: float = 0.0) -> dict:
+    """Fetches a scenario from a `LocalSource` into a temporary store and measures it. Run each scenario in
+    a new process, peak RSS is measured over the whole process.
+
+    Args:
+        scenario (str): One of `SCENARIOS`
+        source_dir (str): Directory of the `LocalSource` files
+        n_points (int, optional): Number of points to fetch. Defaults to 60.
+        days (int, optional): Number of days to fetch. Defaults to 3.
+        latency (float, optional): Source latency in seconds. Defaults to 0.5.
+        jitter (float, optional): Source jitter in seconds. Defaults to 0.5.
+        failure_rate (float, optional): Chance a fetch fails. Defaults to 0.0.
+        max_workers (Optional[int], optional): Number of fetch workers. Defaults to None (Number of cores).
+        prefetch (int, optional): Intervals fetched at once. Defaults to 2.
+        metrics_file (Optional[str], optional): File to export fetch metrics to (See `Metrics.export`). Defaults to None.
+        backend (str, optional): One of `BACKENDS`, "local" reads the GRIB2 like files of the `LocalSource` and "zarr"
+            reads the same data from a Zarr archive with `ZarrSource` (Without latency, jitter or failures). Defaults to "local".
+        coalesce (bool, optional): Fetch every regex of an interval in one job (See `HerbieFetcher.coalesce_regexes`). Defaults to False.
+        request_latency (float, optional): Seconds each .idx read and range request of the local backend waits. Defaults to 0.0.
+
+    Returns:
+        dict: Scenario results
+    """
+    source = LocalSource(source_dir, latency=latency, jitter=jitter, failure_rate=failure_rate, request_latency=request_latency)
+    coords = make_coords(n_points, source)
+    intervals, fxx = scenario_intervals(scenario, days, datetime(2025, 12, 1))
+
+    # Create the files up front, so only reading them is measured
+    dates = sorted(set(d for s, e in intervals for d in pd.date_range(s, e, freq='1h')))
+    source.populate(dates, fxx)
+    if backend == "zarr":
+        source = source.write_zarr(os.path.join(source_dir, "zarr"), dates, fxx)
+    elif backend != "local":
+        raise ValueError(f"Unknown backend {backend}, must be one of {BACKENDS}")
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        with FetchPool(max_workers, source) as pool:
+            hf = HerbieFetcher(out_dir, "bench.csv", os.path.join(out_dir, "errors.txt"), os.path.join(out_dir, "dates.txt"),
+                               pool=pool, cache=GribCache(os.path.join(out_dir, "cache")), prefetch=prefetch,
+                               retry_policy=RetryPolicy(base_delay=0.5), source=source, metrics_file=metrics_file, coalesce_regexes=coalesce)
+
+            s_time = time.perf_counter()
+            hf.fetch_data(REGS, fxx, coords, intervals=intervals) # type: ignore
+            elapsed = time.perf_counter() - s_time
+
+        n_hours = sum(len(pd.date_range(s, e, freq='1h')) for s, e in intervals) * len(fxx)
+        n_failed = sum(1 for _ in open(hf.error_file_path)) if os.path.exists(hf.error_file_path) else 0
+        n_rows = hf.store.read(columns=['time']).shape[0]
+
+    # ru_maxrss is in KB on Linux, children are the fetch workers
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    def total(name: str) -> float:
+        return sum(v for (counter, _), v in hf.metrics.counters.items() if counter == name)
+
+    # Round trips are .idx reads plus range requests, "separate" counts are what fetching each regex on its own takes
+    requests = total("range_requests")
+    round_trips = total("idx_reads") + requests
+
+    return {
+        "scenario": scenario,
+        "backend": backend,
+        "coalesce": coalesce,
+        "intervals": len(intervals),
+        "failed": n_failed,
+        "rows": n_rows,
+        "seconds": elapsed,
+        "intervals_per_min": len(intervals) / elapsed * 60,
+        "bytes_per_point_hour": total("bytes_downloaded") / (n_points * n_hours),
+        "requests_per_interval": requests / len(intervals),
+        "requests_saved_per_interval": (total("range_requests_separate") - requests) / len(intervals),
+        "round_trips_saved_per_interval": (total("idx_reads_separate") + total("range_requests_separate") - round_trips) / len(intervals),
+        "peak_rss_mb": self_rss,
+        "peak_worker_rss_mb": child_rss,
+        # Worker stages run in parallel, so their totals can add up to more than `seconds`
+        "stages": hf.metrics.summary().to_dict('records'),
+    }
+
+def run_merge_benchmark(source_dir: str, n_points: int = 33, repeats: int = 5) -> dict:
+    """Times merging a full day of regex results for the given number of points, with `merge_frames` and with
+    the merge `mutate_save_data` used before it.
+
+    Args:
+        source_dir (str): Directory of the `LocalSource` files
+        n_points (int, optional): Number of points. Defaults to 33.
+        repeats (int, optional): Number of times each merge is timed, the fastest is reported. Defaults to 5.
+
+    Returns:
+        dict: Benchmark results
+    """
+    source = LocalSource(source_dir)
+    coords = make_coords(n_points, source)
+    dates = pd.date_range(datetime(2025, 12, 1), periods=24, freq='1h')
+
+    # Split the long regexes in half like HerbieFetcher does
+    frames = []
+    for r in REGS:
+        for part in ([dates[:12], dates[12:]] if len(r) > 20 else [dates]):
+            frames.append(source.fetch(FetchJob(list(part), [1], r, coords)))
+
+    cols = [c for c in EXP_COLS if c != 'fxx']
+
+    def legacy():
+        merged = legacy_merge(frames)
+        return merged[[c for c in merged.columns if c in cols]]
+
+    def indexed():
+        return merge_frames(frames, cols)[0]
+
+    results = {"scenario": MERGE_SCENARIO, "points": n_points, "rows": indexed().shape[0]}
+    for name, merge in [("legacy", legacy), ("indexed", indexed)]:
+        times = []
+        for _ in range(repeats):
+            s_time = time.perf_counter()
+            merge()
+            times.append(time.perf_counter() - s_time)
+        results[f"{name}_ms"] = min(times) * 1000
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures fetch throughput against a local stand-in for the HRRR archive")
+    parser.add_argument("--scenario", choices=SCENARIOS + [MERGE_SCENARIO], action="append", help="Scenario to run, can be repeated. Defaults to all")
+    parser.add_argument("--points", type=int, default=60)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--prefetch", type=int, default=2)
+    parser.add_argument("--metrics-file", default=None, help="Export fetch metrics to this file (.prom or JSON lines)")
+    parser.add_argument("--backend", choices=BACKENDS, default="local", help="Read the local files as GRIB2 like subsets or from a Zarr archive")
+    parser.add_argument("--coalesce", action="store_true", help="Fetch every regex of an interval in one job with coalesced range requests")
+    parser.add_argument("--request-latency", type=float, default=0.0, help="Seconds each .idx read and range request waits")
+    parser.add_argument("--source-dir", default=os.path.join(tempfile.gettempdir(), "avy_local_hrrr"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    print(f"{'scenario':<16} {'intervals':>9} {'failed':>6} {'rows':>7} {'seconds':>8} {'intervals/min':>13} {'bytes/pt-hr':>11} {'peak RSS MB':>11} {'worker RSS MB':>13}")
+    scenarios = args.scenario if args.scenario else SCENARIOS + [MERGE_SCENARIO]
+    for scenario in scenarios:
+        if scenario == MERGE_SCENARIO:
+            continue
+        # Each scenario gets a fresh process, so peak RSS isn't carried over from the one before it
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            r = executor.submit(run_scenario, scenario, args.source_dir, args.points, args.days, args.latency, args.jitter,
+                                args.failure_rate, args.workers, args.prefetch, args.metrics_file, args.backend, args.coalesce,
+                                args.request_latency).result()
+        results.append(r)
+
+        print(f"{r['scenario']:<16} {r['intervals']:>9} {r['failed']:>6} {r['rows']:>7} {r['seconds']:>8.1f} {r['intervals_per_min']:>13.1f} "
+              f"{r['bytes_per_point_hour']:>11.0f} {r['peak_rss_mb']:>11.0f} {r['peak_worker_rss_mb']:>13.0f}")
+
+    if len(results) > 0 and args.backend == "local":
+        print(f"\n{'scenario':<16} {'requests/interval':>17} {'requests saved':>14} {'round trips saved':>17}")
+        for r in results:
+            print(f"{r['scenario']:<16} {r['requests_per_interval']:>17.1f} {r['requests_saved_per_interval']:>14.1f} {r['round_trips_saved_per_interval']:>17.1f}")
+
+    for r in results:
+        print(f"\n{r['scenario']} stages (Total seconds across all jobs)")
+        print(f"{'stage':<18} {'seconds':>9} {'count':>6} {'max':>7}")
+        for stage in r['stages']:
+            print(f"{stage['stage']:<18} {stage['seconds']:>9.2f} {stage['count']:>6} {stage['max']:>7.2f}")
+
+    if MERGE_SCENARIO in scenarios:
+        r = run_merge_benchmark(args.source_dir, args.points if args.points else 33)
+        print(f"\n{r['scenario']}: {r['rows']} rows for {r['points']} points, legacy merge {r['legacy_ms']:.1f} ms, indexed merge {r['indexed_ms']:.1f} ms")
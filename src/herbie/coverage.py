@@ -0,0 +1,167 @@
+import logging
+import os
+from datetime import datetime
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.config import SUMMER_MONTHS
+
+class CoverageIndex():
+    def __init__(self, fp: str):
+        """Bitmap of which (point_id, fxx, hour) cells have complete data, where hour is the valid time of the data.
+        The bitmap is kept up to date as data is saved, so missing data can be found without reading the data itself.
+
+        Args:
+            fp (str): File to persist the index to (.npz)
+        """
+        self.__logger = logging.getLogger(__name__)
+        self.fp = fp
+        self.reset()
+
+        if os.path.exists(self.fp):
+            self.__load()
+
+    def exists(self) -> bool:
+        """Checks if the index has been saved to `self.fp`
+
+        Returns:
+            bool: `True` if the index file exists, `False` otherwise
+        """
+        return os.path.exists(self.fp)
+
+    def reset(self) -> None:
+        """Clears the index in memory, call `save` to also clear the saved index."""
+        self.point_ids = np.array([], dtype=np.int64)
+        self.fxxs = np.array([], dtype=np.int64)
+        self.origin: Optional[np.datetime64] = None
+        self.bits = np.zeros((0, 0, 0), dtype=bool)
+
+    def mark(self, df: pd.DataFrame) -> None:
+        """Marks each row in the given DataFrame without missing values as covered.
+
+        Args:
+            df (pd.DataFrame): Data that was saved, must have 'point_id', 'fxx' and 'valid_time' columns
+        """
+        rows = df[df.notna().all(axis=1)]
+        if rows.empty:
+            return
+
+        valid = pd.to_datetime(rows['valid_time'], format='mixed').to_numpy().astype('datetime64[h]')
+        point_ids = rows['point_id'].to_numpy().astype(np.int64)
+        fxxs = rows['fxx'].to_numpy().astype(np.int64)
+
+        self.__grow(np.unique(point_ids), np.unique(fxxs), valid.min(), valid.max())
+
+        p = pd.Index(self.point_ids).get_indexer(point_ids)
+        f = pd.Index(self.fxxs).get_indexer(fxxs)
+        h = (valid - self.origin).astype(np.int64)
+        self.bits[p, f, h] = True
+
+    def rebuild(self, df: pd.DataFrame) -> None:
+        """Rebuilds the index from all of the given data.
+
+        Args:
+            df (pd.DataFrame): All saved data
+        """
+        self.reset()
+        self.mark(df)
+        self.__logger.info(f"Rebuilt coverage index from {df.shape[0]} rows")
+
+    def missing(self, start: Union[datetime, pd.Timestamp], end: Union[datetime, pd.Timestamp], time_col: str = 'time',
+                point_ids: Optional[list[int]] = None, fxx: Optional[list[int]] = None) -> pd.DataFrame:
+        """Finds the cells without data between start and end (inclusive), skipping summer months.
+
+        Args:
+            start (Union[datetime, pd.Timestamp]): First hour to check
+            end (Union[datetime, pd.Timestamp]): Last hour to check
+            time_col (str, optional): Either 'time' (Hours are model run times, so the valid time is hour + fxx)
+                or 'valid_time' (Hours are valid times). Defaults to 'time'.
+            point_ids (Optional[list[int]], optional): Points to check. Defaults to None (All indexed points).
+            fxx (Optional[list[int]], optional): fxx to check, each is checked separately. Defaults to None, which
+                only checks if any fxx covers the hour, and then the returned DataFrame doesn't have a 'fxx' column.
+
+        Returns:
+            pd.DataFrame: One row per missing cell with columns 'point_id', 'fxx' and `time_col`
+        """
+        hours = pd.date_range(start, end, freq='1h')
+        hours = hours[~hours.month.isin(SUMMER_MONTHS)]
+        hours_np = hours.to_numpy().astype('datetime64[h]')
+
+        points = np.asarray(point_ids if point_ids is not None else self.point_ids, dtype=np.int64)
+
+        if fxx is None:
+            covered = np.zeros((len(points), len(hours_np)), dtype=bool)
+            for f in self.fxxs:
+                valid = hours_np + np.timedelta64(int(f), 'h') if time_col == 'time' else hours_np
+                covered |= self.__covered(points, int(f), valid)
+            p, h = np.nonzero(~covered)
+            return pd.DataFrame({'point_id': points[p], time_col: hours[h]})
+
+        frames = []
+        for f in fxx:
+            valid = hours_np + np.timedelta64(int(f), 'h') if time_col == 'time' else hours_np
+            p, h = np.nonzero(~self.__covered(points, int(f), valid))
+            frames.append(pd.DataFrame({'point_id': points[p], 'fxx': int(f), time_col: hours[h]}))
+        return pd.concat(frames, ignore_index=True)
+
+    def missing_hours(self, start: Union[datetime, pd.Timestamp], end: Union[datetime, pd.Timestamp], time_col: str = 'time',
+                      point_ids: Optional[list[int]] = None, fxx: Optional[list[int]] = None) -> list[pd.Timestamp]:
+        """Finds the hours where any point is missing data (See `missing`).
+
+        Returns:
+            list[pd.Timestamp]: Sorted missing hours
+        """
+        missing = self.missing(start, end, time_col, point_ids, fxx)
+        return pd.DatetimeIndex(missing[time_col].unique()).sort_values().to_list()
+
+    def save(self) -> None:
+        """Saves the index to `self.fp`, replacing the file atomically."""
+        origin = self.origin.astype(np.int64) if self.origin is not None else np.int64(-1)
+        tmp_fp = f"{self.fp}.tmp"
+        with open(tmp_fp, "wb") as file:
+            np.savez_compressed(file, bits=self.bits, point_ids=self.point_ids, fxxs=self.fxxs, origin=origin)
+        os.replace(tmp_fp, self.fp)
+
+    def __load(self) -> None:
+        with np.load(self.fp) as data:
+            self.bits = data['bits']
+            self.point_ids = data['point_ids']
+            self.fxxs = data['fxxs']
+            origin = int(data['origin'])
+        self.origin = np.datetime64(origin, 'h') if origin != -1 else None
+
+    def __grow(self, point_ids: np.ndarray, fxxs: np.ndarray, min_hour: np.datetime64, max_hour: np.datetime64) -> None:
+        """Resizes the bitmap so it has rows for the given points/fxx and spans the given hours."""
+        new_points = np.setdiff1d(point_ids, self.point_ids)
+        new_fxxs = np.setdiff1d(fxxs, self.fxxs)
+
+        if self.origin is None:
+            # Start on a day boundary so the index lines up with the data's days
+            self.origin = min_hour.astype('datetime64[D]').astype('datetime64[h]')
+
+        n_before = max(int((self.origin - min_hour).astype(np.int64)), 0)
+        n_after = max(int((max_hour - self.origin).astype(np.int64)) + 1 - self.bits.shape[2], 0)
+
+        if len(new_points) or len(new_fxxs) or n_before or n_after:
+            self.bits = np.pad(self.bits, ((0, len(new_points)), (0, len(new_fxxs)), (n_before, n_after)))
+            self.point_ids = np.concatenate([self.point_ids, new_points])
+            self.fxxs = np.concatenate([self.fxxs, new_fxxs])
+            self.origin = self.origin - np.timedelta64(n_before, 'h')
+
+    def __covered(self, points: np.ndarray, fxx: int, valid: np.ndarray) -> np.ndarray:
+        """Looks up the bits for the given points and valid hours at one fxx, cells outside the index are not covered."""
+        covered = np.zeros((len(points), len(valid)), dtype=bool)
+
+        f = pd.Index(self.fxxs).get_indexer([fxx])[0]
+        if self.origin is None or f == -1:
+            return covered
+
+        p = pd.Index(self.point_ids).get_indexer(points)
+        h = (valid - self.origin).astype(np.int64)
+        p_ok = p >= 0
+        h_ok = (h >= 0) & (h < self.bits.shape[2])
+
+        covered[np.ix_(p_ok, h_ok)] = self.bits[p[p_ok], f][:, h[h_ok]]
+        return covered
@@ -0,0 +1,201 @@
+import logging
+import os
+import warnings
+from datetime import datetime
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.config import CUBE_BOUNDS, EXP_COLS, HRRR_CUBE_DIR, POINT_INTERPOLATION
+from src.herbie.weights import WeightCache
+from src.util.schema import HRRR_VARS
+
+# Columns of the frames written to the cube besides the variables, see `CubeStore.write`
+CUBE_COLS = ['time', 'valid_time', 'step', 'y', 'x', 'latitude', 'longitude']
+
+class CubeStore():
+    def __init__(self, root: str = HRRR_CUBE_DIR, bounds: tuple[float, float, float, float] = CUBE_BOUNDS,
+                 variables: list[str] = HRRR_VARS, chunks: tuple[int, int, int] = (168, 8, 8)):
+        """Local Zarr cube of every HRRR field cropped to a region, so points inside the region can be extracted
+        without fetching anything. The cube is a single (time, y, x, variable) float32 array compressed with zstd,
+        where each step of the time axis is one (run time, fxx) of the model, in the order they were written. The
+        run time and fxx of each step and the lat/lon of each cell are stored next to it.
+
+        Chunks hold every variable of a small block of cells for a week of hours, so extracting a few points over a
+        season only decompresses the blocks around them.
+
+        Args:
+            root (str, optional): Directory of the cube. Defaults to HRRR_CUBE_DIR.
+            bounds (tuple[float, float, float, float], optional): (min lat, min lon, max lat, max lon) of the region.
+                Defaults to CUBE_BOUNDS.
+            variables (list[str], optional): Variables stored, in the order of the variable axis. Defaults to HRRR_VARS.
+            chunks (tuple[int, int, int], optional): (time, y, x) size of each chunk. Defaults to (168, 8, 8).
+        """
+        # Imported here so fetchers that don't ingest into a cube don't need zarr
+        import zarr
+
+        self.__logger = logging.getLogger(__name__)
+        self.root = os.path.expanduser(root)
+        self.chunks = chunks
+        self.__group = zarr.open_group(self.root, mode='a')
+
+        # An existing cube keeps the region and variables it was created with
+        self.bounds = tuple(self.__group.attrs.get('bounds', bounds))
+        self.variables = list(self.__group.attrs.get('variables', variables))
+        if self.bounds != tuple(bounds) or self.variables != list(variables):
+            warnings.warn(f"{self.root} was created with bounds {self.bounds} and variables {self.variables}, using them instead")
+
+        # Position of each (run time, fxx) on the time axis
+        self.__index: dict[tuple[int, int], int] = {}
+        if 'time' in self.__group:
+            for i, key in enumerate(zip(self.__group['time'][:].tolist(), self.__group['fxx'][:].tolist())):
+                self.__index[key] = i
+
+    def is_empty(self) -> bool:
+        """Checks if anything has been written to the cube.
+
+        Returns:
+            bool: `True` if the cube has no data, `False` otherwise
+        """
+        return len(self.__index) == 0
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """Number of (y, x) cells in the region, (0, 0) before the first write"""
+        return self.__group['latitude'].shape if 'latitude' in self.__group else (0, 0)
+
+    def write(self, df: pd.DataFrame) -> int:
+        """Writes fields cropped to the region (See `FetchJob.bounds`) into the cube, replacing any steps that
+        were already written. The grid of the region is taken from the first write.
+
+        Args:
+            df (pd.DataFrame): One row per cell of the region for each run and step, with the `CUBE_COLS` and
+                every variable of the cube
+
+        Raises:
+            ValueError: If the rows don't cover every cell of the region for each run and step
+
+        Returns:
+            int: Number of steps written
+        """
+        if df.empty:
+            return 0
+
+        n_y, n_x = int(df['y'].max()) + 1, int(df['x'].max()) + 1
+        df = df.assign(fxx=(df['step'] // pd.Timedelta(hours=1)).astype(int)).sort_values(['time', 'fxx', 'y', 'x'])
+        steps = df[['time', 'fxx']].drop_duplicates()
+        if df.shape[0] != steps.shape[0] * n_y * n_x:
+            raise ValueError(f"Expected {n_y}x{n_x} cells for each of the {steps.shape[0]} steps, got {df.shape[0]} rows")
+
+        if 'data' not in self.__group:
+            self.__create(df, n_y, n_x)
+        elif self.shape != (n_y, n_x):
+            raise ValueError(f"Cells are {n_y}x{n_x}, the region of {self.root} is {self.shape[0]}x{self.shape[1]}")
+
+        keys = list(zip(steps['time'].to_numpy().astype("datetime64[ns]").view(np.int64).tolist(), steps['fxx'].tolist()))
+        new = [k for k in keys if k not in self.__index]
+        if len(new) > 0:
+            n_steps = len(self.__index)
+            self.__group['data'].resize(n_steps + len(new), n_y, n_x, len(self.variables))
+            self.__group['time'].append(np.array([k[0] for k in new], dtype=np.int64))
+            self.__group['fxx'].append(np.array([k[1] for k in new], dtype=np.int16))
+            for i, key in enumerate(new):
+                self.__index[key] = n_steps + i
+
+        values = np.stack([df[v].to_numpy(dtype=np.float32) for v in self.variables], axis=-1)
+        positions = np.array([self.__index[k] for k in keys])
+        self.__group['data'].set_orthogonal_selection((positions, slice(None), slice(None), slice(None)),
+                                                      values.reshape(len(keys), n_y, n_x, len(self.variables)))
+
+        self.__logger.debug(f"Wrote {len(keys)} steps ({len(new)} new) to {self.root}")
+        return len(keys)
+
+    def extract(self, coords: pd.DataFrame, start: Optional[Union[datetime, pd.Timestamp]] = None,
+                end: Optional[Union[datetime, pd.Timestamp]] = None, fxx: Optional[list[int]] = None,
+                time_col: str = 'time', interpolation: str = POINT_INTERPOLATION) -> pd.DataFrame:
+        """Gets the values of each coord, like a fetch of the same coords would. Coords outside the bounds of
+        the cube are left out.
+
+        Args:
+            coords (pd.DataFrame): Points with 'id', 'latitude' and 'longitude' columns
+            start (Optional[Union[datetime, pd.Timestamp]], optional): First time to get (Inclusive). Defaults to None.
+            end (Optional[Union[datetime, pd.Timestamp]], optional): Last time to get (Inclusive). Defaults to None.
+            fxx (Optional[list[int]], optional): Forecast hours to get. Defaults to None (All).
+            time_col (str, optional): Column `start` and `end` filter on, 'time' or 'valid_time'. Defaults to 'time'.
+            interpolation (str, optional): How point values are taken from the grid, see `compute_weights`.
+                Defaults to POINT_INTERPOLATION.
+
+        Returns:
+            pd.DataFrame: One row per step and point with the `EXP_COLS`, sorted by time, fxx and point_id
+        """
+        if self.is_empty():
+            return pd.DataFrame(columns=EXP_COLS)
+
+        min_lat, min_lon, max_lat, max_lon = self.bounds
+        lats = coords['latitude'].to_numpy(dtype=np.float64)
+        lons = coords['longitude'].to_numpy(dtype=np.float64)
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        if not inside.all():
+            warnings.warn(f"Points {coords['id'][~inside].to_list()} are outside of {self.bounds}, not extracting them")
+        point_ids = coords['id'].to_numpy()[inside].astype(int)
+        if len(point_ids) == 0:
+            return pd.DataFrame(columns=EXP_COLS)
+        weights = WeightCache().get(self.__group['latitude'][:], self.__group['longitude'][:], coords[inside], interpolation)
+
+        times = self.__group['time'][:].astype("datetime64[ns]")
+        fxxs = self.__group['fxx'][:].astype(int)
+        filter_times = times + fxxs * np.timedelta64(1, 'h') if time_col == 'valid_time' else times
+
+        keep = np.ones(len(times), dtype=bool)
+        if start is not None:
+            keep &= filter_times >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            keep &= filter_times <= np.datetime64(pd.Timestamp(end))
+        if fxx is not None:
+            keep &= np.isin(fxxs, fxx)
+
+        positions = np.nonzero(keep)[0]
+        positions = positions[np.lexsort((fxxs[positions], times[positions]))]
+        if len(positions) == 0:
+            return pd.DataFrame(columns=EXP_COLS)
+
+        # (step, cell, variable) values of the cells the points are taken from, only the chunks holding them are read
+        cells = np.unique(weights.matrix.indices)
+        y_idx, x_idx = np.unravel_index(cells, self.shape)
+        v_idx = np.arange(len(self.variables))
+        cell_values = self.__group['data'].get_coordinate_selection(
+            (positions[:, None, None], y_idx[None, :, None], x_idx[None, :, None], v_idx[None, None, :]))
+        # (point, cell) @ (cell, step * variable)
+        values = (weights.matrix[:, cells] @ cell_values.transpose(1, 0, 2).reshape(len(cells), -1))
+        values = np.asarray(values).reshape(len(point_ids), len(positions), len(self.variables)).transpose(1, 0, 2)
+
+        n_points = len(point_ids)
+        df = pd.DataFrame({
+            'time': np.repeat(times[positions], n_points),
+            'valid_time': np.repeat(times[positions] + fxxs[positions] * np.timedelta64(1, 'h'), n_points),
+            'fxx': np.repeat(fxxs[positions], n_points),
+            'point_id': np.tile(point_ids, len(positions)),
+        })
+        for i, v in enumerate(self.variables):
+            df[v] = values[:, :, i].reshape(-1)
+        return df[[c for c in EXP_COLS if c in df.columns]]
+
+    def __create(self, df: pd.DataFrame, n_y: int, n_x: int) -> None:
+        """Creates the arrays of the cube, with the grid of the given cells"""
+        from numcodecs import Blosc
+
+        cells = df.drop_duplicates(['y', 'x'])
+        compressor = Blosc(cname='zstd', clevel=5, shuffle=Blosc.BITSHUFFLE)
+        chunks = (self.chunks[0], min(self.chunks[1], n_y), min(self.chunks[2], n_x), len(self.variables))
+
+        self.__group.full('data', np.nan, shape=(0, n_y, n_x, len(self.variables)), chunks=chunks, dtype=np.float32,
+                          compressor=compressor)
+        self.__group.zeros('time', shape=(0,), chunks=(4096,), dtype=np.int64)
+        self.__group.zeros('fxx', shape=(0,), chunks=(4096,), dtype=np.int16)
+        self.__group.array('latitude', cells['latitude'].to_numpy(dtype=np.float64).reshape(n_y, n_x))
+        self.__group.array('longitude', ((cells['longitude'].to_numpy(dtype=np.float64) + 180) % 360 - 180).reshape(n_y, n_x))
+
+        self.__group.attrs['bounds'] = list(self.bounds)
+        self.__group.attrs['variables'] = self.variables
+        self.__logger.info(f"Created {n_y}x{n_x} cell cube at {self.root}")
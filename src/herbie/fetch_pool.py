@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Union
+
+import pandas as pd
+
+from src.herbie.grib_cache import GribCache
+from src.herbie.metrics import StageTimes
+from src.herbie.shared_frame import SharedFrame
+from src.herbie.sources import DataSource, HerbieSource
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class FetchJob():
+    """A single fetch done by a worker, data for `search_regex` at each date and fxx is pulled for each coord
+    from `source` (Defaults to the HRRR archive through Herbie). Jobs for several regexes at once set `consumers`
+    to the regexes and `search_regex` to a regex matching any of them."""
+    dates: list[datetime]
+    fxx: Union[int, list[int]]
+    search_regex: str
+    coords: pd.DataFrame
+    verbose: bool = False
+    cache: Optional[GribCache] = None
+    source: Optional[DataSource] = None
+    consumers: Optional[list[str]] = None
+    bounds: Optional[tuple[float, float, float, float]] = None
+
+    @property
+    def key(self) -> str:
+        """Identifies the data the job fetches, jobs for the same regex, dates, fxx and coords (Or bounds) have the same key."""
+        fxx = self.fxx if isinstance(self.fxx, list) else [self.fxx]
+        if self.bounds is not None:
+            coords = [float(b) for b in self.bounds]
+        else:
+            coords = int(pd.util.hash_pandas_object(self.coords[['latitude', 'longitude']], index=False).sum())
+        ident = json.dumps([self.search_regex, [int(f) for f in fxx], [pd.Timestamp(d).isoformat() for d in self.dates], coords])
+        return hashlib.sha256(ident.encode()).hexdigest()
+
+def run_job(job: FetchJob, stages: Optional[StageTimes] = None) -> Optional[pd.DataFrame]:
+    """Retrieves the data specified in the jobs search regex for the jobs dates, fxx, and coords.
+
+    Args:
+        job (FetchJob): Job to run
+        stages (Optional[StageTimes], optional): Records how long each stage of the job takes. Defaults to None.
+
+    Returns:
+        Optional[pd.DataFrame]: Data for each coord, or `None` if no data was found
+    """
+    if job.verbose:
+        logger.info(f"fetching data for {min(job.dates)}-{max(job.dates)}, regex: {job.search_regex}")
+
+    s_time = datetime.now()
+
+    source = job.source if job.source is not None else HerbieSource()
+    df = source.fetch(job, stages)
+    if df is None:
+        return None
+
+    if stages is not None:
+        stages.count("rows", df.shape[0])
+
+    if job.verbose:
+        logger.info(f"Finished fetching data in {datetime.now() - s_time}, regex: {job.search_regex}")
+
+    return df
+
+def run_shared_job(job: FetchJob) -> Optional[SharedFrame]:
+    """Runs the given job in a worker process and places the data in shared memory, so only a small handle
+    is sent back to the parent process instead of the pickled DataFrame.
+
+    Args:
+        job (FetchJob): Job to run
+
+    Returns:
+        Optional[SharedFrame]: Handle to the jobs data and its stage times, or `None` if no data was found
+    """
+    stages = StageTimes()
+    df = run_job(job, stages)
+    if df is None:
+        return None
+
+    with stages.time("transfer"):
+        shared = SharedFrame.from_frame(df)
+    shared.stats = stages
+    return shared
+
+def release_result(future: Future) -> None:
+    """Frees the shared memory of a finished job whose data won't be used.
+
+    Args:
+        future (Future): Future returned by `FetchPool.submit`
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    result = future.result()
+    if result is not None:
+        result.release()
+
+def is_lost(future: Future) -> bool:
+    """Checks if a future was lost to `FetchPool.recycle` rather than finished by its job.
+
+    Args:
+        future (Future): Future returned by `FetchPool.submit`
+
+    Returns:
+        bool: `True` if the future is still running, was cancelled or its worker was killed, `False` otherwise
+    """
+    return not future.done() or future.cancelled() or isinstance(future.exception(), BrokenProcessPool)
+
+def _init_worker(source: Optional[DataSource]) -> None:
+    """Warms up the pools source when a worker starts (See `DataSource.warm_up`), so the first job doesn't pay for it."""
+    (source if source is not None else HerbieSource()).warm_up()
+
+class FetchPool():
+    def __init__(self, max_workers: Optional[int] = None, source: Optional[DataSource] = None):
+        """Long lived pool of worker processes that run `FetchJob`s. Workers stay alive between jobs,
+        so process startup and imports are only paid once per pool instead of once per fetch.
+
+        Args:
+            max_workers (Optional[int], optional): Max number of worker processes. Defaults to None (Number of cores).
+            source (Optional[DataSource], optional): Source the pools jobs read from, warmed up by each worker as it
+                starts. Defaults to None (The HRRR archive through Herbie).
+        """
+        self.__logger = logging.getLogger(__name__)
+        self.max_workers = max_workers if max_workers else os.cpu_count()
+        self.source = source
+        self.__executor = self.__start()
+        self.__logger.debug(f"Started fetch pool with {self.max_workers} workers")
+
+    def submit(self, job: FetchJob) -> Future:
+        """Submits a job to the pool.
+
+        Args:
+            job (FetchJob): Job to run
+
+        Returns:
+            Future: Future that resolves to a `SharedFrame` with the jobs data (See `run_shared_job`)
+        """
+        return self.__executor.submit(run_shared_job, job)
+
+    def recycle(self) -> None:
+        """Kills the worker processes and starts new ones. A job that is already running can't be cancelled, so this
+        is the only way to get back a worker that is stuck on a job. Every job that was queued or running on the old
+        workers is lost, its future is cancelled or fails with `BrokenProcessPool` (See `is_lost`)."""
+        old = self.__executor
+        self.__executor = self.__start()
+
+        # ProcessPoolExecutor has no way to stop its workers before 3.14, so they're killed directly
+        processes = list((getattr(old, "_processes", None) or {}).values())
+        old.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
+        self.__logger.warning(f"Recycled fetch pool, killed {len(processes)} workers")
+
+    def shutdown(self) -> None:
+        """Stops the worker processes, any queued jobs are cancelled."""
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+
+    def __start(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=(self.source,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+
+import pandas as pd
+
+from src.config import GRIB_CACHE_DIR, GRIB_CACHE_MAX_BYTES
+
+class GribCache():
+    def __init__(self, root: str = GRIB_CACHE_DIR, max_bytes: int = GRIB_CACHE_MAX_BYTES):
+        """Disk cache for downloaded GRIB subsets. Entries are keyed by the model run, fxx and the byte ranges of the
+        messages in the subset, so the same messages are never downloaded twice no matter which fetch asks for them.
+        Each entry has a metadata file with its size and sha256 that is checked before the entry is used, and the least
+        recently used entries are removed once the cache is over `max_bytes`.
+
+        Entries are plain files, so the cache can be shared by worker processes without any locking.
+
+        Args:
+            root (str, optional): Cache directory. Defaults to GRIB_CACHE_DIR.
+            max_bytes (int, optional): Size quota. Defaults to GRIB_CACHE_MAX_BYTES.
+        """
+        self.root = os.path.expanduser(root)
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.staging_dir = os.path.join(self.root, "staging")
+
+    @staticmethod
+    def key(run: datetime, fxx: int, ranges: list[tuple[int, int]], model: str = "hrrr", product: str = "sfc") -> str:
+        """Gets the cache key of a GRIB subset.
+
+        Args:
+            run (datetime): Model run time
+            fxx (int): Forecast hour
+            ranges (list[tuple[int, int]]): (start, end) byte ranges of the messages in the subset
+            model (str, optional): Model name. Defaults to "hrrr".
+            product (str, optional): Model product. Defaults to "sfc".
+
+        Returns:
+            str: Key
+        """
+        ident = json.dumps([model, product, pd.Timestamp(run).isoformat(), int(fxx), [[int(s), int(e)] for s, e in ranges]])
+        return hashlib.sha256(ident.encode()).hexdigest()
+
+    def get(self, key: str, dest: str) -> bool:
+        """Places the cached subset for the given key at `dest`.
+
+        Args:
+            key (str): Entry key
+            dest (str): File path to place the subset at
+
+        Returns:
+            bool: `True` if the entry was found and passed its integrity check, `False` otherwise
+        """
+        fp, meta_fp = self.__paths(key)
+        if not os.path.exists(meta_fp) or not os.path.exists(fp):
+            return False
+
+        with open(meta_fp, "r") as file:
+            meta = json.load(file)
+
+        if os.path.getsize(fp) != meta['size'] or self.__sha256(fp) != meta['sha256']:
+            logging.getLogger(__name__).warning(f"Cache entry {key} failed its integrity check, removing it")
+            self.__remove(key)
+            return False
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.link(fp, dest)
+        except OSError:
+            shutil.copyfile(fp, dest)
+
+        # The entries mtime is its last access time for LRU eviction
+        os.utime(fp)
+        return True
+
+    def put(self, key: str, src: str) -> None:
+        """Adds the subset at `src` to the cache.
+
+        Args:
+            key (str): Entry key
+            src (str): File path of the downloaded subset
+        """
+        fp, meta_fp = self.__paths(key)
+        if os.path.exists(meta_fp):
+            return
+
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+
+        # Write to temp files first so other processes never see a partial entry
+        tmp_fp = f"{fp}.{os.getpid()}.tmp"
+        shutil.copyfile(src, tmp_fp)
+        meta = {"size": os.path.getsize(tmp_fp), "sha256": self.__sha256(tmp_fp), "created": datetime.now().isoformat()}
+        os.replace(tmp_fp, fp)
+
+        with open(f"{meta_fp}.{os.getpid()}.tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(f"{meta_fp}.{os.getpid()}.tmp", meta_fp)
+
+    def evict(self) -> int:
+        """Removes least recently used entries until the cache is under its quota.
+
+        Returns:
+            int: Number of entries removed
+        """
+        if not os.path.exists(self.objects_dir):
+            return 0
+
+        entries = []
+        for prefix in os.listdir(self.objects_dir):
+            for fn in os.listdir(os.path.join(self.objects_dir, prefix)):
+                if not fn.endswith(".grib2"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.objects_dir, prefix, fn))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, fn[:-len(".grib2")]))
+
+        total = sum(size for _, size, _ in entries)
+        n_removed = 0
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.__remove(key)
+            total -= size
+            n_removed += 1
+
+        if n_removed > 0:
+            logging.getLogger(__name__).info(f"Evicted {n_removed} entries from GRIB cache, {total / 1024**3:.2f} GB remaining")
+        return n_removed
+
+    def staging_path(self, name: str) -> str:
+        """Gets a directory for a job to download into before its files are added to the cache.
+
+        Args:
+            name (str): Unique name of the job
+
+        Returns:
+            str: Staging directory
+        """
+        return os.path.join(self.staging_dir, name)
+
+    def restore(self, herbies: list, search: str) -> dict[str, str]:
+        """Places cached subsets for each of the given Herbie objects where Herbie will look for them,
+        so Herbie only downloads the subsets that aren't cached.
+
+        Args:
+            herbies (list): Herbie objects (`FastHerbie.objects`)
+            search (str): Search regex used for the subsets
+
+        Returns:
+            dict[str, str]: Keys of the subsets that weren't cached, mapped to where Herbie will download them
+        """
+        to_store = {}
+        for H in herbies:
+            try:
+                inventory = H.inventory(search)
+            except Exception:
+                # No index file, let Herbie handle it
+                continue
+
+            ranges = list(zip(inventory['start_byte'].fillna(-1), inventory['end_byte'].fillna(-1)))
+            key = self.key(H.date, H.fxx, ranges, H.model, H.product)
+            local_fp = str(H.get_localFilePath(search))
+
+            if not self.get(key, local_fp):
+                to_store[key] = local_fp
+        return to_store
+
+    def store(self, downloaded: dict[str, str]) -> None:
+        """Adds the subsets Herbie downloaded to the cache (See `restore`).
+
+        Args:
+            downloaded (dict[str, str]): Keys mapped to downloaded files
+        """
+        for key, fp in downloaded.items():
+            if os.path.exists(fp):
+                self.put(key, fp)
+
+    def __paths(self, key: str) -> tuple[str, str]:
+        fp = os.path.join(self.objects_dir, key[:2], f"{key}.grib2")
+        return fp, f"{fp}.json"
+
+    def __remove(self, key: str) -> None:
+        for fp in self.__paths(key):
+            try:
+                os.remove(fp)
+            except FileNotFoundError:
+                pass
+
+    def __sha256(self, fp: str) -> str:
+        sha = hashlib.sha256()
+        with open(fp, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
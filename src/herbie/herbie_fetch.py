@@ -1,24 +1,40 @@
+import json
 import logging
 import os
-import shutil
+import queue
 import sys
+import threading
+import time
 import warnings
+from collections import deque
 from datetime import datetime, timedelta
-from multiprocessing import Process, Queue
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from tkinter import messagebox
-from typing import Optional, Union
+from typing import Literal, Optional, Union
 
 import geopandas as gpd
 import pandas as pd
 
-import herbie
-from herbie.fast import FastHerbie
-from src.config import COORDS_FP, EXP_COLS, REQ_COLS
-from src.util.df import remove_outliers, validate_df
+from src.config import COORDS_FP, EXP_COLS, SUMMER_MONTHS
+from src.herbie.coverage import CoverageIndex
+from src.herbie.cube import CUBE_COLS, CubeStore
+from src.herbie.fetch_pool import FetchJob, FetchPool, is_lost, release_result, run_job
+from src.herbie.grib_cache import GribCache
+from src.herbie.merge import REGION_KEY, merge_frames
+from src.herbie.metrics import Metrics
+from src.herbie.planner import CostModel, plan_forecast_batches, plan_horizon_batches, plan_season_batches
+from src.herbie.retry import JobState, LatencyTracker, PieceStore, RetryPolicy
+from src.herbie.sources import DataSource
+from src.herbie.weather_store import WeatherStore, season_of
+from src.util.df import fill_gaps, remove_outliers, validate_df
 
 
 class HerbieFetcher():
-    def __init__(self, output_file_dir, output_file_name, error_file_path, date_file_path, verbose = False, show_times = False, remove_output_file=False):
+    def __init__(self, output_file_dir, output_file_name, error_file_path, date_file_path, verbose = False, show_times = False, remove_output_file=False, 
+                 max_workers: Optional[int] = None, job_timeout: int = 75, pool: Optional[FetchPool] = None, cost_model: Optional[CostModel] = None, 
+                 cache: Optional[GribCache] = None, prefetch: int = 2, 
+                 retry_policy: Optional[RetryPolicy] = None, source: Optional[DataSource] = None, metrics: Optional[Metrics] = None,
+                 metrics_file: Optional[str] = None, coalesce_regexes: bool = False, cube: Optional[CubeStore] = None):
         self.__logger = logging.getLogger(__name__)
         
         if not os.path.exists(output_file_dir):
@@ -32,114 +48,129 @@ class HerbieFetcher():
         self.date_file_path = date_file_path
         self.verbose = verbose
         self.show_times = show_times
+        self.max_workers = max_workers
+        self.job_timeout = job_timeout
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        # Where jobs get data from, `None` is the HRRR archive
+        self.source = source
+        # Stage timings and counts of every fetch, exported to metrics_file (.prom or JSON lines) after each `fetch_data`
+        self.metrics = metrics if metrics else Metrics()
+        self.metrics_file = metrics_file
+        if metrics_file and not metrics_file.endswith(".prom"):
+            # Every observation is written to JSON lines, Prometheus files only need the totals
+            self.metrics.keep_events = True
+        # Fetch every regex of an interval in one job, so each file's .idx is read once and the byte ranges of all
+        # regexes are requested together (See `plan_requests`). Only for sources that support it, for the others
+        # it would only take away the parallelism of separate jobs
+        self.coalesce_regexes = coalesce_regexes and (source is None or source.coalesces_regexes)
+        if coalesce_regexes and not self.coalesce_regexes:
+            warnings.warn(f"{type(source).__name__} fetches each regex on its own, not coalescing regexes")
+        # Ingestion mode, `fetch_data` crops each field to the cubes region and writes it to the cube instead of
+        # picking the coords into the store. Points are then taken from the cube with `extract_from_cube`
+        self.cube = cube
+        # Timeouts start at job_timeout and then follow how long jobs actually take
+        self.latency = LatencyTracker(initial_timeout=job_timeout)
+        self.cost_model = cost_model if cost_model else CostModel()
+        self.cache = cache if cache else GribCache()
+        # Number of intervals downloading at once, and number of fetched intervals waiting to be saved
+        self.prefetch = max(prefetch, 1)
+        self.__error_lock = threading.Lock()
+        # A pool given by the caller is shared between fetchers and isn't shut down by `close`
+        self.__pool = pool
+        self.__owns_pool = pool is None
+        
+        # Data is stored in a partitioned store named after the output file
+        self.store = WeatherStore(os.path.join(self.output_file_dir, os.path.splitext(self.output_file_name)[0]))
+        # Data of jobs that succeeded in intervals that failed, reused when the interval is refetched
+        self.pieces = PieceStore(os.path.join(self.store.root, "_pieces"))
         
         if remove_output_file:
             resp = messagebox.askyesno("Delete output file", f"Are you sure you want to delete {self.output_file_path}?")
             if not resp:
                 sys.exit()
             self.__remove_output_file()
+        
+        # Move data from csv files written by older versions into the store
+        if os.path.exists(self.output_file_path) and self.store.is_empty():
+            self.store.import_csv(self.output_file_path)
+        
+        # Stores written before rows were saved with their real fxx are fixed once, which changes what they cover
+        migrated = self.store.migrate() > 0
+        
+        # Tracks which point/fxx/hours are saved, built from the store the first time it's used
+        self.coverage = CoverageIndex(os.path.join(self.store.root, "_coverage.npz"))
+        if (migrated or not self.coverage.exists()) and not self.store.is_empty():
+            self.coverage.rebuild(self.store.read())
+            self.coverage.save()
 
-    def get_data(self,dates:list[datetime], fxx: Union[int, list[int]], search_regex: str, coords: pd.DataFrame, queue: Queue) -> None:
-        """Retrieves the data specified in the given search regex for the given dates, fxx, and coords. Adds the retrieved data to the given queue\n
-        ### Note
-        This function should mainly be used in multiprocessing, as it adds the data to a queue after it's retrieved. 
+    def get_data(self,dates:list[datetime], fxx: Union[int, list[int]], search_regex: str, coords: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """Retrieves the data specified in the given search regex for the given dates, fxx, and coords in the current process.
+        `fetch_data` runs the same fetch on `self.pool` instead.
 
         Args:
             dates (list[datetime]): Dates to get data for.
             fxx (Union[int, list[int]]): fxx to get data for.
             search_regex (str): Search regex for Herbie
             coords (pd.DataFrame): Coords to get data for
-            queue (Queue): Queue to add data to
+
+        Returns:
+            Optional[pd.DataFrame]: Data for each coord, or `None` if no data was found
         """
-        if self.verbose:
-            self.__logger.info(f"fetching data for {min(dates)}-{max(dates)}, regex: {search_regex}")
-            
-        s_time = datetime.now()
-        
-        fh = FastHerbie(DATES=dates, fxx=fxx, max_processes=10, product='sfc') # type: ignore
-        data_set = fh.xarray(search=search_regex)
+        return run_job(FetchJob(dates, fxx, search_regex, coords, verbose=self.verbose or self.show_times, cache=self.cache, source=self.source))
         
-        if "WIND" in search_regex:
-            data_set = data_set.herbie.with_wind()
-        
-        if data_set:
-            point_ds = data_set.herbie.pick_points(coords)
-            
-            # xarray datasets can't be pickled, so convert to dataframe
-            queue.put(point_ds.to_dataframe())
-            
-            if self.verbose or self.show_times:
-                self.__logger.info(f"Finished fetching data in {datetime.now() - s_time}, regex: {search_regex}")
-        else:
-            warnings.warn(f"No data found for {dates}, regex: {search_regex}")
-        
-    def mutate_save_data(self, data_frames: list[pd.DataFrame]) -> bool:
-        """Combines the data frames in the given list together, selects the needed columns defined in `exp_cols`, and saves the data to the `output_file_path`\n
-        If the data frame has more than 23 columns, the data frames will be combined horizontally (stacked on top of each other) since
-        regexs that are searching for a large amount of data have their data split into 2 fetches of `get_data` to improve the fetch speed.
+    def mutate_save_data(self, data_frames: list[pd.DataFrame], interval: str = "") -> bool:
+        """Combines the data frames in the given list together (See `merge_frames`), selects the needed columns defined in `EXP_COLS`, 
+        and upserts the data into `self.store`. Nothing is saved if any of `EXP_COLS` are missing or have missing values.
 
         Args:
             data_frames (list[pd.DataFrame]): List of data frames to save
+            interval (str, optional): Interval the data is from, used to label metrics. Defaults to "".
 
         Returns:
             bool: `True` if the data was successfully saved, `False` otherwise
         """
         s_time = datetime.now()
+        merge_start = time.perf_counter()
+        labels = {"interval": interval} if interval else {}
         
         if len(data_frames) == 0:
             warnings.warn("data_frames can't be empty!")
             return False
-            
-        merged = pd.DataFrame()
-        other_dfs = []
         
-        # This combines datasets that are from long regexs split in 2 
-        for i in range(len(data_frames)):
-            if data_frames[i].shape[1] >= 20: # Dfs from regexes have more columns
-                merged = pd.concat([merged, data_frames[i].reset_index()])
-            else:
-                other_dfs.append(data_frames[i])
-                
-        # Combine all dfs together
-        for i in range(len(other_dfs)):
-            suffixes = (f"_{i}",f"_{i}{i}") # Unique suffixes to prevent errors on combining multiple dfs
-            data_set = other_dfs[i]
-
-            merged = pd.merge(merged, data_set,how="outer",on=["valid_time","time","step","point_id"], suffixes=suffixes)
-        
-        merged.drop_duplicates(inplace=True)
-        
-        merged["fxx"] = 1#(merged["step"].dt.components["hours"] == 1).astype(int) # type: ignore
-        
-        keep_cols = [c for c in merged.columns if c in EXP_COLS]
-        filtered_df = merged[keep_cols]
+        if self.cube is not None:
+            merged, missing_cols = merge_frames(data_frames, CUBE_COLS + self.cube.variables, REGION_KEY)
+            if len(missing_cols) > 0:
+                warnings.warn(f"Missing {','.join(missing_cols)}")
+                return False
+            self.metrics.observe("merge", time.perf_counter() - merge_start, **labels)
+            
+            with self.metrics.timer("save", **labels):
+                n_steps = self.cube.write(merged)
+            self.metrics.count("steps_saved", n_steps, **labels)
+            return True
         
-        df_cols = filtered_df.columns.to_list()
-        missing_cols = []
-        for c in EXP_COLS:
-            if c not in df_cols or filtered_df[c].isna().any():
-                missing_cols.append(c)
+        # fxx is taken from each row's step below, every other column has to come from the regexes
+        merged, missing_cols = merge_frames(data_frames, [c for c in EXP_COLS if c != 'fxx'])
         if len(missing_cols) > 0:
             warnings.warn(f"Missing {','.join(missing_cols)}")
             return False
-
-        filtered_df = filtered_df[EXP_COLS] # Reorder exp_cols
         
-        if os.path.exists(self.output_file_path) and os.path.getsize(self.output_file_path) > 0:
-            filtered_df.to_csv(self.output_file_path,index=False,header=False,mode='a')
-        else: # Add header if file is empty
-            filtered_df.to_csv(self.output_file_path,index=False,header=True,mode='a')
+        # Rows are keyed by (time, fxx), so every horizon of a run is kept
+        merged["fxx"] = (merged["step"] // pd.Timedelta(hours=1)).astype(int)
+        
+        filtered_df = merged[EXP_COLS] # Reorder exp_cols
+        self.metrics.observe("merge", time.perf_counter() - merge_start, **labels)
+        
+        with self.metrics.timer("save", **labels):
+            self.__save(filtered_df)
+        self.metrics.count("rows_saved", filtered_df.shape[0], **labels)
             
         if self.verbose or self.show_times:
             self.__logger.info(f"Finished saving data in {datetime.now()-s_time}")
         return True
         
     def fetch_data(self, regs: list[str], fxx:list[int], coords: gpd.GeoDataFrame, start_date: Optional[datetime] = None, 
-                   n_days: Optional[int] = None, intervals: Optional[list[tuple[datetime, datetime]]] = [], 
-                   remove_herbie_dir = False) -> None:
-        if remove_herbie_dir:
-            self.__remove_herbie_dir()
-        
+                   n_days: Optional[int] = None, intervals: Optional[list[tuple[datetime, datetime]]] = []) -> None:
         runtime = datetime.now()
 
         if start_date and n_days:
@@ -170,86 +201,56 @@ class HerbieFetcher():
         if not intervals:
             raise ValueError("No intervals given")
                 
-        # Get data in intervals
-        for start, end in intervals:
-            s_time = datetime.now()
-
-            DATES = pd.date_range(start=start, end=end, freq='1h')
-            
-            data = []
-            
-            # Utilize multiprocessing, doubles the speed
-            try:
-                queue = Queue()
-                    
-                processes = []
-                for r in regs:
-                    # Split up regexs that are big 
-                    if len(r) > 20 and len(DATES) > 1:
-                        p = Process(target=self.get_data, kwargs={"dates": DATES[:len(DATES)//2], "fxx":fxx, "search_regex":r, "coords":coords, "queue":queue})
-                        processes.append(p)
-                        p = Process(target=self.get_data, kwargs={"dates": DATES[len(DATES)//2:], "fxx":fxx, "search_regex":r, "coords":coords, "queue":queue})
-                        processes.append(p)
-                    else:
-                        p = Process(target=self.get_data, kwargs={"dates": DATES, "fxx":fxx, "search_regex":r, "coords":coords, "queue":queue})
-                        processes.append(p)
-                    
-                fetch_start_time = datetime.now()
-                for p in processes:
-                    p.start()
-                    
-                # Get data and put it into a list so it can be saved.
-                # With larger data sets, the processes often get stuck 
-                # I think it's caused by the queue's background thread blocking indefinitely
-                # My work around is as soon as all the data is received, the queue is closed and the background thread(s) is joined 
-                while len(data) < len(processes): 
-                    # safeguard in case something in the processes method causes it to never add data
-                    if datetime.now() - fetch_start_time > timedelta(seconds = 75):
-                        raise Exception("More than 60 seconds has passed since processes starting fetching data!")
-                    data.append(queue.get(True, timeout=120))
-                    
-                # Calling close before join thread ensures all data is flushed to the queue before the bg thread is joined
-                queue.close()
-                queue.join_thread()
-                    
-                for p in processes:
-                    # Extra safeguard against indefinite blocking, but with above code the process should never timeout (hopefully)
-                    p.join(timeout=30)
-                    if p.exitcode and p.exitcode != 0:
-                        warnings.warn(f"Process {p.pid} finished with exit code {p.exitcode}")
-                    
-            except Exception as e:
-                warnings.warn(f"Error parsing {start}-{end}, not saving data. \n Error: {e}")
-                with open(self.error_file_path, mode="a") as file:
-                    file.write(f'{datetime.now().strftime("%m/%d/%Y %H:%M:%S")},{start},{end},{e}\n')
-                continue
-
-            # Attempt to save data
-            if not self.mutate_save_data(data):
-                with open(self.error_file_path, mode="a") as file:
-                    file.write(f'{datetime.now().strftime("%m/%d/%Y %H:%M:%S")},{start},{end}, missing data\n')
-                continue
-            
-            # Remove any dupplicates and sort by time cols
-            output_data = pd.read_csv(self.output_file_path).drop_duplicates().sort_values(by=['time','valid_time'])
-            output_data.to_csv(self.output_file_path, index=False)
-            
-            if self.verbose:
-                self.__logger.info(f"Appended data to {self.output_file_path} between {start}-{end}")
-            if self.show_times:
-                self.__logger.info(f"Finished whole process for {start}-{end} in {datetime.now()-s_time} (Total runtime: {datetime.now()-runtime})")
+        # Fetching and saving overlap: up to `self.prefetch` intervals are downloading on the pool while a saver thread
+        # merges and saves earlier ones. Both queues are bounded, so when saving falls behind no more intervals are
+        # submitted until it catches up.
+        save_queue = queue.Queue(maxsize=self.prefetch)
+        saver = threading.Thread(target=self.__save_intervals, args=(save_queue, runtime), daemon=True)
+        saver.start()
+        
+        pending = iter(intervals)
+        in_flight = deque()
+        try:
+            while True:
+                while len(in_flight) < self.prefetch:
+                    interval = next(pending, None)
+                    if interval is None:
+                        break
+                    start, end = interval
+                    states = [self.__start_job(job) for job in self.__interval_jobs(start, end, regs, fxx, coords)]
+                    in_flight.append((start, end, datetime.now(), states))
                 
-            with open(self.date_file_path, mode="w") as file:
-                file.write(end.strftime("%m/%d/%Y %H:%M:%S"))         
+                if len(in_flight) == 0:
+                    break
+                
+                # Intervals are collected in order, so the date log only ever moves forward
+                start, end, s_time, states = in_flight.popleft()
+                data = self.__collect_interval(start, end, states, [state for *_, queued in in_flight for state in queued])
+                if data is not None:
+                    # Blocks while the saver is behind
+                    with self.metrics.timer("save_backpressure", interval=self.__interval_label(start, end)):
+                        save_queue.put((start, end, s_time, data, [state.job for state in states], time.perf_counter()))
+        finally:
+            for _, _, _, states in in_flight:
+                for state in states:
+                    self.__abandon(state.futures)
+            save_queue.put(None)
+            saver.join()
+        
+        if self.metrics_file:
+            self.metrics.export(self.metrics_file)
+        
+        # Downloaded subsets are kept for retries and refetches, only the least recently used are removed
+        self.cache.evict()
   
-    def refetch_data(self, regs: list[str], fxx:list[int], coords: gpd.GeoDataFrame):
-        """Attempts to refetch missing data found in `self.output_file_path`. Missing data is determined by
+    def refetch_data(self, regs: list[str], fxx:list[int], coords: gpd.GeoDataFrame, fill_method: Literal["linear", "nearest"] = "linear", max_gap: Optional[int] = 1):
+        """Attempts to refetch missing data found in `self.store`. Missing data is determined by
         
         1. Finding the min and max times in the error output file, and creating a range of hourly dates between them (excluding June-September)
         2. Checking the output df for hours not found 
         3. Checking the output df for hours with missing data.\n
         The missing hours are then converted to date/time ranges where possible to allow for efficient fetching.
-        If again no data is found for an hour after refetching, interpolation is attempted for the hour by calling `self.interpolate_missing_time()`.
+        If again no data is found for an hour after refetching, the gaps are filled with `fill_gaps` using the given fill policy.
 
         ### NOTE
         The `coords` parameter **MUST** have 2 columns titled `latitude` and `longitude`. 
@@ -258,6 +259,8 @@ class HerbieFetcher():
             regs (list[str]): Regexs to search for
             fxx (list[int]): fxx to get
             coords (gpd.GeoDataFrame): Coords to get data for
+            fill_method (Literal["linear", "nearest"], optional): How to fill remaining gaps. Defaults to "linear".
+            max_gap (Optional[int], optional): Longest gap (In hours) to fill. Defaults to 1 (Only single missing hours).
         """
         missing_date_ranges = []
         
@@ -275,8 +278,7 @@ class HerbieFetcher():
             self.fetch_data(regs=regs, fxx=fxx, coords=coords, intervals=missing_date_ranges)
 
         # Load output data
-        output_data = pd.read_csv(self.output_file_path)
-        output_data['time'] = pd.to_datetime(output_data['time'])
+        output_data = self.store.read()
         
         still_missing = []
         
@@ -293,28 +295,47 @@ class HerbieFetcher():
         with open(self.error_file_path, "w") as file:
             file.writelines(still_missing)
         
-        missing_hours = self.get_missing_hours(output_data,output_data['time'].min(), output_data['time'].max())
-        
-        # Get rows with missing data
-        times = [pd.to_datetime(t) for t in output_data[output_data.isna().any(axis=1)]['time'].drop_duplicates().to_list()]
-        
-        times += missing_hours
+        # Fill every remaining gap in one pass, only rows with filled values need to be saved
+        filled, counts = fill_gaps(output_data, method=fill_method, max_gap=max_gap, only_filled=True)
     
-        if len(times) == 0:
-            self.__logger.info(f"No missing dates found for {self.output_file_path}")
+        if filled.empty:
+            self.__logger.info(f"No missing data filled for {self.store.root}")
             return
-        else:
-            self.__logger.info(f"Found {len(times)} hours either missing or have missing data in {self.output_file_path}")
         
-        # Interpolate remaining missing times
-        for hour in sorted(times):
-            output_data = self.interpolate_missing_time(output_data,hour)
-                
-        # Resave data
-        output_data = output_data.dropna()
-        output_data.drop_duplicates(inplace=True)
-        output_data.sort_values(by='time',inplace=True)
-        output_data.to_csv(self.output_file_path, index=False)
+        self.__logger.info(f"Filled {sum(counts.values())} missing values in {filled.shape[0]} rows of {self.store.root}")
+        
+        self.__save(filled.dropna())
+        
+    def extract_from_cube(self, coords: gpd.GeoDataFrame, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          fxx: Optional[list[int]] = None) -> bool:
+        """Saves the data of the given coords from `self.cube` to `self.store`, without fetching anything. Used to add
+        points or move them after the region has been ingested with `fetch_data`.
+
+        Args:
+            coords (gpd.GeoDataFrame): Coords to get data for, with 'id', 'latitude' and 'longitude' columns
+            start (Optional[datetime], optional): First run time to get. Defaults to None (First in the cube).
+            end (Optional[datetime], optional): Last run time to get. Defaults to None (Last in the cube).
+            fxx (Optional[list[int]], optional): fxx to get. Defaults to None (All).
+
+        Raises:
+            ValueError: If the fetcher has no cube
+
+        Returns:
+            bool: True if any data was saved, False otherwise
+        """
+        if self.cube is None:
+            raise ValueError("No cube to extract from, create the fetcher with a CubeStore")
+        
+        with self.metrics.timer("extract"):
+            df = self.cube.extract(coords, start, end, fxx)
+        
+        if df.empty:
+            self.__logger.info(f"No data in {self.cube.root} for {start}-{end}")
+            return False
+        
+        self.__save(df)
+        self.__logger.info(f"Saved {df.shape[0]} rows for {df['point_id'].nunique()} points from {self.cube.root}")
+        return True
         
     def fetch_missing_forecast_data(self, season: int, day: datetime,regs: list[str], coords: gpd.GeoDataFrame) -> bool:
         """Fetch missing forecast data up to and including day. This fetches the data 
@@ -331,243 +352,462 @@ class HerbieFetcher():
         """        
         season_start = datetime(season,12,1,0,0,0)
         
-        fetched_df = pd.read_csv(self.output_file_path).drop_duplicates()
+        missing = self.coverage.missing(season_start, day + timedelta(days=1), time_col='valid_time', point_ids=self.__point_ids(coords))
         
-        validate_df(fetched_df)
-        
-        fetched_df['valid_time'] = pd.to_datetime(fetched_df['valid_time'], format='mixed')
-        
-        missing_hours = []
-        
-        # Check each id for missing hours
-        # This will lead to data for one hour to be pulled for all ids
-        # But the duplicates get removed after pulling is finished
-        num_hours = (day - fetched_df['valid_time'].min()).total_seconds() // 3600 # Number of hours between min in df and given day
-        for id in fetched_df['point_id'].unique():
-            id_df = fetched_df[fetched_df['point_id'] == id]
-            if id_df.shape[0] != num_hours + 24:
-                missing_hours += self.get_missing_hours(fetched_df, season_start, day + timedelta(days=1), time_col='valid_time')
-        
-        if len(missing_hours) == 0:
+        if missing.empty:
             self.__logger.info("No missing hours found")
             return False
         
-        # Remove duplicates and sort missing hours
-        missing_hours = sorted(list(set(missing_hours)))
-        
-        self.__logger.info(f"Found {len(missing_hours)} missing hours")
-        
-        i = 0
+        # Forecasts always come from the 00:00:00 run, so each batch is one run with a range of fxx
+        batches = plan_forecast_batches(missing, self.cost_model)
         
-        missing_hour_ranges = []
-
-        # Create time ranges of 1-6 hours 
-        while i < len(missing_hours)-1:
-            start_time = missing_hours[i]
-            end_time = start_time
-            # Get the end time for current interval
-            while i+1 <= len(missing_hours)-1 and missing_hours[i+1] == end_time + timedelta(hours=1) and end_time - start_time <= timedelta(hours=6):
-                end_time = missing_hours[i+1]
-                i += 1
-
-            missing_hour_ranges.append((start_time,end_time))
-            i += 1
-        
-        # Sometimes the last hour in missing_hours is skipped or the above logic doesn't work if there is only one hour in it
-        if len(missing_hours) > 0 and len(missing_hour_ranges) == 0 or missing_hours[-1] != missing_hour_ranges[-1][1]:
-            missing_hour_ranges.append((missing_hours[-1], missing_hours[-1]))
-
-        # This function always fetches data for time 00:00:00, and uses ranges for the fxx since its forecasted data
-        for interval in missing_hour_ranges:
-            start_ts = interval[0]
-            if start_ts.hour == 0:
-                start_date = start_ts - timedelta(days=1)
-                start_fxx = 24
-            else:
-                start_date = pd.to_datetime(start_ts.date())
-                start_fxx = start_ts.hour
-            
-            end_ts = interval[1]
-            if end_ts.hour == 0:
-                end_date = end_ts - timedelta(days = 1)
-                end_fxx = 24
-            else:
-                end_date = pd.to_datetime(end_ts.date())
-                end_fxx = end_ts.hour
+        self.__logger.info(f"Found {missing['valid_time'].nunique()} missing hours, fetching in {len(batches)} batches")
 
+        for batch in batches:
             self.fetch_data(
                 regs, 
-                fxx=[i for i in range(start_fxx, end_fxx+1)],
+                fxx=batch.fxx,
                 coords=coords,
-                intervals=[(start_date,end_date)],
-                remove_herbie_dir=True)
+                intervals=[batch.interval])
         return True
         
-    def fetch_missing_season_data(self, season: int, day: datetime,regs: list[str], fxx:list[int], coords: gpd.GeoDataFrame):
-        season_start = datetime(season,10,1,0,0,0)
-        
-        fetched_df = pd.read_csv(self.output_file_path).drop_duplicates()
+    def fetch_forecast_horizons(self, season: int, day: datetime, regs: list[str], coords: gpd.GeoDataFrame, max_fxx: int = 48, 
+                                run_hour: int = 0) -> bool:
+        """Fetches every horizon (fxx 1 to `max_fxx`) of each day's run up to and including day, so the forecasts for
+        the next days are saved along with today's. Rows are saved with their run time and fxx, so a valid hour has
+        one row per run that forecasts it.
+
+        Each run that is missing horizons is fetched in one planned batch with all of its missing fxx (See
+        `plan_horizon_batches`), and runs missing the same fxx share a single `fetch_data` call, so they share
+        the worker pool, the GRIB cache and the .idx files already downloaded.
+
+        Args:
+            season (int): Season to get data for (Start year of season)
+            day (datetime): Day of the last run to fetch
+            regs (list[str]): Regular expressions to search for
+            coords (gpd.GeoDataFrame): Coordinates to pull data for
+            max_fxx (int, optional): Longest horizon to fetch, HRRR runs at 00, 06, 12 and 18Z go out 48 hours. Defaults to 48.
+            run_hour (int, optional): Hour of the run fetched each day. Defaults to 0.
+
+        Returns:
+            bool: True if any data was fetched, False otherwise
+        """
+        season_start = datetime(season,12,1,run_hour,0,0)
+        last_run = pd.Timestamp(day).normalize() + timedelta(hours=run_hour)
         
-        validate_df(fetched_df)
+        missing = self.coverage.missing(season_start, last_run, fxx=list(range(1, max_fxx + 1)), point_ids=self.__point_ids(coords))
+        missing = missing[missing['time'].dt.hour == run_hour]
         
-        fetched_df['time'] = pd.to_datetime(fetched_df['time'], format='mixed')
-
-        missing_hours = []
-        
-        # Check each id for missing hours
-        # This will lead to data for one hour to be pulled for all ids
-        # But the duplicates get removed after pulling is finished
-        num_hours = (day - fetched_df['time'].min()).total_seconds() // 3600 # Number of hours between min in df and given day
-        for id in fetched_df['point_id'].unique():
-            id_df = fetched_df[fetched_df['point_id'] == id]
-            if id_df.shape[0] != num_hours + 24:
-                missing_hours += self.get_missing_hours(fetched_df, season_start, day)
-        
-        if len(missing_hours) == 0:
-            self.__logger.info("No missing hours found")
+        if missing.empty:
+            self.__logger.info("No missing horizons found")
             return False
         
-        # Remove duplicates and sort missing hours
-        missing_hours = sorted(list(set(missing_hours)))
+        batches = plan_horizon_batches(missing, self.cost_model)
+        
+        self.__logger.info(f"Found {missing[['time', 'fxx']].drop_duplicates().shape[0]} missing run hours in {len(batches)} runs")
         
-        self.__logger.info(f"Found {len(missing_hours)} missing hours")
+        for batch_fxx in sorted(set(tuple(b.fxx) for b in batches)):
+            intervals = [b.interval for b in batches if tuple(b.fxx) == batch_fxx]
+            self.fetch_data(regs, list(batch_fxx), coords, intervals=intervals)
+        return True
         
-        i = 0
+    def fetch_missing_season_data(self, season: int, day: datetime,regs: list[str], fxx:list[int], coords: gpd.GeoDataFrame):
+        season_start = datetime(season,10,1,0,0,0)
         
-        missing_hour_ranges = []
+        missing = self.coverage.missing(season_start, day, fxx=fxx, point_ids=self.__point_ids(coords))
         
-        # Create time ranges of 1-6 hours 
-        while i < len(missing_hours)-1:
-            start_time = missing_hours[i]
-            end_time = start_time
-            # Get the end time for current interval
-            while i+1 < len(missing_hours)-1 and missing_hours[i+1] == end_time + timedelta(hours=1) and end_time - start_time <= timedelta(hours=6):
-                end_time = missing_hours[i+1]
-                i += 1
-                
-            missing_hour_ranges.append((start_time,end_time))
-            i += 1
+        if missing.empty:
+            self.__logger.info("No missing hours found")
+            return False
         
-        # Sometimes the last hour in missing_hours is skipped or the above logic doesn't work if there is only one hour in it
-        if len(missing_hours) > 0 and len(missing_hour_ranges) == 0 or missing_hours[-1] != missing_hour_ranges[-1][1]:
-            missing_hour_ranges.append((missing_hours[-1], missing_hours[-1]))
-            
-        self.fetch_data(regs, fxx, coords, intervals=missing_hour_ranges, remove_herbie_dir=True)
+        batches = plan_season_batches(missing, self.cost_model)
+        
+        self.__logger.info(f"Found {missing['time'].nunique()} missing hours, fetching in {len(batches)} batches")
+        
+        # Batches for the same fxx can share a fetch_data call
+        for batch_fxx in sorted(set(tuple(b.fxx) for b in batches)):
+            intervals = [b.interval for b in batches if tuple(b.fxx) == batch_fxx]
+            self.fetch_data(regs, list(batch_fxx), coords, intervals=intervals)
         
         return True
            
     def get_missing_hours(self, df, min, max, time_col='time'):
-        # Make range of dates from min to max time in output data
-        dates = pd.date_range( min, max, freq='1h').to_list()
-
-        # Remove summer months
-        for i in range(len(dates)-1, 0, -1):
-            if dates[i].month in [6,7,8,9]:
-                dates.pop(i)
+        # Make range of dates from min to max time in output data, without summer months
+        dates = pd.date_range(min, max, freq='1h')
+        dates = dates[~dates.month.isin(SUMMER_MONTHS)]
 
         # Get missing hours in output data
-        missing_hours = list(set(dates)-set(df[time_col].to_list()))
+        missing_hours = dates.difference(pd.DatetimeIndex(df[time_col].unique())).to_list()
         
         return missing_hours
         
-    def interpolate_missing_time(self, df: pd.DataFrame, t: datetime):
-        if self.verbose:
-            self.__logger.info(f'Interpolating {t}')
+    def split_data(self, output_dir_name: str = "", split_seasons: bool = False, time_col = 'time', full: bool = False, by_fxx: bool = True):
+        """Splits the stored data into a csv file for each point and fxx (Or just each point if `by_fxx` is False), and for each season if `split_seasons` is True.\n
+        Every output file has a watermark (The last `time_col` value written to it) saved in `_watermarks.json` in the output directory,
+        so later calls only read and append the hours after it. A file is rewritten instead if the store changed at or before its 
+        watermark since it was written (Like when a refetch fills an old gap), or if `full` is True.
+
+        Args:
+            output_dir_name (str, optional): Directory in `self.output_file_dir` to write to. Defaults to "" (Named after the data's time range, points and fxx).
+            split_seasons (bool, optional): Whether to split each point's data by season. Defaults to False.
+            time_col (str, optional): Time column used for outliers and watermarks. Defaults to 'time'.
+            full (bool, optional): Whether to rewrite every output file. Defaults to False.
+            by_fxx (bool, optional): Whether each fxx gets its own file, otherwise every fxx of a point is written to one file
+                named after the smallest fxx (Like forecasts, where each fxx is a different hour of the run). Defaults to True.
+        """
+        split_at = datetime.now().timestamp()
         
-        validate_df(df)
+        min_time, max_time = self.store.time_range()
+        if min_time is None or max_time is None:
+            warnings.warn(f"No data found in {self.store.root}, nothing to split")
+            return
         
-        points = [int(n) for n in df['point_id'].unique()]
-        fxxs = [int(n) for n in df['fxx'].unique()]
-
-        # New data is the average of the hour before and after it
-        new_rows = []
-        for point in points:
-            for fxx in fxxs:
-                vals = df[((df['time'] == t + timedelta(hours=1)) | (df['time'] == t - timedelta(hours=1))) & (df['fxx'] == fxx) & (df['point_id'] == point)]
-                
-                if vals.shape[0] < 2:
-                    warnings.warn(f"Missing nearby data for {t} - point_id {point} - fxx {fxx} nearby: {vals.shape[0]}")
-                    continue
-
-                new_entry = pd.DataFrame({
-                    'time': [t],
-                    'valid_time': [t + timedelta(hours=fxx)],
-                    'point_id': [point],
-                    'fxx': [fxx]
-                })
-
-                for i in range(vals.shape[1]):
-                    if vals.columns[i] in REQ_COLS:
-                        continue
-                    new_entry[vals.columns[i]] = (vals.iloc[0,i] + vals.iloc[1,i]) / 2 # type: ignore
-                new_entry = new_entry[vals.columns.to_list()]
-                new_rows.append(new_entry)
-               
-        # Add new rows 
-        df = pd.concat([df] + new_rows, ignore_index=True)
-        return df
-
-    def split_data(self, output_dir_name: str = "", split_seasons: bool = False, time_col = 'time'):
-        output_data = pd.read_csv(self.output_file_path)
-        output_data[time_col] = pd.to_datetime(output_data[time_col], format='mixed')
-        if time_col != 'time':
-            output_data['time'] = pd.to_datetime(output_data['time'], format='mixed')
+        if output_dir_name == "":
+            point_strs = [str(int(n)) for n in self.coverage.point_ids]
+            fxx_strs = [str(int(n)) for n in sorted(self.coverage.fxxs)]
+            output_path = f"{self.output_file_dir}/{min_time.strftime('%Y-%m-%d_%H')}_{max_time.strftime('%Y-%m-%d_%H')}_{'_'.join(point_strs)}_{'_'.join(fxx_strs)}"
+        else:
+            output_path = os.path.join(self.output_file_dir, output_dir_name)
+            
+        os.makedirs(output_path, exist_ok=True)
+        
+        watermarks_fp = os.path.join(output_path, "_watermarks.json")
+        watermarks = {}
+        if os.path.exists(watermarks_fp) and not full:
+            with open(watermarks_fp, "r") as file:
+                watermarks = json.load(file)
+        
+        def output_file(point, fxx, season) -> str:
+            if split_seasons:
+                return os.path.join(f"weather_{min_time.year}-{max_time.year}_p{int(point)}_fxx{int(fxx)}", f"weather_{season}_p{int(point)}_fxx{int(fxx)}.csv")
+            return f"weather_p{int(point)}_fxx{int(fxx)}.csv"
+        
+        seasons = range(season_of(min_time), season_of(max_time) + 1) if split_seasons else [0]
+        # The index keeps fxx in the order they were first saved, not sorted
+        file_fxxs = self.coverage.fxxs if by_fxx else [min(self.coverage.fxxs)]
+        changes = self.store.changes_since(min([wm['updated'] for wm in watermarks.values()], default=0))
+        # Files last written before the journal was compacted can't tell what changed since
+        journal_start = self.store.journal_start
+        
+        # Decide which files get rewritten and how far back each point has to be read
+        rewrite = set()
+        read_starts = {}
+        for point in self.coverage.point_ids:
+            point_changes = changes[changes['point_id'] == point]
+            for fxx in file_fxxs:
+                for season in seasons:
+                    rel_path = output_file(point, fxx, season)
+                    wm = watermarks.get(rel_path)
+                    
+                    if (wm is None or not os.path.exists(os.path.join(output_path, rel_path)) or wm['updated'] < journal_start or
+                        ((point_changes['at'] > wm['updated']) & (point_changes[f"min_{time_col}"] <= pd.Timestamp(wm['max']))).any()):
+                        rewrite.add(rel_path)
+                        start = datetime(season, 10, 1) if split_seasons else None
+                    else:
+                        # Include the hour before the watermark so outliers on the first new hour can be replaced
+                        start = pd.Timestamp(wm['max']) - timedelta(hours=1)
+                    
+                    if point not in read_starts:
+                        read_starts[point] = start
+                    elif read_starts[point] is not None:
+                        read_starts[point] = None if start is None else min(read_starts[point], start)
+        
+        # Points with the same start are read together, normally every point starts at the same watermark
+        frames = []
+        for start in set(read_starts.values()):
+            point_ids = [int(p) for p, s in read_starts.items() if s == start]
+            frames.append(self.store.read(start=start, point_ids=point_ids, time_col=time_col))
+        output_data = pd.concat(frames, ignore_index=True)
+        
+        if output_data.empty:
+            self.__logger.info(f"No new data to split into {output_path}")
+            return
 
         validate_df(output_data)
         
         output_data = remove_outliers(output_data,time_col)
         
-        points = [n for n in output_data['point_id'].unique()]
-        fxxs = [n for n in output_data['fxx'].unique()]
-        
-        point_strs = [str(int(n)) for n in points]
-        fxx_strs = [str(int(n)) for n in fxxs]
-        
-        if output_dir_name == "":
-            output_path = f"{self.output_file_dir}/{output_data['time'].min().strftime('%Y-%m-%d_%H')}_{output_data['time'].max().strftime('%Y-%m-%d_%H')}_{'_'.join(point_strs)}_{'_'.join(fxx_strs)}"
+        if split_seasons:
+            output_data = output_data[~output_data['time'].dt.month.isin(SUMMER_MONTHS)]
+            output_seasons = output_data['time'].dt.year.where(output_data['time'].dt.month >= 10, output_data['time'].dt.year - 1)
         else:
-            output_path = os.path.join(self.output_file_dir, output_dir_name)
+            output_seasons = pd.Series(0, index=output_data.index)
+        
+        n_rewritten = 0
+        n_appended = 0
+        output_fxxs = output_data['fxx'] if by_fxx else pd.Series(file_fxxs[0], index=output_data.index)
+        for (point, fxx, season), group in output_data.groupby([output_data['point_id'], output_fxxs, output_seasons]):
+            rel_path = output_file(point, fxx, season)
+            fp = os.path.join(output_path, rel_path)
             
-        os.makedirs(output_path, exist_ok=True)
+            if rel_path in rewrite:
+                os.makedirs(os.path.dirname(fp), exist_ok=True)
+                group.to_csv(fp, index=False)
+                n_rewritten += 1
+            else:
+                new_rows = group[group[time_col] > pd.Timestamp(watermarks[rel_path]['max'])]
+                if new_rows.empty:
+                    # Nothing changed at or before the watermark either, so the file is up to date with the journal
+                    watermarks[rel_path]['updated'] = split_at
+                    continue
+                new_rows.to_csv(fp, index=False, header=False, mode='a')
+                n_appended += 1
+            
+            watermarks[rel_path] = {"point_id": int(point), "max": group[time_col].max().isoformat(), "updated": split_at}
         
-        for point in points:
-            for fxx in fxxs:
-                filtered_df = output_data[(output_data['point_id'] == point) & (output_data['fxx'] == fxx)]
-                filtered_df = filtered_df.drop_duplicates()
+        tmp_fp = f"{watermarks_fp}.tmp"
+        with open(tmp_fp, "w") as file:
+            json.dump(watermarks, file, indent=2)
+        os.replace(tmp_fp, watermarks_fp)
+        
+        # Every file has seen the changes up to the oldest watermark, they don't need to be read again
+        self.store.compact_journal(min(wm['updated'] for wm in watermarks.values()))
+        
+        self.__logger.info(f"Split data into {output_path}, {n_rewritten} files rewritten, {n_appended} files appended to")
+                
+    def __interval_jobs(self, start: datetime, end: datetime, regs: list[str], fxx: list[int], coords: gpd.GeoDataFrame) -> list[FetchJob]:
+        """Creates the jobs that fetch every regex for one interval"""
+        DATES = pd.date_range(start=start, end=end, freq='1h')
+        
+        # Long fxx ranges (Like every horizon of a run) are split into jobs no longer than a planned batch
+        step = max(self.cost_model.max_hours, 1)
+        fxx_chunks = [fxx[i:i + step] for i in range(0, len(fxx), step)]
+        
+        # Cube ingestion fetches the whole region instead of the coords
+        bounds = self.cube.bounds if self.cube is not None else None
+        
+        groups = [(r, None) for r in regs]
+        if self.coalesce_regexes and len(regs) > 1:
+            groups = [("|".join(f"(?:{r})" for r in regs), regs)]
+        
+        jobs = []
+        for r, consumers in groups:
+            for chunk in fxx_chunks:
+                # Split up regexs that are big 
+                if len(r) > 20 and len(DATES) > 1:
+                    jobs.append(FetchJob(DATES[:len(DATES)//2], chunk, r, coords, verbose=self.verbose or self.show_times, cache=self.cache, source=self.source, consumers=consumers, bounds=bounds))
+                    jobs.append(FetchJob(DATES[len(DATES)//2:], chunk, r, coords, verbose=self.verbose or self.show_times, cache=self.cache, source=self.source, consumers=consumers, bounds=bounds))
+                else:
+                    jobs.append(FetchJob(DATES, chunk, r, coords, verbose=self.verbose or self.show_times, cache=self.cache, source=self.source, consumers=consumers, bounds=bounds))
+        return jobs
+    
+    def __start_job(self, job: FetchJob) -> JobState:
+        """Submits a job to the pool, unless its data was salvaged from an earlier failed fetch"""
+        salvaged = self.pieces.get(job)
+        if salvaged is not None:
+            self.metrics.count("salvaged_jobs_reused", regex=job.search_regex)
+            return JobState(job, result=salvaged)
+        return JobState(job, futures=[self.pool.submit(job)], started=time.monotonic(), submitted_at=time.time())
+    
+    def __collect_interval(self, start: datetime, end: datetime, states: list[JobState], queued: list[JobState]) -> Optional[list[pd.DataFrame]]:
+        """Waits for the jobs of one interval, retrying jobs that fail or time out (See `RetryPolicy`). Returns the data
+        of every job, or `None` (After logging the error and salvaging the jobs that succeeded) if a job ran out of attempts.
+        `queued` are the jobs of the intervals submitted after this one, resubmitted if the pool is recycled"""
+        interval = self.__interval_label(start, end)
+        collect_start = time.monotonic()
+        for state in states:
+            # Jobs queued behind earlier intervals only start their clock once this interval is collected
+            state.started = max(state.started, collect_start)
+        
+        try:
+            while not all(state.done for state in states):
+                now = time.monotonic()
+                next_event = now + self.latency.max_timeout
+                stuck = False
                 
-                if split_seasons:
-                    min_year = filtered_df['time'].min().year
-                    max_year = filtered_df['time'].max().year
-                    years = [y for y in range(min_year, max_year+1, 1)]
+                for state in states:
+                    if state.done:
+                        continue
                     
-                    split_output_folder = f"weather_{min_year}-{max_year}_p{int(point)}_fxx{int(fxx)}"
+                    if state.retry_at is not None:
+                        if now < state.retry_at:
+                            next_event = min(next_event, state.retry_at)
+                            continue
+                        state.futures = [self.pool.submit(state.job)]
+                        state.submitted_at = time.time()
+                        state.started = now
+                        state.retry_at = None
+                        state.hedged = False
                     
-                    split_output_path = os.path.join(output_path,split_output_folder)
+                    deadline = state.started + self.latency.timeout(state.attempt)
+                    if now >= deadline:
+                        stuck = self.__abandon(state.futures) or stuck
+                        state.futures = []
+                        self.metrics.count("timeouts", regex=state.job.search_regex, interval=interval)
+                        self.__fail_job(state, f"timed out after {now - state.started:.0f}s", now, interval)
+                        continue
+                    next_event = min(next_event, deadline)
                     
-                    os.makedirs(split_output_path, exist_ok=True)
-
-                    for year in years:
-                        start_date = datetime(year, 10,1)
-                        end_date = datetime(start_date.year + 1, 6,1)
+                    # Stragglers get a duplicate request, whichever finishes first is used
+                    if self.retry_policy.hedge and not state.hedged:
+                        hedge_at = state.started + self.latency.hedge_delay
+                        if now >= hedge_at:
+                            state.futures.append(self.pool.submit(state.job))
+                            state.hedged = True
+                            self.metrics.count("hedges", regex=state.job.search_regex, interval=interval)
+                        else:
+                            next_event = min(next_event, hedge_at)
+                
+                if stuck:
+                    # Jobs that timed out are still running on their workers, which would never take another job
+                    self.__recycle_pool(states + queued, interval)
+                
+                failed = [state for state in states if state.error is not None]
+                if len(failed) > 0:
+                    raise Exception("; ".join(f"{state.job.search_regex}: {state.error}" for state in failed))
+                
+                wait([f for state in states for f in state.futures], timeout=max(next_event - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                
+                now = time.monotonic()
+                for state in states:
+                    for future in [f for f in state.futures if f.done()]:
+                        state.futures.remove(future)
+                        try:
+                            shared = future.result()
+                            error = "No data found"
+                        except Exception as e:
+                            shared = None
+                            error = str(e)
                         
-                        curr_df = filtered_df[(filtered_df['time'] >= start_date) & (filtered_df['time'] < end_date)]
-                        if not curr_df.empty:
-                            curr_df.to_csv(f"{split_output_path}/weather_{year}_p{int(point)}_fxx{int(fxx)}.csv",index=False)
-                else:
-                    filtered_df.to_csv(f"{output_path}/weather_p{int(point)}_fxx{int(fxx)}.csv",index=False)
+                        if shared is not None:
+                            self.latency.observe(now - state.started)
+                            labels = {"regex": state.job.search_regex, "interval": interval}
+                            if shared.stats is not None:
+                                self.metrics.add_job(shared.stats, state.submitted_at, **labels)
+                            with self.metrics.timer("receive", **labels):
+                                state.result = shared.to_frame()
+                            self.__abandon(state.futures)
+                            state.futures = []
+                        elif len(state.futures) == 0:
+                            self.__fail_job(state, error, now, interval)
+        except Exception as e:
+            # Free the shared memory of jobs that finished (or will finish) but won't be saved
+            for state in states:
+                self.__abandon(state.futures)
+                state.futures = []
+                if state.done:
+                    self.pieces.put(state.job, state.result) # type: ignore
+            
+            n_salvaged = sum(state.done for state in states)
+            warnings.warn(f"Error parsing {start}-{end}, not saving data ({n_salvaged}/{len(states)} jobs salvaged). \n Error: {e}")
+            self.__log_error(start, end, str(e).replace(",", ";"))
+            return None
+        return [state.result for state in states] # type: ignore
+    
+    def __fail_job(self, state: JobState, error: str, now: float, interval: str) -> None:
+        """Schedules a retry of a failed job, or marks it as failed if it's out of attempts"""
+        state.attempt += 1
+        if state.attempt >= self.retry_policy.max_attempts:
+            state.error = error
+            self.metrics.count("failed_jobs", regex=state.job.search_regex, interval=interval)
+            return
+        
+        self.metrics.count("retries", regex=state.job.search_regex, interval=interval)        
+        delay = self.retry_policy.delay(state.attempt)
+        state.retry_at = now + delay
+        self.__logger.info(f"Retrying {state.job.search_regex} for {min(state.job.dates)}-{max(state.job.dates)} in {delay:.0f}s (Attempt {state.attempt + 1}), error: {error}")
+    
+    def __abandon(self, futures: list[Future]) -> bool:
+        """Cancels futures whose results won't be used, freeing their shared memory if they still finish. Returns `True`
+        if any of them is still running, since running jobs can't be cancelled"""
+        running = False
+        for future in futures:
+            if not future.cancel():
+                running = running or not future.done()
+                future.add_done_callback(release_result)
+        return running
+    
+    def __recycle_pool(self, states: list[JobState], interval: str) -> None:
+        """Restarts the pools workers, so workers stuck on jobs that timed out are freed. Every other job queued or
+        running on the pool is lost with them, so it's submitted again without counting as an attempt"""
+        self.pool.recycle()
+        self.metrics.count("pool_recycles", interval=interval)
+        
+        now = time.monotonic()
+        for state in states:
+            lost = [f for f in state.futures if is_lost(f)]
+            if len(lost) == 0:
+                continue
+            self.__abandon(lost)
+            state.futures = [f for f in state.futures if f not in lost]
+            if len(state.futures) == 0:
+                state.futures = [self.pool.submit(state.job)]
+                state.submitted_at = time.time()
+                state.started = max(state.started, now)
+                state.hedged = False
+    
+    def __save_intervals(self, save_queue: queue.Queue, runtime: datetime) -> None:
+        """Saver thread of `fetch_data`, saves fetched intervals in order until it gets `None`"""
+        while True:
+            item = save_queue.get()
+            if item is None:
+                return
+            start, end, s_time, data, jobs, queued_at = item
+            interval = self.__interval_label(start, end)
+            self.metrics.observe("save_queue_wait", time.perf_counter() - queued_at, interval=interval)
+            
+            # Attempt to save data
+            try:
+                saved = self.mutate_save_data(data, interval)
+            except Exception as e:
+                self.__logger.error(f"Error saving {start}-{end}: {e}")
+                saved = False
+            
+            # The salvaged pieces of the interval are either saved now or bad
+            self.pieces.discard(jobs)
+            
+            if not saved:
+                self.__log_error(start, end, " missing data")
+                continue
+            
+            if self.verbose:
+                self.__logger.info(f"Saved data to {self.store.root} between {start}-{end}")
+            if self.show_times:
+                self.__logger.info(f"Finished whole process for {start}-{end} in {datetime.now()-s_time} (Total runtime: {datetime.now()-runtime})")
+                
+            with open(self.date_file_path, mode="w") as file:
+                file.write(end.strftime("%m/%d/%Y %H:%M:%S"))
+    
+    def __interval_label(self, start: datetime, end: datetime) -> str:
+        """Label of an interval in metrics (ISO 8601 interval)"""
+        return f"{start.isoformat()}/{end.isoformat()}"
+    
+    def __log_error(self, start: datetime, end: datetime, error: str) -> None:
+        """Appends a failed interval to the error file, used by both the fetch and saver threads"""
+        with self.__error_lock:
+            with open(self.error_file_path, mode="a") as file:
+                file.write(f'{datetime.now().strftime("%m/%d/%Y %H:%M:%S")},{start},{end},{error}\n')
+    
+    def __save(self, df: pd.DataFrame) -> None:
+        """Upserts the given rows into the store and marks them in the coverage index."""
+        # Only the partitions for these rows are rewritten, duplicates are replaced on their key
+        self.store.upsert(df)
+        self.coverage.mark(df)
+        self.coverage.save()
+    
+    def __point_ids(self, coords: pd.DataFrame) -> Optional[list[int]]:
+        """Gets the point ids of the given coords, `None` if they have no 'id' column."""
+        return coords['id'].astype(int).to_list() if 'id' in coords.columns else None
+    
+    @property
+    def pool(self) -> FetchPool:
+        """Worker pool used by `fetch_data`, started on first use and kept alive until `close` is called."""
+        if self.__pool is None:
+            self.__pool = FetchPool(self.max_workers, self.source)
+        return self.__pool
+    
+    def close(self) -> None:
+        """Shuts down the worker pool, if one was started."""
+        if self.__pool is not None and self.__owns_pool:
+            self.__pool.shutdown()
+            self.__pool = None
                 
-    def __remove_herbie_dir(self):
-        herbie_data_dir = os.path.expanduser("~/data")
-
-        if os.path.exists(herbie_data_dir) and 'hrrr' in os.listdir(herbie_data_dir):
-            shutil.rmtree(herbie_data_dir)
-            self.__logger.info(f"Removed herbie data dir.")
-          
     def __remove_output_file(self):
+        self.store.clear()
         if os.path.exists(self.output_file_path):
             os.remove(self.output_file_path)
-            if self.verbose:
-                self.__logger.info(f"{self.output_file_path} deleted.")
+        if self.verbose:
+            self.__logger.info(f"{self.output_file_path} deleted.")
         
 if __name__ == "__main__":
         
@@ -579,8 +819,8 @@ if __name__ == "__main__":
         
     if os.path.exists(date_path):
         with open(date_path, 'r') as file:
-            time = file.readline()
-            start_date = datetime.strptime(time, "%m/%d/%Y %H:%M:%S")
+            last_date = file.readline()
+            start_date = datetime.strptime(last_date, "%m/%d/%Y %H:%M:%S")
         print(f"Loaded start time from file: {start_date}")
     else:
         start_date = datetime(2025, 10, 1, 0, 0)  # start date
@@ -602,6 +842,6 @@ if __name__ == "__main__":
     #               fxx = fxx, 
     #               coords=test_coords, 
     #               start_date=start_date, 
-    #               n_days=n_days, remove_herbie_dir=True)
+    #               n_days=n_days)
     
     print(f"Total time {datetime.now() - start_time}")
\ No newline at end of file
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from src.config import EXP_COLS
+
+# Every regex result has one row per (time, valid_time, step, point_id)
+MERGE_KEY = ['time', 'valid_time', 'step', 'point_id']
+# Results cropped to a region (See `FetchJob.bounds`) have one row per grid cell instead of per point
+REGION_KEY = ['time', 'valid_time', 'step', 'y', 'x']
+
+def merge_frames(data_frames: list[pd.DataFrame], columns: list[str] = EXP_COLS, key: list[str] = MERGE_KEY) -> tuple[pd.DataFrame, list[str]]:
+    """Combines the results of each regex into one row per key (time, valid_time, step, point_id by default).
+
+    The key of every row of every frame is factorized once, which gives the union of the rows and the position of each
+    frame's rows in it. Each column is then written straight into its place, so nothing is outer merged, suffixed or
+    deduplicated afterwards (Rows in more than one frame keep the values of the last one, like the halves of a regex
+    that was split up by date). Columns not in `columns` are never copied, and missing columns (Not returned by any
+    regex, or with missing values) are found in the same pass.
+
+    Args:
+        data_frames (list[pd.DataFrame]): Results of each job, with the key as columns or index levels
+        columns (list[str], optional): Columns to keep. Defaults to EXP_COLS.
+        key (list[str], optional): Columns that identify a row. Defaults to MERGE_KEY.
+
+    Returns:
+        tuple[pd.DataFrame, list[str]]: Merged data sorted by the key, with the key and the kept columns each
+            regex had, and the columns of `columns` that are missing or have missing values
+    """
+    keys = [[_column(df, c) for c in key] for df in data_frames]
+    codes = np.column_stack([np.concatenate([_as_int(k[i]) for k in keys]) for i in range(len(key))])
+
+    _, first, positions = np.unique(codes, axis=0, return_index=True, return_inverse=True)
+    positions = positions.reshape(-1)
+    n_rows = len(first)
+
+    merged = {}
+    for i, c in enumerate(key):
+        merged[c] = np.concatenate([k[i] for k in keys])[first]
+
+    offset = 0
+    for df in data_frames:
+        rows = positions[offset:offset + df.shape[0]]
+        offset += df.shape[0]
+
+        for c in df.columns:
+            if c not in columns or c in key:
+                continue
+            values = df[c].to_numpy()
+            if c not in merged:
+                dtype = values.dtype if values.dtype.kind in "fmM" else (np.float64 if values.dtype.kind in "iub" else object)
+                merged[c] = np.full(n_rows, np.nan if dtype != object else None, dtype=dtype)
+            merged[c][rows] = values
+
+    missing_cols = [c for c in columns if c not in merged or pd.isna(merged[c]).any()]
+    return pd.DataFrame(merged, copy=False), missing_cols
+
+def _column(df: pd.DataFrame, name: str) -> np.ndarray:
+    """Gets the values of a column or index level"""
+    if name in df.columns:
+        return df[name].to_numpy()
+    return df.index.get_level_values(name).to_numpy()
+
+def _as_int(values: np.ndarray) -> np.ndarray:
+    """Gets integer codes of key values that compare the same way the values do"""
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").view(np.int64)
+    if values.dtype.kind == "m":
+        return values.astype("timedelta64[ns]").view(np.int64)
+    if values.dtype.kind in "iub":
+        return values.astype(np.int64)
+    return values.astype(np.float64).view(np.int64)
+
+def legacy_merge(data_frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Merge `HerbieFetcher.mutate_save_data` used before `merge_frames`, kept to benchmark against.
+
+    Args:
+        data_frames (list[pd.DataFrame]): Results of each job
+
+    Returns:
+        pd.DataFrame: Merged data with every column
+    """
+    merged = pd.DataFrame()
+    other_dfs = []
+
+    for i in range(len(data_frames)):
+        if data_frames[i].shape[1] >= 20:
+            merged = pd.concat([merged, data_frames[i].reset_index()])
+        else:
+            other_dfs.append(data_frames[i])
+
+    for i in range(len(other_dfs)):
+        suffixes = (f"_{i}",f"_{i}{i}")
+        merged = pd.merge(merged, other_dfs[i], how="outer", on=["valid_time","time","step","point_id"], suffixes=suffixes)
+
+    merged.drop_duplicates(inplace=True)
+    return merged
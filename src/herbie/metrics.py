@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import pandas as pd
+
+class StageTimes():
+    def __init__(self):
+        """Stage timings and counts of a single fetch job. Filled in the worker process and sent back
+        with the jobs result, then added to the parents `Metrics` (See `Metrics.add_job`)."""
+        self.started_at = time.time()
+        self.seconds: dict[str, float] = {}
+        self.counts: dict[str, float] = {}
+
+    @contextmanager
+    def time(self, stage: str):
+        """Times the code inside the `with` block as the given stage, adding to any earlier time of the stage.
+
+        Args:
+            stage (str): Name of the stage
+        """
+        s_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - s_time
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Adds to a count of the job, like bytes downloaded.
+
+        Args:
+            name (str): Name of the count
+            value (float, optional): Amount to add. Defaults to 1.
+        """
+        self.counts[name] = self.counts.get(name, 0) + value
+
+class Metrics():
+    def __init__(self, prefix: str = "avy_fetch", keep_events: bool = False):
+        """Thread safe collection of stage timers and counters, each labeled (By regex and interval for fetches).
+        Metrics can be exported as JSON lines (One line per observation) or as a Prometheus text file (Totals per label set).
+
+        Args:
+            prefix (str, optional): Prefix of the exported metric names. Defaults to "avy_fetch".
+            keep_events (bool, optional): Keep every observation until the next `write_jsonl`, only needed when exporting
+                JSON lines. Otherwise only the totals are kept, so memory doesn't grow with the number of observations.
+                Defaults to False.
+        """
+        self.prefix = prefix
+        self.keep_events = keep_events
+        self.__lock = threading.Lock()
+        self.events: list[dict] = []
+        # (stage, labels) -> [total seconds, count, max seconds]
+        self.timers: dict[tuple, list[float]] = {}
+        # (name, labels) -> total
+        self.counters: dict[tuple, float] = {}
+
+    @contextmanager
+    def timer(self, stage: str, **labels: str):
+        """Times the code inside the `with` block as the given stage.
+
+        Args:
+            stage (str): Name of the stage
+            **labels (str): Labels of the observation
+        """
+        s_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - s_time, **labels)
+
+    def observe(self, stage: str, seconds: float, **labels: str) -> None:
+        """Records how long a stage took.
+
+        Args:
+            stage (str): Name of the stage
+            seconds (float): Duration of the stage
+            **labels (str): Labels of the observation
+        """
+        key = (stage, tuple(sorted(labels.items())))
+        with self.__lock:
+            timer = self.timers.setdefault(key, [0.0, 0, 0.0])
+            timer[0] += seconds
+            timer[1] += 1
+            timer[2] = max(timer[2], seconds)
+            if self.keep_events:
+                self.events.append({"ts": time.time(), "type": "timer", "name": stage, "value": seconds, **labels})
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        """Adds to a counter.
+
+        Args:
+            name (str): Name of the counter
+            value (float, optional): Amount to add. Defaults to 1.
+            **labels (str): Labels of the counter
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if self.keep_events:
+                self.events.append({"ts": time.time(), "type": "counter", "name": name, "value": value, **labels})
+
+    def add_job(self, stages: StageTimes, submitted_at: Optional[float] = None, **labels: str) -> None:
+        """Adds the stage times and counts a worker recorded for a job.
+
+        Args:
+            stages (StageTimes): Stage times of the job
+            submitted_at (Optional[float], optional): When the job was submitted (Seconds since epoch), used to
+                record how long the job waited for a worker. Defaults to None.
+            **labels (str): Labels of the job
+        """
+        if submitted_at is not None:
+            self.observe("queue_wait", max(stages.started_at - submitted_at, 0.0), **labels)
+        for stage, seconds in stages.seconds.items():
+            self.observe(stage, seconds, **labels)
+        for name, value in stages.counts.items():
+            self.count(name, value, **labels)
+
+    def summary(self, by: Optional[list[str]] = None) -> pd.DataFrame:
+        """Gets the total time of each stage.
+
+        Args:
+            by (Optional[list[str]], optional): Labels to group by as well as the stage. Defaults to None (Only by stage).
+
+        Returns:
+            pd.DataFrame: Total seconds, count and max seconds of each group, slowest first
+        """
+        by = by if by else []
+        with self.__lock:
+            rows = [{'stage': stage, **dict(labels), 'seconds': t[0], 'count': t[1], 'max': t[2]} for (stage, labels), t in self.timers.items()]
+
+        if len(rows) == 0:
+            return pd.DataFrame(columns=['stage'] + by + ['seconds', 'count', 'max'])
+
+        df = pd.DataFrame(rows)
+        for label in by:
+            if label not in df.columns:
+                df[label] = ""
+        df[by] = df[by].fillna("")
+        return (df.groupby(['stage'] + by).agg(seconds=('seconds', 'sum'), count=('count', 'sum'), max=('max', 'max'))
+                .sort_values('seconds', ascending=False).reset_index())
+
+    def export(self, fp: str) -> None:
+        """Exports the metrics to the given file, as a Prometheus text file if it ends with `.prom` or as JSON lines otherwise.
+
+        Args:
+            fp (str): File path to write to
+        """
+        if fp.endswith(".prom"):
+            self.write_prometheus(fp)
+        else:
+            self.write_jsonl(fp)
+
+    def write_jsonl(self, fp: str) -> None:
+        """Appends every observation since the last call to the given file, one JSON object per line. Observations
+        are only kept when `keep_events` is True.
+
+        Args:
+            fp (str): File path to append to
+        """
+        with self.__lock:
+            events = self.events
+            self.events = []
+
+        os.makedirs(os.path.dirname(fp) or ".", exist_ok=True)
+        with open(fp, "a") as file:
+            for event in events:
+                file.write(json.dumps(event) + "\n")
+
+    def write_prometheus(self, fp: str) -> None:
+        """Writes the totals of every timer and counter to the given file in the Prometheus text format
+        (Like for node_exporter's textfile collector), replacing the file atomically.
+
+        Args:
+            fp (str): File path to write to
+        """
+        with self.__lock:
+            timers = dict(self.timers)
+            counters = dict(self.counters)
+
+        lines = [f"# TYPE {self.prefix}_stage_seconds summary"]
+        for (stage, labels), (total, n, _) in sorted(timers.items()):
+            label_str = self.__labels((("stage", stage),) + labels)
+            lines.append(f"{self.prefix}_stage_seconds_sum{label_str} {total}")
+            lines.append(f"{self.prefix}_stage_seconds_count{label_str} {n}")
+
+        for name in sorted(set(name for name, _ in counters)):
+            lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+            for (counter, labels), total in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"{self.prefix}_{name}_total{self.__labels(labels)} {total}")
+
+        os.makedirs(os.path.dirname(fp) or ".", exist_ok=True)
+        with open(f"{fp}.tmp", "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(f"{fp}.tmp", fp)
+
+    def __labels(self, labels: tuple) -> str:
+        if len(labels) == 0:
+            return ""
+        escaped = [(k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for k, v in labels]
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
@@ -0,0 +1,191 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+@dataclass
+class CostModel():
+    """Estimated cost (In seconds) of a fetch round. Every round pays `request_overhead` (.idx lookups, worker fan-out,
+    merging and saving) plus `hour_cost` for each hour of GRIB data downloaded and decoded. Since one HRRR run contains
+    every point, the cost doesn't depend on how many points are missing an hour."""
+    request_overhead: float = 30.0
+    hour_cost: float = 5.0
+    max_hours: int = 12
+
+    def cost(self, n_hours: int) -> float:
+        """Gets the estimated cost of a round fetching the given number of hours
+
+        Args:
+            n_hours (int): Number of hours (Or fxx) fetched
+
+        Returns:
+            float: Estimated cost in seconds
+        """
+        return self.request_overhead + n_hours * self.hour_cost
+
+@dataclass
+class FetchBatch():
+    """One fetch round, data for every hour between start and end (inclusive) is fetched for each fxx."""
+    start: datetime
+    end: datetime
+    fxx: list[int] = field(default_factory=lambda: [1])
+
+    @property
+    def interval(self) -> tuple[datetime, datetime]:
+        return (self.start, self.end)
+
+def plan_ranges(values: Union[list[int], np.ndarray], cost_model: CostModel) -> list[tuple[int, int]]:
+    """Splits the given sorted integer values into inclusive ranges with the lowest total cost. Ranges may
+    cover values not in `values` when fetching the gap costs less than starting another round.
+
+    Args:
+        values (Union[list[int], np.ndarray]): Sorted unique values (Hours or fxx)
+        cost_model (CostModel): Cost model to use
+
+    Returns:
+        list[tuple[int, int]]: Inclusive (start, end) ranges covering every value
+    """
+    values = np.asarray(values, dtype=np.int64)
+    n = len(values)
+    if n == 0:
+        return []
+
+    # best[j] is the lowest cost of covering values[:j], prev[j] is where the last range starts
+    best = np.full(n + 1, np.inf)
+    prev = np.zeros(n + 1, dtype=np.int64)
+    best[0] = 0
+
+    for j in range(1, n + 1):
+        end = values[j - 1]
+        i = j - 1
+        while i >= 0 and end - values[i] < cost_model.max_hours:
+            cost = best[i] + cost_model.cost(int(end - values[i]) + 1)
+            if cost < best[j]:
+                best[j] = cost
+                prev[j] = i
+            i -= 1
+
+    ranges = []
+    j = n
+    while j > 0:
+        i = prev[j]
+        ranges.append((int(values[i]), int(values[j - 1])))
+        j = i
+    return ranges[::-1]
+
+def plan_season_batches(missing: pd.DataFrame, cost_model: CostModel, time_col: str = 'time') -> list[FetchBatch]:
+    """Plans fetch rounds for missing cells of analysis (Season) data, where each hour is its own model run.
+
+    Args:
+        missing (pd.DataFrame): Missing cells with columns 'fxx' and `time_col` (See `CoverageIndex.missing`)
+        cost_model (CostModel): Cost model to use
+
+    Returns:
+        list[FetchBatch]: Batches covering every missing cell
+    """
+    batches = []
+    for fxx, cells in missing.groupby('fxx'):
+        hours = pd.DatetimeIndex(cells[time_col].unique()).sort_values()
+
+        # Work in whole hours since the epoch
+        hour_ints = hours.to_numpy().astype('datetime64[h]').astype(np.int64)
+        for start, end in plan_ranges(hour_ints, cost_model):
+            batches.append(FetchBatch(
+                pd.Timestamp(np.datetime64(start, 'h')).to_pydatetime(),
+                pd.Timestamp(np.datetime64(end, 'h')).to_pydatetime(),
+                [int(fxx)]
+            ))
+    return sorted(batches, key=lambda b: b.start)
+
+def plan_forecast_batches(missing: pd.DataFrame, cost_model: CostModel, time_col: str = 'valid_time') -> list[FetchBatch]:
+    """Plans fetch rounds for missing cells of forecast data. Forecasts come from each day's 00Z run, so hour 0
+    of a day is fxx 24 of the previous day's run and any other hour is that hour's fxx of the same day's run.
+
+    Args:
+        missing (pd.DataFrame): Missing cells with a `time_col` column of valid times (See `CoverageIndex.missing`)
+        cost_model (CostModel): Cost model to use
+
+    Returns:
+        list[FetchBatch]: Batches covering every missing cell, each for a single run
+    """
+    valid = pd.DatetimeIndex(missing[time_col].unique())
+    runs = valid.floor('D')
+    fxxs = valid.hour.to_numpy()
+
+    midnight = fxxs == 0
+    runs = runs.where(~midnight, runs - timedelta(days=1))
+    fxxs = np.where(midnight, 24, fxxs)
+
+    batches = []
+    for run, run_fxx in pd.Series(fxxs, index=runs).groupby(level=0):
+        for start, end in plan_ranges(np.sort(run_fxx.to_numpy()), cost_model):
+            batches.append(FetchBatch(run.to_pydatetime(), run.to_pydatetime(), list(range(start, end + 1))))
+    return batches
+
+def plan_horizon_batches(missing: pd.DataFrame, cost_model: CostModel, time_col: str = 'time') -> list[FetchBatch]:
+    """Plans fetch rounds for the missing horizons of forecast runs. Each run gets a single batch with every fxx it's
+    missing, plus the fxx between them that cost less to fetch than to skip (See `plan_ranges`).
+
+    Args:
+        missing (pd.DataFrame): Missing cells with columns 'fxx' and `time_col` (Run times, see `CoverageIndex.missing`)
+        cost_model (CostModel): Cost model to use
+
+    Returns:
+        list[FetchBatch]: One batch per run
+    """
+    batches = []
+    for run, cells in missing.groupby(time_col):
+        ranges = plan_ranges(np.sort(cells['fxx'].unique()), cost_model)
+        fxx = [f for start, end in ranges for f in range(start, end + 1)]
+        batches.append(FetchBatch(pd.Timestamp(run).to_pydatetime(), pd.Timestamp(run).to_pydatetime(), fxx)) # type: ignore
+    return batches
+
+def legacy_ranges(missing_hours: list[pd.Timestamp]) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """Ranges created by the heuristic `HerbieFetcher` used before the planner, kept to benchmark against.
+
+    Args:
+        missing_hours (list[pd.Timestamp]): Sorted missing hours
+
+    Returns:
+        list[tuple[pd.Timestamp, pd.Timestamp]]: Ranges of 1-7 hours
+    """
+    i = 0
+    ranges = []
+    while i < len(missing_hours)-1:
+        start_time = missing_hours[i]
+        end_time = start_time
+        while i+1 < len(missing_hours)-1 and missing_hours[i+1] == end_time + timedelta(hours=1) and end_time - start_time <= timedelta(hours=6):
+            end_time = missing_hours[i+1]
+            i += 1
+        ranges.append((start_time,end_time))
+        i += 1
+
+    if len(missing_hours) > 0 and len(ranges) == 0 or missing_hours[-1] != ranges[-1][1]:
+        ranges.append((missing_hours[-1], missing_hours[-1]))
+    return ranges
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    cost_model = CostModel()
+    season = pd.date_range(datetime(2025, 10, 1), datetime(2026, 3, 1), freq='1h', inclusive='left')
+
+    scenarios = {
+        "scattered hours": season[np.sort(rng.choice(len(season), 300, replace=False))],
+        "one day outage": season[24*30:24*31],
+        "weekly 3 hour gaps": season[np.concatenate([np.arange(h, h + 3) for h in range(0, len(season) - 3, 24*7)])],
+        "new day": season[-24:],
+    }
+
+    print(f"{'scenario':<20} {'hours':>6} {'legacy req':>11} {'legacy cost':>12} {'planned req':>12} {'planned cost':>13}")
+    for name, hours in scenarios.items():
+        missing = pd.DataFrame({'fxx': 1, 'time': hours})
+
+        legacy = legacy_ranges(list(hours))
+        legacy_cost = sum(cost_model.cost(int((e - s) / timedelta(hours=1)) + 1) for s, e in legacy)
+
+        planned = plan_season_batches(missing, cost_model)
+        planned_cost = sum(cost_model.cost(int((b.end - b.start) / timedelta(hours=1)) + 1) for b in planned)
+
+        print(f"{name:<20} {len(hours):>6} {len(legacy):>11} {legacy_cost:>12.0f} {len(planned):>12} {planned_cost:>13.0f}")
@@ -0,0 +1,98 @@
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+@dataclass
+class RangePlan():
+    """Byte range requests for the messages a set of regexes need from one GRIB file. Each message is requested
+    once even if several regexes match it, and messages next to each other are requested together."""
+    # Matching rows of the .idx, with 'start_byte' and 'end_byte' (Exclusive) columns
+    messages: pd.DataFrame
+    # (start, end) byte ranges to request, end exclusive
+    requests: list[tuple[int, int]]
+    # Positions in `messages` each regex needs
+    consumers: dict[str, list[int]] = field(default_factory=dict)
+    # Range requests needed if each regex requested its own messages (Still merging adjacent ones)
+    separate_requests: int = 0
+
+    @property
+    def saved_requests(self) -> int:
+        """Range requests saved over requesting each regex on its own"""
+        return self.separate_requests - len(self.requests)
+
+    @property
+    def saved_idx_reads(self) -> int:
+        """.idx downloads saved over searching the file once per regex"""
+        return max(len(self.consumers) - 1, 0)
+
+    def read(self, read_range: Callable[[int, int], bytes]) -> list[bytes]:
+        """Makes each request and cuts the messages out of the returned bytes.
+
+        Args:
+            read_range (Callable[[int, int], bytes]): Reads the bytes from start to end (Exclusive) of the file
+
+        Returns:
+            list[bytes]: Bytes of each message, in the order of `messages`
+        """
+        buffers = []
+        starts = self.messages['start_byte'].to_numpy()
+        ends = self.messages['end_byte'].to_numpy()
+
+        i = 0
+        for start, end in self.requests:
+            data = read_range(start, end)
+            while i < len(starts) and ends[i] <= end:
+                buffers.append(data[starts[i] - start:ends[i] - start])
+                i += 1
+        return buffers
+
+def coalesce(ranges: list[tuple[int, int]], max_gap: int = 0) -> list[tuple[int, int]]:
+    """Merges overlapping and adjacent byte ranges into the fewest ranges.
+
+    Args:
+        ranges (list[tuple[int, int]]): (start, end) byte ranges, end exclusive
+        max_gap (int, optional): Ranges less than this many bytes apart are also merged, reading the bytes between
+            them costs less than another round trip. Defaults to 0.
+
+    Returns:
+        list[tuple[int, int]]: Sorted merged ranges
+    """
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + max_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def plan_requests(idx: pd.DataFrame, regexes: list[str], max_gap: int = 0) -> RangePlan:
+    """Plans the range requests for the messages each of the given regexes matches in a parsed .idx file.
+
+    Args:
+        idx (pd.DataFrame): Parsed .idx file with 'search_this', 'start_byte' and 'end_byte' (Exclusive) columns
+        regexes (list[str]): Regexes to match against `search_this`, like Herbie's search
+        max_gap (int, optional): Max bytes between messages requested together (See `coalesce`). Defaults to 0.
+
+    Returns:
+        RangePlan: Requests covering the union of the matched messages
+    """
+    matches = {r: idx['search_this'].str.contains(r, regex=True).to_numpy() for r in regexes}
+
+    union = np.logical_or.reduce(list(matches.values())) if matches else np.zeros(len(idx), dtype=bool)
+    matched = idx[union].sort_values('start_byte')
+    messages = matched.reset_index(drop=True)
+
+    # Position of each matched .idx row in `messages`
+    positions = pd.Series(np.arange(len(matched)), index=matched.index)
+
+    separate = 0
+    consumers = {}
+    for r, m in matches.items():
+        rows = idx[m]
+        separate += len(coalesce(list(zip(rows['start_byte'], rows['end_byte'])), max_gap))
+        consumers[r] = sorted(positions[idx.index[m]].to_list())
+
+    requests = coalesce(list(zip(messages['start_byte'], messages['end_byte'])), max_gap)
+    return RangePlan(messages, requests, consumers, separate)
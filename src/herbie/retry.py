@@ -0,0 +1,169 @@
+import logging
+import os
+import random
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional
+
+import pandas as pd
+
+from src.herbie.fetch_pool import FetchJob
+
+@dataclass
+class RetryPolicy():
+    """How failed or timed out fetch jobs are retried. Each retry waits `base_delay * 2^(attempt - 1)` seconds
+    (Capped at `max_delay`, with jitter so retries of different jobs don't line up), and each attempt gets double
+    the timeout of the one before it. When `hedge` is True, a duplicate of a job that is slower than usual is
+    submitted and whichever finishes first is used."""
+    max_attempts: int = 3
+    base_delay: float = 5.0
+    max_delay: float = 60.0
+    hedge: bool = False
+
+    def delay(self, attempt: int) -> float:
+        """Gets how long to wait before the given attempt
+
+        Args:
+            attempt (int): Attempt number, the first retry is attempt 1
+
+        Returns:
+            float: Seconds to wait
+        """
+        delay = min(self.base_delay * 2**(attempt - 1), self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+class LatencyTracker():
+    def __init__(self, initial_timeout: float = 75.0, min_timeout: float = 15.0, max_timeout: float = 300.0,
+                 alpha: float = 0.125, beta: float = 0.25, k: float = 4.0):
+        """Tracks how long fetch jobs take with a smoothed mean and mean deviation (Like TCP retransmission timers),
+        so timeouts follow the observed latency instead of a fixed window.
+
+        Args:
+            initial_timeout (float, optional): Timeout used until a job has finished. Defaults to 75.0.
+            min_timeout (float, optional): Smallest timeout. Defaults to 15.0.
+            max_timeout (float, optional): Largest timeout. Defaults to 300.0.
+            alpha (float, optional): Weight of new observations in the mean. Defaults to 0.125.
+            beta (float, optional): Weight of new observations in the deviation. Defaults to 0.25.
+            k (float, optional): Number of deviations above the mean a job can take before timing out. Defaults to 4.0.
+        """
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+        self.mean: Optional[float] = None
+        self.deviation = 0.0
+        self.n_observed = 0
+
+    def observe(self, seconds: float) -> None:
+        """Adds the latency of a finished job.
+
+        Args:
+            seconds (float): How long the job took
+        """
+        if self.mean is None:
+            self.mean = seconds
+            self.deviation = seconds / 2
+        else:
+            self.deviation = (1 - self.beta) * self.deviation + self.beta * abs(self.mean - seconds)
+            self.mean = (1 - self.alpha) * self.mean + self.alpha * seconds
+        self.n_observed += 1
+
+    def timeout(self, attempt: int = 0) -> float:
+        """Gets the timeout of a job, doubled for each previous attempt.
+
+        Args:
+            attempt (int, optional): Number of previous attempts. Defaults to 0.
+
+        Returns:
+            float: Timeout in seconds
+        """
+        base = self.initial_timeout if self.mean is None else self.mean + self.k * self.deviation
+        return min(max(base * 2**attempt, self.min_timeout), self.max_timeout)
+
+    @property
+    def hedge_delay(self) -> float:
+        """How long a job can run before a duplicate is submitted, about the slowest few percent of jobs."""
+        if self.mean is None:
+            return self.timeout() / 2
+        return self.mean + 2 * self.deviation
+
+@dataclass
+class JobState():
+    """Progress of one (regex, date slice) job of an interval, across its attempts."""
+    job: FetchJob
+    futures: list[Future] = field(default_factory=list)
+    attempt: int = 0
+    started: float = 0.0
+    submitted_at: float = 0.0
+    retry_at: Optional[float] = None
+    hedged: bool = False
+    result: Optional[pd.DataFrame] = None
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+class PieceStore():
+    def __init__(self, root: str):
+        """Keeps the data of jobs that succeeded when the rest of their interval failed, so refetching the interval
+        only reruns the jobs that failed. Pieces are keyed by `FetchJob.key`.
+
+        Args:
+            root (str): Directory to store pieces in
+        """
+        self.__logger = logging.getLogger(__name__)
+        self.root = root
+
+    def get(self, job: FetchJob) -> Optional[pd.DataFrame]:
+        """Gets the salvaged data for the given job.
+
+        Args:
+            job (FetchJob): Job to get data for
+
+        Returns:
+            Optional[pd.DataFrame]: Data of the job, or `None` if it wasn't salvaged
+        """
+        fp = self.__path(job.key)
+        if not os.path.exists(fp):
+            return None
+        try:
+            return pd.read_parquet(fp)
+        except Exception as e:
+            self.__logger.warning(f"Couldn't read salvaged piece {fp}, it will be refetched. Error: {e}")
+            return None
+
+    def put(self, job: FetchJob, df: pd.DataFrame) -> None:
+        """Salvages the data of a job.
+
+        Args:
+            job (FetchJob): Job the data is from
+            df (pd.DataFrame): Data returned by the job
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fp = self.__path(job.key)
+        if os.path.exists(fp):
+            return
+        try:
+            df.to_parquet(f"{fp}.tmp")
+            os.replace(f"{fp}.tmp", fp)
+        except Exception as e:
+            # Salvaging is best effort, the job is just refetched
+            self.__logger.warning(f"Couldn't salvage data for {job.search_regex}. Error: {e}")
+
+    def discard(self, jobs: list[FetchJob]) -> None:
+        """Removes the salvaged data of the given jobs, once their interval has been saved.
+
+        Args:
+            jobs (list[FetchJob]): Jobs to remove data for
+        """
+        for job in jobs:
+            try:
+                os.remove(self.__path(job.key))
+            except FileNotFoundError:
+                pass
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.parquet")
@@ -0,0 +1,106 @@
+from dataclasses import dataclass, field
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+# Column buffers start on 8 byte boundaries so every dtype can be viewed in place
+ALIGN = 8
+
+@dataclass
+class SharedColumn():
+    name: str
+    dtype: str
+    offset: int
+
+@dataclass
+class SharedFrame():
+    """Handle to a DataFrame whose columns live in a shared memory block. Only this handle is pickled
+    when a worker returns data, the column data itself is never serialized.
+
+    Numeric and datetime columns are stored in the block, any other (object) columns are small coordinate
+    columns and are sent with the handle.
+    """
+    shm_name: str
+    n_rows: int
+    columns: list[SharedColumn]
+    index_cols: list[str]
+    objects: dict[str, list[Any]] = field(default_factory=dict)
+    column_order: list[str] = field(default_factory=list)
+    # Anything the sender wants to pass along with the data, like how long it took to produce
+    stats: Any = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SharedFrame":
+        """Copies the given DataFrame into a new shared memory block. The block stays alive after the calling
+        process closes it, and is freed by `to_frame` or `release` in the receiving process.
+
+        Args:
+            df (pd.DataFrame): DataFrame to share
+
+        Returns:
+            SharedFrame: Handle to the shared data
+        """
+        index_cols = [n for n in df.index.names if n is not None]
+        flat = df.reset_index() if index_cols else df
+
+        arrays = {}
+        objects = {}
+        for c in flat.columns:
+            values = flat[c].to_numpy()
+            if values.dtype == object:
+                objects[c] = values.tolist()
+            else:
+                arrays[c] = np.ascontiguousarray(values)
+
+        columns = []
+        offset = 0
+        for name, values in arrays.items():
+            columns.append(SharedColumn(name, values.dtype.str, offset))
+            offset += -(-values.nbytes // ALIGN) * ALIGN
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            for col in columns:
+                values = arrays[col.name]
+                np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=col.offset)[:] = values
+        finally:
+            shm.close()
+
+        # The receiving process owns the block, otherwise this process's resource tracker would unlink it again on exit
+        resource_tracker.unregister(shm._name, "shared_memory") # type: ignore
+
+        return cls(shm.name, flat.shape[0], columns, index_cols, objects, list(flat.columns))
+
+    def to_frame(self) -> pd.DataFrame:
+        """Builds the DataFrame from the shared memory block and frees the block.
+
+        Returns:
+            pd.DataFrame: Shared DataFrame, with the same index as the original
+        """
+        shm = shared_memory.SharedMemory(name=self.shm_name)
+        try:
+            data = {}
+            for col in self.columns:
+                # Copied out once, the block is unlinked below
+                data[col.name] = np.ndarray((self.n_rows,), dtype=np.dtype(col.dtype), buffer=shm.buf, offset=col.offset).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+        data.update(self.objects)
+        df = pd.DataFrame(data, copy=False)[self.column_order]
+
+        if self.index_cols:
+            df = df.set_index(self.index_cols)
+        return df
+
+    def release(self) -> None:
+        """Frees the shared memory block without reading it."""
+        try:
+            shm = shared_memory.SharedMemory(name=self.shm_name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,866 @@
+import hashlib
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import uuid
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import HRRR_ZARR_URL, POINT_INTERPOLATION, POINT_WEIGHTS_DIR
+from src.herbie.merge import MERGE_KEY, REGION_KEY, merge_frames
+from src.herbie.metrics import StageTimes
+from src.herbie.ranges import plan_requests
+from src.herbie.weights import PointWeights, WeightCache
+
+if TYPE_CHECKING:
+    import fsspec
+    import xarray as xr
+
+    from src.herbie.fetch_pool import FetchJob
+
+# Backends (Herbie, Zarr, fsspec) are imported by the source that uses them, so a source only needs its own installed
+
+class DataSource():
+    """Where `FetchJob`s get their data from. Sources are pickled and sent to worker processes with each job,
+    so they should only hold settings, not open files or connections."""
+
+    # Whether jobs with `consumers` read the messages of every regex in one pass (One .idx read and coalesced range
+    # requests), so fetching the regexes of an interval together is cheaper than fetching them in separate jobs
+    coalesces_regexes = False
+
+    def fetch(self, job: "FetchJob", stages: Optional[StageTimes] = None) -> Optional[pd.DataFrame]:
+        """Gets the data for the jobs search regex at each of its dates and fxx, for each of its coords. Jobs with `bounds`
+        get every grid cell inside the bounds instead, with 'y' and 'x' columns counting cells from the corner of the crop.
+
+        Args:
+            job (FetchJob): Job to get data for
+            stages (Optional[StageTimes], optional): Records how long each stage of the fetch takes. Defaults to None.
+
+        Returns:
+            Optional[pd.DataFrame]: Data for each coord (Or grid cell), or `None` if no data was found
+        """
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Runs in each worker process of a `FetchPool` as it starts, so imports and setup the source needs are paid
+        before its first job instead of during it. Does nothing by default."""
+
+class HerbieSource(DataSource):
+    """Gets HRRR data from the archive with Herbie, using the jobs `GribCache` if it has one."""
+    coalesces_regexes = True
+
+    def __init__(self, interpolation: Optional[str] = POINT_INTERPOLATION, weights_dir: str = POINT_WEIGHTS_DIR):
+        """Points are taken from the decoded fields with precomputed sparse weights (See `WeightCache`), so the
+        grid is searched once per coordinate set instead of once per fetch.
+
+        Args:
+            interpolation (Optional[str], optional): "nearest", "idw" or "bilinear" (See `compute_weights`), or `None`
+                to use Herbie's pick_points. Defaults to POINT_INTERPOLATION.
+            weights_dir (str, optional): Directory the weights are cached in. Defaults to POINT_WEIGHTS_DIR.
+        """
+        self.interpolation = interpolation
+        self.weights_dir = weights_dir
+
+    def warm_up(self) -> None:
+        # The GRIB decoding stack is slow to import
+        import cfgrib  # noqa: F401
+        import xarray  # noqa: F401
+
+    def fetch(self, job: "FetchJob", stages: Optional[StageTimes] = None) -> Optional[pd.DataFrame]:
+        from herbie.fast import FastHerbie
+
+        stages = stages if stages is not None else StageTimes()
+
+        if job.consumers:
+            return self.__fetch_coalesced(job, stages)
+
+        kwargs = {}
+        if job.cache is not None:
+            # Download into a job specific directory, so nothing is left behind outside of the cache
+            kwargs['save_dir'] = job.cache.staging_path(uuid.uuid4().hex)
+
+        try:
+            with stages.time("download"):
+                fh = FastHerbie(DATES=job.dates, fxx=job.fxx, max_processes=10, product='sfc', **kwargs) # type: ignore
+
+                # Cached subsets are placed where Herbie looks for them, so only uncached subsets are downloaded
+                downloaded = job.cache.restore(fh.objects, job.search_regex) if job.cache is not None else {}
+
+                # Downloaded separately from decoding so each is timed on its own, xarray uses the local files
+                files = fh.download(search=job.search_regex)
+
+            new_files = downloaded.values() if job.cache is not None else files
+            stages.count("bytes_downloaded", sum(os.path.getsize(fp) for fp in new_files if os.path.exists(fp)))
+
+            with stages.time("decode"):
+                # Keep the downloaded files when caching, they're removed with the staging directory
+                data_set = fh.xarray(search=job.search_regex, remove_grib=job.cache is None)
+
+            df = self.__to_frame(data_set, job, job.search_regex, stages)
+
+            if job.cache is not None:
+                with stages.time("cache_store"):
+                    job.cache.store(downloaded)
+        finally:
+            if 'save_dir' in kwargs:
+                shutil.rmtree(kwargs['save_dir'], ignore_errors=True)
+        return df
+
+    def __fetch_coalesced(self, job: "FetchJob", stages: StageTimes) -> Optional[pd.DataFrame]:
+        """Fetches every regex of a job with `consumers` in one pass. Each file's .idx is read once, the messages
+        every regex needs are downloaded with coalesced range requests (See `plan_requests`), and each regex's
+        messages are written to the subset file Herbie would have downloaded for it, so decoding is unchanged.
+        cfgrib can't decode messages on different levels into one dataset, so each regex is still decoded on its own."""
+        from herbie.fast import FastHerbie
+
+        # Subsets are written before Herbie sees them, so Herbie won't remove them after decoding
+        save_dir = job.cache.staging_path(uuid.uuid4().hex) if job.cache is not None else tempfile.mkdtemp(prefix="herbie_")
+        frames = []
+        try:
+            with stages.time("download"):
+                fh = FastHerbie(DATES=job.dates, fxx=job.fxx, max_processes=10, product='sfc', save_dir=save_dir) # type: ignore
+
+                downloaded = {}
+                n_bytes = 0
+                for H in fh.file_exists:
+                    if job.cache is not None:
+                        for r in job.consumers: # type: ignore
+                            downloaded.update(job.cache.restore([H], r))
+
+                    # Regexes whose subset isn't cached
+                    regexes = [r for r in job.consumers if not os.path.exists(H.get_localFilePath(r))] # type: ignore
+                    if len(regexes) == 0:
+                        continue
+
+                    try:
+                        idx = H.index_as_dataframe.copy()
+                    except Exception:
+                        # No index file, Herbie downloads what it can when decoding
+                        continue
+
+                    # Herbie's end bytes are inclusive and the last message has none (It runs to the end of the file)
+                    idx['end_byte'] = (idx['end_byte'] + 1).fillna(_FILE_END).astype(np.int64)
+                    plan = plan_requests(idx, regexes)
+
+                    stages.count("idx_reads")
+                    stages.count("idx_reads_separate", len(regexes))
+                    stages.count("range_requests", len(plan.requests))
+                    stages.count("range_requests_separate", plan.separate_requests)
+
+                    if plan.messages.empty:
+                        continue
+
+                    buffers = plan.read(lambda start, end: _read_range(str(H.grib), start, end))
+                    n_bytes += sum(len(b) for b in buffers)
+
+                    for r in regexes:
+                        fp = str(H.get_localFilePath(r))
+                        os.makedirs(os.path.dirname(fp), exist_ok=True)
+                        with open(fp, "wb") as file:
+                            file.writelines(buffers[i] for i in plan.consumers[r])
+
+            stages.count("bytes_downloaded", n_bytes)
+
+            for r in job.consumers: # type: ignore
+                with stages.time("decode"):
+                    data_set = fh.xarray(search=r, remove_grib=False)
+                df = self.__to_frame(data_set, job, r, stages)
+                if df is not None:
+                    frames.append(df)
+
+            if job.cache is not None:
+                with stages.time("cache_store"):
+                    job.cache.store(downloaded)
+        finally:
+            shutil.rmtree(save_dir, ignore_errors=True)
+
+        if len(frames) == 0:
+            return None
+        columns = list(dict.fromkeys(c for df in frames for c in df.columns))
+        return merge_frames(frames, columns, REGION_KEY if job.bounds is not None else MERGE_KEY)[0]
+
+    def __to_frame(self, data_set: "xr.Dataset", job: "FetchJob", search_regex: str, stages: StageTimes) -> Optional[pd.DataFrame]:
+        """Takes the jobs coords (Or bounds) from the fields decoded for one search regex"""
+        if "WIND" in search_regex:
+            with stages.time("with_wind"):
+                data_set = data_set.herbie.with_wind()
+
+        if not data_set:
+            warnings.warn(f"No data found for {job.dates}, regex: {search_regex}")
+            return None
+
+        if job.bounds is not None:
+            with stages.time("crop"):
+                ys, xs = crop_slices(data_set['latitude'].values, data_set['longitude'].values, job.bounds)
+                point_ds = data_set.isel(y=ys, x=xs)
+        elif self.interpolation is None:
+            with stages.time("pick_points"):
+                point_ds = data_set.herbie.pick_points(job.coords)
+        else:
+            with stages.time("pick_points"):
+                weights = WeightCache(self.weights_dir).get(data_set['latitude'].values, data_set['longitude'].values,
+                                                            job.coords, self.interpolation)
+                point_ds = _weighted_points(data_set, weights)
+
+        with stages.time("to_dataframe"):
+            # xarray datasets can't be pickled, so convert to dataframe
+            df = point_ds.to_dataframe()
+            if job.bounds is not None:
+                # y and x have no coordinates, so they're numbered from the corner of the crop
+                df = df.reset_index()
+            elif self.interpolation is not None:
+                df = _as_picked_points(df.reset_index(), job, stages)
+        return df
+
+# (variable, level, cfgrib short name, mean, daily amplitude) of each message in a synthetic file
+LOCAL_MESSAGES = [
+    ("TMP", "surface", "t", 268.0, 6.0),
+    ("SNOD", "surface", "sde", 1.2, 0.0),
+    ("PRATE", "surface", "prate", 0.0001, 0.0001),
+    ("APCP", "surface", "tp", 0.4, 0.4),
+    ("ASNOW", "surface", "asnow", 0.004, 0.004),
+    ("DSWRF", "surface", "sdswrf", 150.0, 150.0),
+    ("USWRF", "surface", "suswrf", 100.0, 100.0),
+    ("DLWRF", "surface", "sdlwrf", 250.0, 20.0),
+    ("ULWRF", "surface", "sulwrf", 280.0, 20.0),
+    ("TMP", "2 m above ground", "t2m", 270.0, 6.0),
+    ("RH", "2 m above ground", "r2", 75.0, 15.0),
+    ("UGRD", "10 m above ground", "u10", 2.0, 3.0),
+    ("VGRD", "10 m above ground", "v10", 1.0, 3.0),
+    ("WIND", "10 m above ground", "max_10si", 8.0, 4.0),
+    # Messages no regex asks for, so searches have to skip over them like they do in real files
+    ("HGT", "500 mb", "gh", 5500.0, 20.0),
+    ("TMP", "500 mb", "t500", 250.0, 2.0),
+    ("REFC", "entire atmosphere", "refc", 0.0, 10.0),
+]
+
+class LocalSource(DataSource):
+    coalesces_regexes = True
+
+    def __init__(self, root: str, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 bounds: tuple[float, float, float, float] = (47.5, -115.5, 49.0, -113.0), shape: tuple[int, int] = (60, 60),
+                 request_latency: float = 0.0, interpolation: str = "nearest"):
+        """Stand-in for the HRRR archive that serves synthetic files from disk, so fetching can be run and measured
+        without network access. Each model run/fxx has a file named like the HRRR file it stands in for and a
+        wgrib2 style .idx file listing the byte range of each message, and searches read only the byte ranges whose
+        .idx line matches the search regex, the same way Herbie downloads subsets. Messages are raw float32 grids on a
+        regular lat/lon grid rather than GRIB2 encoded, since encoding GRIB2 needs eccodes.
+
+        Jobs with `consumers` (Several regexes fetched together) parse each .idx once and request the union of the
+        messages every regex needs, merging adjacent messages into one range request (See `plan_requests`).
+
+        Files are created the first time they're needed (Or ahead of time with `populate`), values are generated
+        from the run time so every fetch of the same run returns the same data.
+
+        Args:
+            root (str): Directory to serve files from
+            latency (float, optional): Seconds each fetch waits before reading, like a request round trip. Defaults to 0.0.
+            jitter (float, optional): Max random seconds added to `latency`. Defaults to 0.0.
+            failure_rate (float, optional): Chance (0-1) that a fetch raises a `ConnectionError`. Defaults to 0.0.
+            bounds (tuple[float, float, float, float], optional): (min lat, min lon, max lat, max lon) of the grid. Defaults to northwest Montana.
+            shape (tuple[int, int], optional): Number of (lat, lon) grid cells. Defaults to (60, 60).
+            request_latency (float, optional): Seconds each .idx read and range request waits, like the round trip
+                of a HTTP request. Defaults to 0.0.
+            interpolation (str, optional): How point values are taken from the grid, see `compute_weights`. Weights
+                are cached in `root`. Defaults to "nearest".
+        """
+        self.root = root
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.bounds = bounds
+        self.shape = shape
+        self.request_latency = request_latency
+        self.interpolation = interpolation
+        os.makedirs(self.root, exist_ok=True)
+        # Bytes read by each fetch are appended here, since fetches run in worker processes
+        self.read_log = os.path.join(self.root, "_reads.log")
+
+    def fetch(self, job: "FetchJob", stages: Optional[StageTimes] = None) -> Optional[pd.DataFrame]:
+        stages = stages if stages is not None else StageTimes()
+
+        with stages.time("download"):
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+            if random.random() < self.failure_rate:
+                raise ConnectionError(f"Injected failure for {min(job.dates)}-{max(job.dates)}, regex: {job.search_regex}")
+
+        fxxs = job.fxx if isinstance(job.fxx, list) else [job.fxx]
+        consumers = job.consumers if job.consumers else [job.search_regex]
+        grid_lats, grid_lons = np.meshgrid(self.__lats(), self.__lons(), indexing='ij')
+        weights = None
+        if job.bounds is not None:
+            ys, xs = crop_slices(grid_lats, grid_lons, job.bounds)
+            lat_idx, lon_idx = [a.ravel() for a in np.mgrid[ys, xs]]
+            corner = (ys.start, xs.start)
+        else:
+            weights = WeightCache(os.path.join(self.root, "_weights")).get(grid_lats, grid_lons, job.coords, self.interpolation)
+            lat_idx, lon_idx = weights.y, weights.x
+            corner = (0, 0)
+        n_points = len(lat_idx)
+
+        frames = []
+        n_bytes = 0
+        for date in job.dates:
+            for fxx in fxxs:
+                with stages.time("download"):
+                    fp = self.populate([date], [fxx])[0]
+                    time.sleep(self.request_latency)
+                    plan = plan_requests(self.read_idx(f"{fp}.idx"), consumers)
+
+                    # Requests that every regex would have made on its own, to measure what coalescing saves
+                    stages.count("idx_reads")
+                    stages.count("idx_reads_separate", len(consumers))
+                    stages.count("range_requests", len(plan.requests))
+                    stages.count("range_requests_separate", plan.separate_requests)
+
+                    matches = plan.messages
+                    if matches.empty:
+                        continue
+
+                    with open(fp, "rb") as file:
+                        def read_range(start: int, end: int) -> bytes:
+                            time.sleep(self.request_latency)
+                            file.seek(start)
+                            return file.read(end - start)
+
+                        buffers = plan.read(read_range)
+                    n_bytes += sum(len(b) for b in buffers)
+
+                with stages.time("decode"):
+                    row = {
+                        'point': np.arange(n_points),
+                        'time': pd.Timestamp(date),
+                        'step': pd.Timedelta(hours=int(fxx)),
+                        'valid_time': pd.Timestamp(date) + pd.Timedelta(hours=int(fxx)),
+                        'latitude': self.__lats()[lat_idx],
+                        'longitude': self.__lons()[lon_idx],
+                        'y': lat_idx - corner[0],
+                        'x': lon_idx - corner[1],
+                    }
+                    for (_, msg), buffer in zip(matches.iterrows(), buffers):
+                        grid = np.frombuffer(buffer, dtype=np.float32).reshape(self.shape)
+                        row[msg['name']] = grid[lat_idx, lon_idx] if weights is None else weights.apply(grid)
+
+                        # Level coordinate cfgrib adds for the message
+                        if msg['level'] == "surface":
+                            row['surface'] = 0.0
+                        elif msg['level'].endswith("m above ground"):
+                            row['heightAboveGround'] = float(msg['level'].split(" ")[0])
+                    frames.append(pd.DataFrame(row))
+
+        stages.count("bytes_downloaded", n_bytes)
+        with open(self.read_log, "a") as file:
+            file.write(f"{n_bytes}\n")
+
+        if len(frames) == 0:
+            warnings.warn(f"No data found for {job.dates}, regex: {job.search_regex}")
+            return None
+
+        with stages.time("to_dataframe"):
+            df = pd.concat(frames, ignore_index=True)
+
+        if job.bounds is not None:
+            return _as_region(df, job, stages)
+        return _as_picked_points(df, job, stages)
+
+    def populate(self, dates: list[datetime], fxx: list[int]) -> list[str]:
+        """Creates the files for the given runs and fxx if they don't exist.
+
+        Args:
+            dates (list[datetime]): Model run times
+            fxx (list[int]): Forecast hours
+
+        Returns:
+            list[str]: File path of each run/fxx
+        """
+        fps = []
+        for date in dates:
+            for f in fxx:
+                fp = os.path.join(self.root, "hrrr", pd.Timestamp(date).strftime("%Y%m%d"), f"hrrr.t{pd.Timestamp(date).hour:02d}z.wrfsfcf{int(f):02d}.grib2")
+                if not os.path.exists(f"{fp}.idx"):
+                    self.__write(fp, pd.Timestamp(date), int(f))
+                fps.append(fp)
+        return fps
+
+    def bytes_read(self) -> int:
+        """Gets the total bytes read by fetches so far.
+
+        Returns:
+            int: Bytes read
+        """
+        if not os.path.exists(self.read_log):
+            return 0
+        with open(self.read_log, "r") as file:
+            return sum(int(line) for line in file if line.strip())
+
+    def write_zarr(self, root: str, dates: list[datetime], fxx: list[int], chunks: tuple[int, int] = (20, 20)) -> "ZarrSource":
+        """Writes the given runs to a Zarr archive laid out like hrrrzarr (One store per run, one array per variable
+        and a chunk index with the grid), so `ZarrSource` can be run against the same data as this source.
+
+        Args:
+            root (str): Directory to write the archive to
+            dates (list[datetime]): Model run times
+            fxx (list[int]): Forecast hours, fxx 0 is written to the analysis stores and the rest to the forecast stores
+            chunks (tuple[int, int], optional): (y, x) cells in each chunk. Defaults to (20, 20).
+
+        Returns:
+            ZarrSource: Source reading the archive
+        """
+        import zarr
+
+        # hrrrzarr is in the Zarr v2 format, which zarr 3 only writes when asked to
+        fmt = {"zarr_format": 2} if int(zarr.__version__.split(".")[0]) >= 3 else {}
+
+        lats, lons = np.meshgrid(self.__lats(), self.__lons(), indexing='ij')
+        grid_path = os.path.join(root, "grid", "HRRR_chunk_index.zarr")
+        zarr.open_group(store=grid_path, mode='w', **fmt)
+        for name, values in (('latitude', lats), ('longitude', lons)):
+            zarr.open_array(store=os.path.join(grid_path, name), mode='w', shape=values.shape, chunks=self.shape, dtype=values.dtype, **fmt)[:] = values
+
+        for date in dates:
+            run = pd.Timestamp(date)
+            for kind, kind_fxx in (("anl", [f for f in fxx if f == 0]), ("fcst", sorted(f for f in fxx if f > 0))):
+                if len(kind_fxx) == 0:
+                    continue
+                store = os.path.join(root, "sfc", run.strftime('%Y%m%d'), f"{run.strftime('%Y%m%d_%H')}z_{kind}.zarr")
+                fps = self.populate([run], kind_fxx)
+
+                for var, level, zarr_level, zarr_var, _ in ZARR_MESSAGES:
+                    # Accumulations and maximums are only in the forecast stores
+                    if kind == "anl" and zarr_var != var:
+                        continue
+
+                    fields = np.full((max(max(kind_fxx), 1),) + self.shape, np.nan, dtype=np.float32)
+                    for f, fp in zip(kind_fxx, fps):
+                        idx = self.read_idx(f"{fp}.idx")
+                        msg = idx[(idx['variable'] == var) & (idx['level'] == level)].iloc[0]
+                        with open(fp, "rb") as file:
+                            file.seek(msg['start_byte'])
+                            fields[max(f - 1, 0)] = np.frombuffer(file.read(msg['end_byte'] - msg['start_byte']), dtype=np.float32).reshape(self.shape)
+
+                    path = os.path.join(store, zarr_level, zarr_var, zarr_level, zarr_var)
+                    if kind == "anl":
+                        zarr.open_array(store=path, mode='w', shape=self.shape, chunks=chunks, dtype=np.float32, **fmt)[:] = fields[0]
+                    else:
+                        zarr.open_array(store=path, mode='w', shape=fields.shape, chunks=(fields.shape[0],) + chunks, dtype=np.float32, **fmt)[:] = fields
+        return ZarrSource(root)
+
+    @staticmethod
+    def read_idx(fp: str) -> pd.DataFrame:
+        """Reads a wgrib2 style .idx file (`n:start_byte:d=YYYYMMDDHH:VAR:level:forecast:name`).
+
+        Args:
+            fp (str): File path of .idx file
+
+        Returns:
+            pd.DataFrame: One row per message with its byte range and the `search_this` string regexes are matched against
+        """
+        rows = []
+        with open(fp, "r") as file:
+            for line in file:
+                _, start, _, var, level, forecast, name = line.rstrip("\n").split(":")
+                rows.append((int(start), var, level, forecast, name))
+        idx = pd.DataFrame(rows, columns=['start_byte', 'variable', 'level', 'forecast_time', 'name'])
+        idx['end_byte'] = idx['start_byte'].shift(-1, fill_value=os.path.getsize(fp[:-len(".idx")])).astype(int)
+        idx['search_this'] = ":" + idx['variable'] + ":" + idx['level'] + ":" + idx['forecast_time']
+        return idx
+
+    def __write(self, fp: str, run: pd.Timestamp, fxx: int) -> None:
+        """Writes the synthetic file and .idx for one run/fxx"""
+        valid = run + pd.Timedelta(hours=fxx)
+        seed = int(hashlib.sha256(f"{run.isoformat()}:{fxx}".encode()).hexdigest()[:8], 16)
+        rng = np.random.default_rng(seed)
+
+        lats = self.__lats()[:, None]
+        lons = self.__lons()[None, :]
+        daily = np.sin((valid.hour - 9) / 24 * 2 * np.pi)
+
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        lines = []
+        offset = 0
+        tmp_fp = f"{fp}.{os.getpid()}.tmp"
+        with open(tmp_fp, "wb") as file:
+            for n, (var, level, name, mean, amplitude) in enumerate(LOCAL_MESSAGES):
+                # Smooth field that varies with location and time of day, plus some noise
+                field = mean + amplitude * daily + 0.1 * amplitude * np.sin(lats * 3 + lons * 2) + rng.normal(0, 0.05 * amplitude + 1e-6, self.shape)
+                if mean >= 0 and name not in ('u10', 'v10'):
+                    field = np.abs(field)
+                buffer = field.astype(np.float32).tobytes()
+                file.write(buffer)
+
+                forecast = f"0-{fxx} hour acc fcst" if var in ("APCP", "ASNOW") else f"{fxx} hour fcst"
+                lines.append(f"{n + 1}:{offset}:d={run.strftime('%Y%m%d%H')}:{var}:{level}:{forecast}:{name}\n")
+                offset += len(buffer)
+
+        with open(f"{tmp_fp}.idx", "w") as file:
+            file.writelines(lines)
+
+        # Other workers may be writing the same file, whichever finishes last wins with identical content.
+        # The .idx is moved last, since it's what readers look for
+        os.replace(tmp_fp, fp)
+        os.replace(f"{tmp_fp}.idx", f"{fp}.idx")
+
+    def __lats(self) -> np.ndarray:
+        return np.linspace(self.bounds[0], self.bounds[2], self.shape[0])
+
+    def __lons(self) -> np.ndarray:
+        return np.linspace(self.bounds[1], self.bounds[3], self.shape[1])
+
+# (variable, level) of each message searched for in the hrrrzarr archive, the (level, variable) names of its array
+# in the archive and the cfgrib short name Herbie gives it
+ZARR_MESSAGES = [
+    ("TMP", "surface", "surface", "TMP", "t"),
+    ("SNOD", "surface", "surface", "SNOD", "sde"),
+    ("PRATE", "surface", "surface", "PRATE", "prate"),
+    ("APCP", "surface", "surface", "APCP_1hr_acc_fcst", "tp"),
+    ("DSWRF", "surface", "surface", "DSWRF", "sdswrf"),
+    ("USWRF", "surface", "surface", "USWRF", "suswrf"),
+    ("DLWRF", "surface", "surface", "DLWRF", "sdlwrf"),
+    ("ULWRF", "surface", "surface", "ULWRF", "sulwrf"),
+    ("TMP", "2 m above ground", "2m_above_ground", "TMP", "t2m"),
+    ("RH", "2 m above ground", "2m_above_ground", "RH", "r2"),
+    ("UGRD", "10 m above ground", "10m_above_ground", "UGRD", "u10"),
+    ("VGRD", "10 m above ground", "10m_above_ground", "VGRD", "v10"),
+    ("WIND", "10 m above ground", "10m_above_ground", "WIND_1hr_max_fcst", "max_10si"),
+]
+
+# Grid of each archive, kept for the life of the worker process
+_ZARR_GRIDS: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+class ZarrSource(DataSource):
+    def __init__(self, root: str = HRRR_ZARR_URL, max_threads: int = 16):
+        """Gets HRRR data from the hrrrzarr archive (https://mesowest.utah.edu/html/hrrr/), which stores each variable
+        of each model run as a Zarr array split into 150x150 cell chunks. Only the chunks covering the jobs coords (Or
+        the window of its bounds, see `crop_slices`) are read and decoded, instead of whole CONUS fields like GRIB2
+        subsets. Each (run, variable) array is read in its own thread, and the chunks of an array are fetched at once.
+
+        Forecast hours are read from the runs `_fcst.zarr` store (Whose time axis starts at fxx 1), fxx 0 from its
+        `_anl.zarr` store. Arrays missing from a store (Like accumulations in the analysis) are skipped.
+
+        Args:
+            root (str, optional): Root of the archive, a s3:// url or a local directory with the same layout
+                (See `LocalSource.write_zarr`). Defaults to HRRR_ZARR_URL.
+            max_threads (int, optional): Max arrays read at once by each job. Defaults to 16.
+        """
+        self.root = root.rstrip("/")
+        self.max_threads = max_threads
+
+    def fetch(self, job: "FetchJob", stages: Optional[StageTimes] = None) -> Optional[pd.DataFrame]:
+        stages = stages if stages is not None else StageTimes()
+
+        fxxs = [int(f) for f in (job.fxx if isinstance(job.fxx, list) else [job.fxx])]
+        messages = [m for m in ZARR_MESSAGES if re.search(job.search_regex, f":{m[0]}:{m[1]}")]
+        if len(messages) == 0:
+            warnings.warn(f"No zarr arrays match regex: {job.search_regex}")
+            return None
+
+        lats, lons = self.__grid()
+        if job.bounds is not None:
+            with stages.time("crop"):
+                ys, xs = crop_slices(lats, lons, job.bounds)
+                y_idx, x_idx = [a.ravel() for a in np.mgrid[ys, xs]]
+                corner = (ys.start, xs.start)
+                selection = (ys, xs)
+        else:
+            with stages.time("pick_points"):
+                y_idx, x_idx = self.__nearest(job.coords)
+                corner = (0, 0)
+                selection = (y_idx, x_idx)
+
+        reads = []
+        for date in job.dates:
+            for kind, kind_fxx in (("anl", [f for f in fxxs if f == 0]), ("fcst", [f for f in fxxs if f > 0])):
+                if len(kind_fxx) > 0:
+                    reads.extend((pd.Timestamp(date), kind, kind_fxx, m) for m in messages)
+
+        with stages.time("download"):
+            with ThreadPoolExecutor(max_workers=min(self.max_threads, len(reads))) as executor:
+                results = list(executor.map(lambda r: self.__read(*r, selection), reads))
+
+        frames = {}
+        for (run, _, kind_fxx, (_, level, _, _, name)), result in zip(reads, results):
+            if result is None:
+                continue
+            values, n_bytes, n_decoded = result
+            stages.count("bytes_downloaded", n_bytes)
+            stages.count("bytes_decoded", n_decoded)
+
+            for i, fxx in enumerate(kind_fxx):
+                row = frames.setdefault((run, fxx), {
+                    'point': np.arange(len(y_idx)),
+                    'time': run,
+                    'step': pd.Timedelta(hours=fxx),
+                    'valid_time': run + pd.Timedelta(hours=fxx),
+                    'latitude': lats[y_idx, x_idx],
+                    'longitude': lons[y_idx, x_idx],
+                    'y': y_idx - corner[0],
+                    'x': x_idx - corner[1],
+                })
+                row[name] = values[i]
+
+                # Level coordinate cfgrib adds for the message
+                if level == "surface":
+                    row['surface'] = 0.0
+                else:
+                    row['heightAboveGround'] = float(level.split(" ")[0])
+
+        if len(frames) == 0:
+            warnings.warn(f"No data found for {job.dates}, regex: {job.search_regex}")
+            return None
+
+        with stages.time("to_dataframe"):
+            df = pd.concat([pd.DataFrame(row) for _, row in sorted(frames.items(), key=lambda f: f[0])], ignore_index=True)
+
+        if job.bounds is not None:
+            return _as_region(df, job, stages)
+        return _as_picked_points(df, job, stages)
+
+    def __read(self, run: pd.Timestamp, kind: str, fxxs: list[int], message: tuple,
+               selection: tuple) -> Optional[tuple[np.ndarray, int, int]]:
+        """Reads the values of one variable of one run at the given grid cells, either (y, x) index arrays of single
+        cells or (y, x) slices of a window. Zarr only reads and decodes the chunks the selection touches.
+
+        Returns:
+            Optional[tuple[np.ndarray, int, int]]: Values of each fxx (fxx, cell), with a window's cells in row major
+                order, bytes read and bytes decoded, or `None` if the array doesn't exist
+        """
+        import zarr
+        from zarr.errors import ArrayNotFoundError
+
+        _, _, level, var, _ = message
+        url = f"{self.root}/sfc/{run.strftime('%Y%m%d')}/{run.strftime('%Y%m%d_%H')}z_{kind}.zarr/{level}/{var}/{level}/{var}"
+        store = _counting_store(self.__mapper(url))
+        try:
+            array = zarr.open_array(store=store, mode='r')
+        except (ArrayNotFoundError, FileNotFoundError, KeyError):
+            return None
+
+        window = isinstance(selection[0], slice)
+        if window:
+            n_cells = (selection[0].stop - selection[0].start) * (selection[1].stop - selection[1].start)
+        else:
+            y_idx, x_idx = selection
+            n_cells = len(y_idx)
+
+        if kind == "anl":
+            values = (array.get_orthogonal_selection(selection) if window else array.get_coordinate_selection(selection)).reshape(1, n_cells)
+        else:
+            # The time axis starts at fxx 1, and is shorter for runs that don't go out 48 hours
+            t_idx = np.array(fxxs) - 1
+            values = np.full((len(fxxs), n_cells), np.nan, dtype=np.float32)
+            valid = t_idx < array.shape[0]
+            if valid.any():
+                n_valid = int(valid.sum())
+                if window:
+                    cells = array.get_orthogonal_selection((t_idx[valid],) + selection)
+                else:
+                    cells = array.get_coordinate_selection((np.repeat(t_idx[valid], n_cells), np.tile(y_idx, n_valid), np.tile(x_idx, n_valid)))
+                values[valid] = cells.reshape(n_valid, n_cells)
+
+        chunk_bytes = int(np.prod(array.chunks)) * array.dtype.itemsize
+        return values, store.n_bytes, store.n_chunks * chunk_bytes
+
+    def __grid(self) -> tuple[np.ndarray, np.ndarray]:
+        """Gets the latitude and longitude of each grid cell from the archives chunk index"""
+        if self.root not in _ZARR_GRIDS:
+            import zarr
+            group = zarr.open_group(store=self.__mapper(f"{self.root}/grid/HRRR_chunk_index.zarr"), mode='r')
+            _ZARR_GRIDS[self.root] = (group['latitude'][:], group['longitude'][:])
+        return _ZARR_GRIDS[self.root]
+
+    def __nearest(self, coords: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """Gets the (y, x) indices of the grid cell closest to each coord"""
+        weights = WeightCache().get(*self.__grid(), coords, "nearest")
+        return weights.y, weights.x
+
+    def __mapper(self, url: str) -> "fsspec.FSMap":
+        import fsspec
+        return fsspec.get_mapper(url, anon=True) if url.startswith("s3://") else fsspec.get_mapper(url)
+
+# Store class of `_counting_store`, defined on first use since it subclasses a zarr class
+_COUNTING_STORE: Optional[type] = None
+
+# Keys of Zarr metadata documents (v2 and v3), every other key is a chunk
+_ZARR_METADATA_KEYS = {".zarray", ".zattrs", ".zgroup", ".zmetadata", "zarr.json"}
+
+def _counting_store(mapper: "fsspec.FSMap"):
+    """Wraps a fsspec mapper in a Zarr store that counts the bytes and chunks it fetched (`n_bytes`, `n_chunks`).
+    With zarr 2 the chunks of a read are fetched at once with the mappers `getitems`, zarr 3 fetches them
+    concurrently itself."""
+    global _COUNTING_STORE
+    if _COUNTING_STORE is None:
+        import zarr
+
+        if int(zarr.__version__.split(".")[0]) >= 3:
+            _COUNTING_STORE = _zarr3_counting_store()
+        else:
+            _COUNTING_STORE = _zarr2_counting_store()
+    return _COUNTING_STORE(mapper)
+
+def _zarr3_counting_store() -> type:
+    from zarr.storage import FsspecStore, WrapperStore
+
+    class CountingStore(WrapperStore):
+        def __init__(self, mapper):
+            super().__init__(FsspecStore.from_mapper(mapper, read_only=True))
+            self.n_bytes = 0
+            self.n_chunks = 0
+
+        async def get(self, key, prototype, byte_range=None):
+            value = await super().get(key, prototype, byte_range)
+            if value is not None:
+                self.n_bytes += len(value)
+                if key.rsplit("/", 1)[-1] not in _ZARR_METADATA_KEYS:
+                    self.n_chunks += 1
+            return value
+
+    return CountingStore
+
+def _zarr2_counting_store() -> type:
+    from zarr.storage import KVStore
+
+    class CountingStore(KVStore):
+        def __init__(self, mapper):
+            super().__init__(mapper)
+            self.n_bytes = 0
+            self.n_chunks = 0
+
+        def __getitem__(self, key):
+            value = self._mutable_mapping[key]
+            self.n_bytes += len(value)
+            return value
+
+        def getitems(self, keys, *, contexts):
+            values = self._mutable_mapping.getitems(list(keys), on_error="omit")
+            self.n_bytes += sum(len(v) for v in values.values())
+            self.n_chunks += len(values)
+            return values
+
+    return CountingStore
+
+def _as_picked_points(df: pd.DataFrame, job: "FetchJob", stages: StageTimes) -> pd.DataFrame:
+    """Adds the wind and point columns of Herbie's `with_wind` and `pick_points` to the values sources read
+    at each point, so every source returns the same frame.
+
+    Args:
+        df (pd.DataFrame): One row per point, run and fxx, with a 'point' column (Position in the jobs coords)
+        job (FetchJob): Job the values were read for
+        stages (StageTimes): Stage times of the job
+
+    Returns:
+        pd.DataFrame: Values indexed by (point, time, step)
+    """
+    _with_wind(df, job, stages)
+
+    with stages.time("pick_points"):
+        # Match the columns and index of Herbie's pick_points output
+        for c in job.coords.columns:
+            if c != 'geometry':
+                df[f"point_{c}"] = job.coords[c].to_numpy()[df['point'].to_numpy()]
+        if 'point_grid_distance' not in df.columns:
+            df['point_grid_distance'] = 0.0
+        df['gribfile_projection'] = None
+    return df.set_index(['point', 'time', 'step'])
+
+def _as_region(df: pd.DataFrame, job: "FetchJob", stages: StageTimes) -> pd.DataFrame:
+    """Adds the wind columns of Herbie's `with_wind` to the values sources read at each cell of a jobs bounds,
+    so every source returns the same frame.
+
+    Args:
+        df (pd.DataFrame): One row per grid cell, run and fxx, with 'y' and 'x' columns
+        job (FetchJob): Job the values were read for
+        stages (StageTimes): Stage times of the job
+
+    Returns:
+        pd.DataFrame: Values of each cell
+    """
+    _with_wind(df, job, stages)
+    return df.drop(columns=['point'])
+
+def _with_wind(df: pd.DataFrame, job: "FetchJob", stages: StageTimes) -> None:
+    """Adds wind speed and direction from the u and v components, like Herbie's `with_wind`"""
+    if "WIND" in job.search_regex and 'u10' in df.columns and 'v10' in df.columns:
+        with stages.time("with_wind"):
+            df['si10'] = np.hypot(df['u10'], df['v10'])
+            df['wdir10'] = (270 - np.degrees(np.arctan2(df['v10'], df['u10']))) % 360
+
+# End byte standing in for the end of the file, for the last message of a .idx which has no end byte
+_FILE_END = 2**62
+
+def _read_range(url: str, start: int, end: int) -> bytes:
+    """Reads bytes `start` to `end` (Exclusive, or `_FILE_END`) of a local or remote GRIB file"""
+    if os.path.exists(url):
+        with open(url, "rb") as file:
+            file.seek(start)
+            return file.read() if end >= _FILE_END else file.read(end - start)
+
+    import requests
+
+    headers = {"Range": f"bytes={start}-{end - 1 if end < _FILE_END else ''}"}
+    with requests.get(url, headers=headers, timeout=30) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise ConnectionError(f"Range request to {url} wasn't honored (HTTP {response.status_code})")
+        return response.content
+
+def crop_slices(lats: np.ndarray, lons: np.ndarray, bounds: tuple[float, float, float, float]) -> tuple[slice, slice]:
+    """Gets the smallest (y, x) window of a grid that holds every cell inside the given bounds. Grids that
+    aren't aligned with lat/lon lines (Like HRRR's Lambert conformal grid) get some cells outside the bounds too.
+
+    Args:
+        lats (np.ndarray): Latitude of each grid cell (y, x)
+        lons (np.ndarray): Longitude of each grid cell (y, x), in -180 to 180 or 0 to 360
+        bounds (tuple[float, float, float, float]): (min lat, min lon, max lat, max lon)
+
+    Raises:
+        ValueError: If no cell is inside the bounds
+
+    Returns:
+        tuple[slice, slice]: y and x slices of the window
+    """
+    min_lat, min_lon, max_lat, max_lon = bounds
+    lons = (lons + 180) % 360 - 180
+    inside = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+    ys, xs = np.nonzero(inside)
+    if len(ys) == 0:
+        raise ValueError(f"No grid cells inside {bounds}")
+    return slice(int(ys.min()), int(ys.max()) + 1), slice(int(xs.min()), int(xs.max()) + 1)
+
+def _weighted_points(data_set: "xr.Dataset", weights: PointWeights) -> "xr.Dataset":
+    """Takes the value of each point from every field of a decoded dataset with the given weights, one sparse mat-vec
+    per field. Has the cell closest to each point as its 'latitude', 'longitude', 'y' and 'x', like pick_points.
+
+    Args:
+        data_set (xr.Dataset): Decoded fields, with (y, x) as their last dimensions
+        weights (PointWeights): Weights of each point on the datasets grid
+
+    Returns:
+        xr.Dataset: Values of each point, with a 'point' dimension in place of (y, x)
+    """
+    fields = {}
+    for name, field in data_set.data_vars.items():
+        if 'y' not in field.dims or 'x' not in field.dims:
+            continue
+        lead = [d for d in field.dims if d not in ('y', 'x')]
+        fields[name] = (lead + ['point'], weights.apply(field.transpose(*lead, 'y', 'x').values))
+
+    coords = {c: data_set[c] for c in ('time', 'step', 'valid_time') if c in data_set.coords}
+    lats = data_set['latitude'].values
+    lons = data_set['longitude'].values
+    coords.update({
+        'latitude': ('point', lats[weights.y, weights.x]),
+        'longitude': ('point', lons[weights.y, weights.x]),
+        'y': ('point', weights.y),
+        'x': ('point', weights.x),
+        'point_grid_distance': ('point', weights.distance),
+    })
+    import xarray as xr
+    return xr.Dataset(fields, coords=coords)
@@ -0,0 +1,352 @@
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+import pandas as pd
+
+from src.config import EXP_COLS
+from src.util.schema import cast_dataset, read_dataset
+
+# Columns that uniquely identify a row in the store
+STORE_KEY = ['time', 'valid_time', 'point_id', 'fxx']
+
+# Largest lead time we store, used to widen partition pruning when filtering on valid_time
+MAX_LEAD = timedelta(hours=48)
+
+# Version of the rows in the store, stores written by older versions are brought up to it by `WeatherStore.migrate`
+# 2: fxx is each row's lead time, older versions saved every row with fxx 1
+STORE_VERSION = 2
+
+def season_of(ts: Union[pd.Timestamp, datetime]) -> int:
+    """Gets the season (Start year) the given time belongs to. Seasons start on October 1st.
+
+    Args:
+        ts (Union[pd.Timestamp, datetime]): Time to get season for
+
+    Returns:
+        int: Start year of the season
+    """
+    return ts.year if ts.month >= 10 else ts.year - 1
+
+def lead_fxx(df: pd.DataFrame) -> pd.Series:
+    """Gets the lead time (Hours from time to valid_time) of each row, which is the fxx it was forecast at.
+
+    Args:
+        df (pd.DataFrame): Rows with 'time' and 'valid_time' columns
+
+    Returns:
+        pd.Series: fxx of each row
+    """
+    return ((df['valid_time'] - df['time']) // pd.Timedelta(hours=1)).astype(df['fxx'].dtype if 'fxx' in df.columns else int)
+
+class WeatherStore():
+    def __init__(self, root: str):
+        """Columnar weather store partitioned by season, month and point_id. Each partition is a single
+        parquet file located at `{root}/season={season}/month={month}/point_id={point_id}.parquet`, so writes
+        only touch the partitions that changed and reads can skip partitions outside of the requested range.
+        Every upsert is also recorded in a journal (See `changes_since`), so consumers can tell which data changed. The journal
+        is trimmed with `compact_journal` once consumers have seen its changes.
+
+        Args:
+            root (str): Directory to store partitions in
+        """
+        self.__logger = logging.getLogger(__name__)
+        self.root = root
+        self.journal_path = os.path.join(self.root, "_journal.jsonl")
+        self.journal_meta_path = os.path.join(self.root, "_journal_meta.json")
+        self.meta_path = os.path.join(self.root, "_store_meta.json")
+        os.makedirs(self.root, exist_ok=True)
+
+    def upsert(self, df: pd.DataFrame) -> int:
+        """Inserts the given rows into the store, replacing any rows with the same (time, valid_time, point_id, fxx) key.
+        Each partition is rewritten atomically, so a failed write never leaves a partial partition behind.
+
+        Args:
+            df (pd.DataFrame): Rows to insert, must contain the `STORE_KEY` columns
+
+        Returns:
+            int: Number of partitions written
+        """
+        if df.empty:
+            return 0
+
+        df = cast_dataset(df, "weather")
+
+        seasons = df['time'].dt.year.where(df['time'].dt.month >= 10, df['time'].dt.year - 1)
+
+        n_written = 0
+        for (season, month, point_id), new_rows in df.groupby([seasons, df['time'].dt.month, df['point_id']]):
+            fp = self.__partition_path(int(season), int(month), int(point_id))
+
+            if os.path.exists(fp):
+                # Partitions written before the schema existed are stored as float64, cast them on the way through
+                new_rows = cast_dataset(pd.concat([pd.read_parquet(fp), new_rows], ignore_index=True), "weather")
+
+            new_rows = new_rows.drop_duplicates(subset=STORE_KEY, keep='last').sort_values(by=['time', 'valid_time', 'fxx'])
+
+            os.makedirs(os.path.dirname(fp), exist_ok=True)
+            tmp_fp = f"{fp}.tmp"
+            new_rows.to_parquet(tmp_fp, index=False)
+            os.replace(tmp_fp, fp)
+            n_written += 1
+
+        self.__journal(df)
+
+        self.__logger.debug(f"Upserted {df.shape[0]} rows into {n_written} partitions")
+        return n_written
+
+    def read(self, start: Optional[datetime] = None, end: Optional[datetime] = None, point_ids: Optional[list[int]] = None,
+             columns: Optional[list[str]] = None, time_col: str = 'time') -> pd.DataFrame:
+        """Reads rows from the store. Partitions outside of the given time range or point ids are never opened.
+
+        Args:
+            start (Optional[datetime], optional): Min value (inclusive) of `time_col`. Defaults to None.
+            end (Optional[datetime], optional): Max value (inclusive) of `time_col`. Defaults to None.
+            point_ids (Optional[list[int]], optional): Point ids to read. Defaults to None (All points).
+            columns (Optional[list[str]], optional): Columns to read. Defaults to None (All columns).
+            time_col (str, optional): Column used to filter by `start` and `end`. Defaults to 'time'.
+
+        Returns:
+            pd.DataFrame: Rows sorted by time and valid_time
+        """
+        # Partitions are keyed by time, valid_time is always after time but never by more than MAX_LEAD
+        part_start = start - MAX_LEAD if start is not None and time_col == 'valid_time' else start
+
+        read_cols = None
+        if columns is not None:
+            read_cols = list(dict.fromkeys(columns + [time_col]))
+
+        frames = []
+        for fp in self.__partitions(part_start, end, point_ids):
+            frames.append(pd.read_parquet(fp, columns=read_cols))
+
+        if len(frames) == 0:
+            return pd.DataFrame(columns=read_cols if read_cols else EXP_COLS)
+
+        df = pd.concat(frames, ignore_index=True)
+
+        if start is not None:
+            df = df[df[time_col] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df[time_col] <= pd.Timestamp(end)]
+
+        sort_cols = [c for c in ['time', 'valid_time'] if c in df.columns]
+        df = df.sort_values(by=sort_cols).reset_index(drop=True)
+
+        if columns is not None:
+            df = df[columns]
+        return df
+
+    def changes_since(self, at: float) -> pd.DataFrame:
+        """Gets the changes recorded in the journal after the given time.
+
+        Args:
+            at (float): Timestamp (Seconds since epoch) to get changes after
+
+        Returns:
+            pd.DataFrame: One row per point per upsert with columns point_id, min_time, max_time, min_valid_time, max_valid_time and at
+        """
+        cols = ['point_id', 'min_time', 'max_time', 'min_valid_time', 'max_valid_time', 'at']
+        if not os.path.exists(self.journal_path):
+            return pd.DataFrame(columns=cols)
+
+        with open(self.journal_path, "r") as file:
+            changes = pd.DataFrame([json.loads(line) for line in file if line.strip()], columns=cols)
+
+        changes = changes[changes['at'] > at]
+        for c in ['min_time', 'max_time', 'min_valid_time', 'max_valid_time']:
+            changes[c] = pd.to_datetime(changes[c])
+        return changes
+
+    @property
+    def journal_start(self) -> float:
+        """Time (Seconds since epoch) the journal starts at, changes at or before it have been removed by `compact_journal`.
+        Consumers that last read the journal before this time can't tell what changed since, and have to treat every
+        hour as changed."""
+        if not os.path.exists(self.journal_meta_path):
+            return 0.0
+        with open(self.journal_meta_path, "r") as file:
+            return float(json.load(file)['start'])
+
+    def compact_journal(self, before: float) -> int:
+        """Removes the changes recorded at or before the given time from the journal, so `changes_since` doesn't
+        re-read changes every consumer has already seen. The journal is rewritten atomically.
+
+        Args:
+            before (float): Timestamp (Seconds since epoch) every consumer has seen the changes up to
+
+        Returns:
+            int: Number of changes removed
+        """
+        if before <= self.journal_start or not os.path.exists(self.journal_path):
+            return 0
+
+        with open(self.journal_path, "r") as file:
+            lines = [line for line in file if line.strip()]
+        keep = [line for line in lines if json.loads(line)['at'] > before]
+
+        tmp_fp = f"{self.journal_path}.tmp"
+        with open(tmp_fp, "w") as file:
+            file.writelines(keep)
+        with open(f"{self.journal_meta_path}.tmp", "w") as file:
+            json.dump({"start": before}, file)
+        # The start is moved first, so a crash in between only makes consumers rewrite more than they need to
+        os.replace(f"{self.journal_meta_path}.tmp", self.journal_meta_path)
+        os.replace(tmp_fp, self.journal_path)
+
+        self.__logger.debug(f"Removed {len(lines) - len(keep)} changes from {self.journal_path}")
+        return len(lines) - len(keep)
+
+    @property
+    def version(self) -> int:
+        """Version of the rows in the store (See `STORE_VERSION`), stores from before versions were recorded are version 1"""
+        if not os.path.exists(self.meta_path):
+            return 1
+        with open(self.meta_path, "r") as file:
+            return int(json.load(file)['version'])
+
+    def migrate(self) -> int:
+        """Brings a store written by an older version up to `STORE_VERSION`, does nothing once it's up to date.
+
+        Version 2: Rows used to be saved with fxx 1 whatever their lead time, so every hour of a forecast run had the
+        same fxx. Each row's fxx is set to its lead time (valid_time - time), and where that gives a row the key of a
+        row that was saved with its real fxx, the row with the real fxx is kept. Changed rows are recorded in the
+        journal, so `split_data` rewrites the files they were in.
+
+        Returns:
+            int: Number of partitions rewritten
+        """
+        if self.version >= STORE_VERSION:
+            return 0
+
+        n_written = 0
+        changed = []
+        for fp in self.__partitions():
+            df = cast_dataset(pd.read_parquet(fp), "weather")
+            stale = df['fxx'] != lead_fxx(df)
+            if not stale.any():
+                continue
+
+            # Stale rows go first, so rows saved with their real fxx replace them
+            df = pd.concat([df[stale], df[~stale]], ignore_index=True)
+            df['fxx'] = lead_fxx(df)
+            changed.append(df[:int(stale.sum())])
+            df = df.drop_duplicates(subset=STORE_KEY, keep='last').sort_values(by=['time', 'valid_time', 'fxx'])
+
+            tmp_fp = f"{fp}.tmp"
+            df.to_parquet(tmp_fp, index=False)
+            os.replace(tmp_fp, fp)
+            n_written += 1
+
+        if len(changed) > 0:
+            self.__journal(pd.concat(changed, ignore_index=True))
+
+        tmp_fp = f"{self.meta_path}.tmp"
+        with open(tmp_fp, "w") as file:
+            json.dump({"version": STORE_VERSION}, file)
+        os.replace(tmp_fp, self.meta_path)
+
+        self.__logger.info(f"Migrated {self.root} to version {STORE_VERSION}, {n_written} partitions rewritten")
+        return n_written
+
+    def time_range(self, time_col: str = 'time') -> tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        """Gets the min and max of the given time column, only the first and last months are read.
+
+        Args:
+            time_col (str, optional): Column to get the range of. Defaults to 'time'.
+
+        Returns:
+            tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]: Min and max, `None` if the store is empty
+        """
+        partitions = self.__partitions()
+        if len(partitions) == 0:
+            return None, None
+
+        # Partitions are listed in time order, so the first and last months hold the min and max
+        first_month = os.path.dirname(partitions[0])
+        last_month = os.path.dirname(partitions[-1])
+        first = pd.concat([pd.read_parquet(fp, columns=[time_col]) for fp in partitions if os.path.dirname(fp) == first_month])
+        last = pd.concat([pd.read_parquet(fp, columns=[time_col]) for fp in partitions if os.path.dirname(fp) == last_month])
+        return first[time_col].min(), last[time_col].max()
+
+    def is_empty(self) -> bool:
+        """Checks if the store contains any partitions
+
+        Returns:
+            bool: `True` if no data is stored, `False` otherwise
+        """
+        return next(iter(self.__partitions()), None) is None
+
+    def import_csv(self, fp: str) -> int:
+        """Imports a csv file written by older versions of `HerbieFetcher` into the store.
+
+        Args:
+            fp (str): File path of csv to import
+
+        Returns:
+            int: Number of partitions written
+        """
+        df = read_dataset(fp, "weather").drop_duplicates()
+        # Older versions saved every row with fxx 1 (See `migrate`)
+        df['fxx'] = lead_fxx(df)
+        self.__logger.info(f"Importing {df.shape[0]} rows from {fp} into {self.root}")
+        return self.upsert(df)
+
+    def clear(self) -> None:
+        """Deletes all data in the store."""
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def __journal(self, df: pd.DataFrame) -> None:
+        """Records the range of hours that changed for each point in the given rows"""
+        now = datetime.now().timestamp()
+        ranges = df.groupby('point_id').agg(min_time=('time', 'min'), max_time=('time', 'max'),
+                                            min_valid_time=('valid_time', 'min'), max_valid_time=('valid_time', 'max'))
+        with open(self.journal_path, "a") as file:
+            for point_id, row in ranges.iterrows():
+                file.write(json.dumps({
+                    "point_id": int(point_id), # type: ignore
+                    "min_time": row['min_time'].isoformat(),
+                    "max_time": row['max_time'].isoformat(),
+                    "min_valid_time": row['min_valid_time'].isoformat(),
+                    "max_valid_time": row['max_valid_time'].isoformat(),
+                    "at": now
+                }) + "\n")
+
+    def __partition_path(self, season: int, month: int, point_id: int) -> str:
+        return os.path.join(self.root, f"season={season}", f"month={month:02d}", f"point_id={point_id}.parquet")
+
+    def __partitions(self, start: Optional[datetime] = None, end: Optional[datetime] = None, point_ids: Optional[list[int]] = None) -> list[str]:
+        """Lists the partition files that can contain rows between start and end for the given point ids, in time order."""
+        # Compare months as (year, month) tuples so pruning works across the new year
+        min_month = (start.year, start.month) if start is not None else None
+        max_month = (end.year, end.month) if end is not None else None
+        point_set = set(int(p) for p in point_ids) if point_ids is not None else None
+
+        partitions = []
+        for season_dir in sorted(os.listdir(self.root)):
+            if not season_dir.startswith("season="):
+                continue
+            season = int(season_dir.split("=")[1])
+
+            for month_dir in sorted(os.listdir(os.path.join(self.root, season_dir))):
+                month = int(month_dir.split("=")[1])
+                year_month = (season if month >= 10 else season + 1, month)
+
+                if (min_month and year_month < min_month) or (max_month and year_month > max_month):
+                    continue
+
+                month_path = os.path.join(self.root, season_dir, month_dir)
+                for fn in sorted(os.listdir(month_path)):
+                    if not fn.endswith(".parquet"):
+                        continue
+                    if point_set is not None and int(fn[len("point_id="):-len(".parquet")]) not in point_set:
+                        continue
+                    partitions.append((year_month, os.path.join(month_path, fn)))
+
+        # Month directories sort as 01..12, but a season runs from October to May
+        return [fp for _, fp in sorted(partitions, key=lambda p: p[0])]
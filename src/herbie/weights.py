@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.neighbors import BallTree
+
+from src.config import POINT_WEIGHTS_DIR
+
+# Ways a point's value can be taken from the grid, see `compute_weights`
+METHODS = ["nearest", "idw", "bilinear"]
+
+EARTH_RADIUS_KM = 6371.0
+
+logger = logging.getLogger(__name__)
+
+# Weights already loaded by this process, by cache key
+_WEIGHTS: dict[str, "PointWeights"] = {}
+
+@dataclass
+class PointWeights():
+    """Weights of the grid cells each point's value is taken from, as a sparse (point, cell) matrix whose rows sum to 1.
+    Extracting every point from a field is a single sparse mat-vec, for any method."""
+    matrix: sparse.csr_matrix
+    # (y, x) cells of the grid
+    grid_shape: tuple[int, int]
+    # Cell closest to each point and its distance in km, like the columns of Herbie's pick_points
+    y: np.ndarray
+    x: np.ndarray
+    distance: np.ndarray
+    method: str
+
+    @property
+    def n_points(self) -> int:
+        return self.matrix.shape[0]
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        """Gets the value of each point from fields on the grid.
+
+        Args:
+            values (np.ndarray): Fields with the grid as the last two dimensions (..., y, x)
+
+        Returns:
+            np.ndarray: Values of each point (..., point)
+        """
+        lead = values.shape[:-2]
+        flat = values.reshape(-1, self.grid_shape[0] * self.grid_shape[1])
+        return np.asarray(self.matrix @ flat.T).T.reshape(lead + (self.n_points,))
+
+def compute_weights(lats: np.ndarray, lons: np.ndarray, point_lats: np.ndarray, point_lons: np.ndarray,
+                    method: str = "nearest", k: int = 4, power: float = 2.0) -> PointWeights:
+    """Computes the weights of the grid cells each point is taken from. Distances are great circle distances,
+    like Herbie's pick_points.
+
+    - "nearest": The closest cell
+    - "idw": The `k` closest cells, weighted by inverse distance to the `power`
+    - "bilinear": The four cells around the point, weighted by where the point falls between them. Works on
+      curvilinear grids (Like HRRR's Lambert conformal grid), the point's fractional (y, x) position is found
+      from the change of lat/lon across the closest cell.
+
+    Args:
+        lats (np.ndarray): Latitude of each grid cell (y, x)
+        lons (np.ndarray): Longitude of each grid cell (y, x), in -180 to 180 or 0 to 360
+        point_lats (np.ndarray): Latitude of each point
+        point_lons (np.ndarray): Longitude of each point
+        method (str, optional): One of `METHODS`. Defaults to "nearest".
+        k (int, optional): Number of cells used by "idw". Defaults to 4.
+        power (float, optional): Power of the inverse distance used by "idw". Defaults to 2.0.
+
+    Raises:
+        ValueError: If the method isn't one of `METHODS`
+
+    Returns:
+        PointWeights: Weights of each point
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, must be one of {METHODS}")
+
+    grid_shape = lats.shape
+    lons = (lons + 180) % 360 - 180
+    point_lons = (np.asarray(point_lons, dtype=np.float64) + 180) % 360 - 180
+    point_lats = np.asarray(point_lats, dtype=np.float64)
+    n_points = len(point_lats)
+
+    tree = BallTree(np.radians(np.column_stack([lats.reshape(-1), lons.reshape(-1)])), metric='haversine')
+    points = np.radians(np.column_stack([point_lats, point_lons]))
+    dist, cells = tree.query(points, k=k if method == "idw" else 1)
+    dist = dist * EARTH_RADIUS_KM
+    y, x = np.unravel_index(cells[:, 0], grid_shape)
+
+    if method == "nearest":
+        cols = cells
+        weights = np.ones((n_points, 1))
+    elif method == "idw":
+        cols = cells
+        # Points on top of a cell take its value
+        with np.errstate(divide='ignore'):
+            weights = np.where(dist[:, :1] == 0, (dist == 0).astype(float), 1 / dist**power)
+        weights = weights / weights.sum(axis=1, keepdims=True)
+    else:
+        cols, weights = _bilinear(lats, lons, point_lats, point_lons, np.asarray(y), np.asarray(x))
+
+    matrix = sparse.csr_matrix((weights.reshape(-1), (np.repeat(np.arange(n_points), cols.shape[1]), cols.reshape(-1))),
+                               shape=(n_points, lats.size))
+    # Bilinear weights of points on a cell's edge are 0, keeping them would spread missing values of the next cell
+    matrix.eliminate_zeros()
+    return PointWeights(matrix, grid_shape, np.asarray(y), np.asarray(x), dist[:, 0], method) # type: ignore
+
+def _bilinear(lats: np.ndarray, lons: np.ndarray, point_lats: np.ndarray, point_lons: np.ndarray, y: np.ndarray,
+              x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Gets the four cells around each point and their bilinear weights, starting from the closest cell (y, x)"""
+    n_y, n_x = lats.shape
+    # Lat/lon change per cell in y and x around the closest cell
+    y0, y1 = np.clip(y - 1, 0, n_y - 1), np.clip(y + 1, 0, n_y - 1)
+    x0, x1 = np.clip(x - 1, 0, n_x - 1), np.clip(x + 1, 0, n_x - 1)
+    jac = np.empty((len(y), 2, 2))
+    for i, grid in enumerate((lats, lons)):
+        jac[:, i, 0] = (grid[y1, x] - grid[y0, x]) / np.maximum(y1 - y0, 1)
+        jac[:, i, 1] = (grid[y, x1] - grid[y, x0]) / np.maximum(x1 - x0, 1)
+
+    offset = np.column_stack([point_lats - lats[y, x], point_lons - lons[y, x]])
+    frac = np.linalg.solve(jac, offset[:, :, None])[:, :, 0]
+
+    # Corner cell below/left of the point and how far the point is towards the next cell
+    fy = np.clip(y + frac[:, 0], 0, n_y - 1)
+    fx = np.clip(x + frac[:, 1], 0, n_x - 1)
+    base_y = np.minimum(np.floor(fy).astype(int), max(n_y - 2, 0))
+    base_x = np.minimum(np.floor(fx).astype(int), max(n_x - 2, 0))
+    a = fy - base_y
+    b = fx - base_x
+
+    next_y = np.minimum(base_y + 1, n_y - 1)
+    next_x = np.minimum(base_x + 1, n_x - 1)
+    cols = np.column_stack([
+        np.ravel_multi_index((base_y, base_x), (n_y, n_x)),
+        np.ravel_multi_index((base_y, next_x), (n_y, n_x)),
+        np.ravel_multi_index((next_y, base_x), (n_y, n_x)),
+        np.ravel_multi_index((next_y, next_x), (n_y, n_x)),
+    ])
+    weights = np.column_stack([(1 - a) * (1 - b), (1 - a) * b, a * (1 - b), a * b])
+    return cols, weights
+
+class WeightCache():
+    def __init__(self, root: str = POINT_WEIGHTS_DIR):
+        """Disk cache of `PointWeights`, keyed by the grid, the coords and the method. Points don't move between
+        fetches, so their weights are computed once per coordinate set and reused by every job and worker. Weights
+        loaded by a process are also kept in memory for the life of the process.
+
+        Args:
+            root (str, optional): Cache directory. Defaults to POINT_WEIGHTS_DIR.
+        """
+        self.root = os.path.expanduser(root)
+
+    @staticmethod
+    def key(lats: np.ndarray, lons: np.ndarray, coords: pd.DataFrame, method: str) -> str:
+        """Gets the cache key of the weights of the given coords on the given grid.
+
+        Args:
+            lats (np.ndarray): Latitude of each grid cell (y, x)
+            lons (np.ndarray): Longitude of each grid cell (y, x)
+            coords (pd.DataFrame): Points with 'latitude' and 'longitude' columns
+            method (str): One of `METHODS`
+
+        Returns:
+            str: Key
+        """
+        h = hashlib.sha256()
+        h.update(f"{method}:{lats.shape}".encode())
+        # A strided sample of the grid identifies it without hashing millions of cells on every fetch
+        step = max(lats.shape[0] // 64, 1), max(lats.shape[1] // 64, 1)
+        for grid in (lats, lons):
+            h.update(np.ascontiguousarray(grid[::step[0], ::step[1]], dtype=np.float64).tobytes())
+            h.update(np.ascontiguousarray(grid[-1, :], dtype=np.float64).tobytes())
+            h.update(np.ascontiguousarray(grid[:, -1], dtype=np.float64).tobytes())
+        h.update(coords['latitude'].to_numpy(dtype=np.float64).tobytes())
+        h.update(coords['longitude'].to_numpy(dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def get(self, lats: np.ndarray, lons: np.ndarray, coords: pd.DataFrame, method: str = "nearest") -> PointWeights:
+        """Gets the weights of the given coords on the given grid, computing and caching them if they aren't cached.
+
+        Args:
+            lats (np.ndarray): Latitude of each grid cell (y, x)
+            lons (np.ndarray): Longitude of each grid cell (y, x)
+            coords (pd.DataFrame): Points with 'latitude' and 'longitude' columns
+            method (str, optional): One of `METHODS`. Defaults to "nearest".
+
+        Returns:
+            PointWeights: Weights of each coord
+        """
+        key = self.key(lats, lons, coords, method)
+        if key in _WEIGHTS:
+            return _WEIGHTS[key]
+
+        fp = os.path.join(self.root, f"{key}.npz")
+        if os.path.exists(fp):
+            weights = self.__load(fp, method)
+        else:
+            weights = compute_weights(lats, lons, coords['latitude'].to_numpy(), coords['longitude'].to_numpy(), method)
+            self.__save(fp, weights)
+            logger.debug(f"Computed {method} weights for {weights.n_points} points, saved to {fp}")
+
+        _WEIGHTS[key] = weights
+        return weights
+
+    def __load(self, fp: str, method: str) -> PointWeights:
+        with np.load(fp) as data:
+            matrix = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            return PointWeights(matrix, tuple(data['grid_shape']), data['y'], data['x'], data['distance'], method) # type: ignore
+
+    def __save(self, fp: str, weights: PointWeights) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        # Workers computing the same weights at once write identical files, the last one to finish wins
+        tmp_fp = f"{fp}.{uuid.uuid4().hex}.tmp.npz"
+        np.savez(tmp_fp, data=weights.matrix.data, indices=weights.matrix.indices, indptr=weights.matrix.indptr,
+                 shape=np.array(weights.matrix.shape), grid_shape=np.array(weights.grid_shape), y=weights.y, x=weights.x,
+                 distance=weights.distance)
+        os.replace(tmp_fp, fp)
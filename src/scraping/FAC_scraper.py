@@ -5,6 +5,8 @@ from datetime import datetime
 import pandas as pd
 from playwright.sync_api import Page, sync_playwright
 
+from src.util.schema import read_dataset
+
 logger = logging.getLogger(__name__)
 
 BASE_URLS = ['https://www.flatheadavalanche.org/avalanche-forecast/#/whitefish-range',
@@ -187,9 +189,7 @@ class FAC_Scraper():
         Args:
             archive_fp (str): File path to a csv file with previously scraped data.
         """
-        df = pd.read_csv(archive_fp)
-
-        df['date'] = pd.to_datetime(df['date'])
+        df = read_dataset(archive_fp, "fac_archive")
 
         df_grouped = df.groupby(by='date').size().reset_index().rename(columns={0: "size"})
 
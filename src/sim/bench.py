@@ -0,0 +1,134 @@
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.config import SMET_PRECISION
+from src.util.file import VAR_MAP, legacy_read_smet, legacy_write_smet_data, read_smet, write_smet
+
+def make_weather(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Creates hourly weather like `csv_to_smet` writes, with SMET field names and a few missing values.
+
+    Args:
+        n_rows (int): Number of hours
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: Weather with the timestamp as the first column
+    """
+    rng = np.random.default_rng(seed)
+    fields = [f for f in VAR_MAP.values() if f != "timestamp"]
+    df = pd.DataFrame(rng.uniform(0, 300, (n_rows, len(fields))).astype(np.float32), columns=fields)
+    df.iloc[rng.integers(0, n_rows, n_rows // 100), 0] = np.nan
+    df.insert(0, "timestamp", pd.date_range("2025-10-01", periods=n_rows, freq="1h"))
+    return df
+
+def run_smet_benchmark(n_rows: int = 5000, n_points: int = 1, repeats: int = 5) -> dict:
+    """Times writing the SMET data block of each point with `write_smet` and with the row by row writer
+    `csv_to_smet` used before it, and checks both write the same values.
+
+    Args:
+        n_rows (int, optional): Hours per point, a season is about 5000. Defaults to 5000.
+        n_points (int, optional): Number of points written. Defaults to 1.
+        repeats (int, optional): Number of times each writer is timed, the fastest is reported. Defaults to 5.
+
+    Returns:
+        dict: Benchmark results
+    """
+    frames = [make_weather(n_rows, seed) for seed in range(n_points)]
+    work_dir = tempfile.mkdtemp(prefix="smet_bench_")
+
+    def legacy(df: pd.DataFrame, fp: str):
+        with open(fp, "w") as file:
+            legacy_write_smet_data(df.copy(), file)
+
+    def vectorized(df: pd.DataFrame, fp: str):
+        write_smet(df, fp, {"station_id": 1})
+
+    results = {"rows": n_rows, "points": n_points}
+    for name, write in [("legacy", legacy), ("vectorized", vectorized)]:
+        times = []
+        for _ in range(repeats):
+            s_time = time.perf_counter()
+            for i, df in enumerate(frames):
+                write(df, os.path.join(work_dir, f"{name}_{i}.smet"))
+            times.append(time.perf_counter() - s_time)
+        results[f"{name}_ms"] = min(times) * 1000
+        results[f"{name}_bytes"] = sum(os.path.getsize(os.path.join(work_dir, f"{name}_{i}.smet")) for i in range(n_points))
+
+    # Same values, up to the precision of the new writer
+    with open(os.path.join(work_dir, "vectorized_0.smet")) as file:
+        data = file.read().split("[DATA]\n")[1]
+    new = pd.read_csv(io.StringIO(data), sep=" ", header=None, na_values=["-999"]).iloc[:, 1:].to_numpy()
+    old = pd.read_csv(os.path.join(work_dir, "legacy_0.smet"), sep=" ", header=None).iloc[:, 1:].to_numpy()
+    results["max_diff"] = float(np.nanmax(np.abs(new - old)))
+    results["same_missing"] = bool((np.isnan(new) == np.isnan(old)).all())
+    results["tolerance"] = 0.5 * 10**-SMET_PRECISION
+    return results
+
+def run_smet_read_benchmark(n_rows: int = 5000, n_points: int = 1, repeats: int = 5) -> dict:
+    """Times reading SMET files like SNOWPACK's output into DataFrames with `read_smet`, and the way simulations
+    did before it (Parsed line by line, written to a csv by `smet_to_csv` and read back), and checks both read the
+    same values.
+
+    Args:
+        n_rows (int, optional): Hours per file. Defaults to 5000.
+        n_points (int, optional): Number of files read. Defaults to 1.
+        repeats (int, optional): Number of times each reader is timed, the fastest is reported. Defaults to 5.
+
+    Returns:
+        dict: Benchmark results
+    """
+    work_dir = tempfile.mkdtemp(prefix="smet_bench_")
+    fps = []
+    for i in range(n_points):
+        fp = os.path.join(work_dir, f"{100 + i}.smet")
+        write_smet(make_weather(n_rows, i), fp, {"station_id": 100 + i, "altitude": 1500, "slope_angle": 38, "slope_azi": 90})
+        fps.append(fp)
+
+    def legacy(fp: str) -> pd.DataFrame:
+        csv_fp = f"{fp}.csv"
+        legacy_read_smet(fp).drop_duplicates().to_csv(csv_fp, index=False)
+        return pd.read_csv(csv_fp)
+
+    results = {"rows": n_rows, "points": n_points}
+    frames = {}
+    for name, read in [("legacy", legacy), ("bulk", lambda fp: read_smet(fp).to_frame())]:
+        times = []
+        for _ in range(repeats):
+            s_time = time.perf_counter()
+            frames[name] = [read(fp) for fp in fps]
+            times.append(time.perf_counter() - s_time)
+        results[f"{name}_ms"] = min(times) * 1000
+
+    # The old reader kept a row for the empty line at the end of the file
+    old = frames["legacy"][0].dropna(subset=["timestamp"])
+    new = frames["bulk"][0]
+    fields = [c for c in new.columns if c != "timestamp"]
+    results["same_values"] = bool(np.allclose(old[fields].to_numpy(dtype=np.float64), new[fields].to_numpy(), equal_nan=True)
+                                  and (pd.to_datetime(old["timestamp"]).to_numpy() == new["timestamp"].to_numpy()).all())
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures how fast the SMET files SNOWPACK reads are written, and its output is read")
+    parser.add_argument("--rows", type=int, default=5000, help="Hours per point")
+    parser.add_argument("--points", type=int, default=33)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    r = run_smet_benchmark(args.rows, args.points, args.repeats)
+    print(f"{'writer':<11} {'ms':>9} {'rows/s':>11} {'MB':>7}")
+    for name in ["legacy", "vectorized"]:
+        print(f"{name:<11} {r[f'{name}_ms']:>9.1f} {r['rows'] * r['points'] / (r[f'{name}_ms'] / 1000):>11.0f} {r[f'{name}_bytes'] / 1024**2:>7.2f}")
+    print(f"\n{r['points']} points x {r['rows']} hours, {r['legacy_ms'] / r['vectorized_ms']:.1f}x faster, "
+          f"max difference {r['max_diff']:.2g} (Tolerance {r['tolerance']:.2g}), same missing values: {r['same_missing']}")
+
+    r = run_smet_read_benchmark(args.rows, args.points, args.repeats)
+    print(f"\n{'reader':<11} {'ms':>9} {'rows/s':>11}")
+    for name in ["legacy", "bulk"]:
+        print(f"{name:<11} {r[f'{name}_ms']:>9.1f} {r['rows'] * r['points'] / (r[f'{name}_ms'] / 1000):>11.0f}")
+    print(f"\n{r['points']} files x {r['rows']} hours, {r['legacy_ms'] / r['bulk_ms']:.1f}x faster, same values: {r['same_values']}")
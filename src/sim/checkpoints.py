@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import SIM_CHECKPOINT_DIR
+from src.util.file import VAR_MAP
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Checkpoint():
+    """Saved state of one station's SNOWPACK run, up to and including `end`"""
+    # Last hour simulated, the run continues from here
+    end: pd.Timestamp
+    # Directory of the end of run .sno file of each virtual slope, named like the input sno files
+    sno_dir: str
+    # Output of every virtual slope up to `end`
+    output: pd.DataFrame
+
+def forcing_hash(df: pd.DataFrame, end: pd.Timestamp) -> str:
+    """Gets a hash of the weather data a run was forced with, up to and including `end`. Only what `csv_to_smet`
+    writes to the smet file is hashed, the first row of each hour and the columns in `VAR_MAP`, so rows SNOWPACK
+    never sees don't change the hash. If any of the hashed rows change (A missing hour is filled, a forecast hour
+    is replaced by the analysis, ...) the hash does too.
+
+    Args:
+        df (pd.DataFrame): Weather data of one point and fxx, with a 'time' column
+        end (pd.Timestamp): Last hour to include
+
+    Returns:
+        str: Hash
+    """
+    rows = df[df['time'] <= end].sort_values('time', kind='stable').drop_duplicates(subset='time', keep='first')
+    rows = rows[sorted(c for c in VAR_MAP if c in rows.columns)]
+    h = hashlib.sha256()
+    h.update(",".join(rows.columns).encode())
+    h.update(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def config_hash(ini_fp: str, sno_dir: str, snowpack_bin: str) -> str:
+    """Gets a hash of the SNOWPACK setup of a run, so checkpoints are dropped when the ini, sno templates or
+    binary change.
+
+    Args:
+        ini_fp (str): SNOWPACK ini template
+        sno_dir (str): Directory of the sno templates
+        snowpack_bin (str): SNOWPACK binary
+
+    Returns:
+        str: Hash
+    """
+    h = hashlib.sha256()
+    h.update(os.path.abspath(snowpack_bin).encode())
+    with open(ini_fp, "rb") as f:
+        h.update(f.read())
+    for fn in sorted(os.listdir(sno_dir)):
+        h.update(fn.encode())
+        with open(os.path.join(sno_dir, fn), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+class CheckpointStore():
+    def __init__(self, root: str = SIM_CHECKPOINT_DIR):
+        """Disk store of the SNOWPACK state of each station (point and fxx) at the end of its last run, so the next
+        run resumes from it and only simulates the new hours instead of the whole season. Each checkpoint holds the
+        .sno file of every virtual slope, the output so far and a hash of the weather the state was simulated from.
+        A checkpoint is only used if the weather up to its end hasn't changed, otherwise it's dropped and the
+        station is simulated from the start of its data again. Runs whose data ends at or before a checkpoint (Like
+        backfilling an older day) simulate from the start of their data and leave the checkpoint as it is.
+
+        Layout: `{root}/p{point_id}_fxx{fxx}/` with `meta.json`, `output.csv` and `sno/`.
+
+        Args:
+            root (str, optional): Directory of the store. Defaults to SIM_CHECKPOINT_DIR.
+        """
+        self.__logger = logging.getLogger(__name__)
+        self.root = os.path.expanduser(root)
+
+    def path(self, point_id: int, fxx: int) -> str:
+        """Directory of the checkpoint of a station"""
+        return os.path.join(self.root, f"p{point_id}_fxx{fxx}")
+
+    def load(self, point_id: int, fxx: int, df: pd.DataFrame, setup: str) -> Optional[Checkpoint]:
+        """Gets the checkpoint of a station, if it can be resumed from with the given weather data.
+
+        Args:
+            point_id (int): Id of the station
+            fxx (int): fxx of the weather data
+            df (pd.DataFrame): Weather data the next run is forced with
+            setup (str): `config_hash` of the next run
+
+        Returns:
+            Optional[Checkpoint]: The checkpoint, `None` if there isn't one or it's no longer valid
+        """
+        fp = self.path(point_id, fxx)
+        meta_fp = os.path.join(fp, "meta.json")
+        if not os.path.exists(meta_fp):
+            return None
+
+        with open(meta_fp, "r") as f:
+            meta = json.load(f)
+        end = pd.Timestamp(meta['end'])
+
+        if df['time'].max() <= end:
+            # Older data than the checkpoint, there's nothing after it to resume but the checkpoint is still good
+            self.__logger.debug(f"Not resuming id {point_id} fxx {fxx}, weather data ends at {df['time'].max()} before checkpoint at {end}")
+            return None
+
+        reason = None
+        if meta['config_hash'] != setup:
+            reason = "SNOWPACK setup changed"
+        elif df['time'].min() > end:
+            reason = f"weather data {df['time'].min()} to {df['time'].max()} doesn't continue from {end}"
+        elif forcing_hash(df, end) != meta['forcing_hash']:
+            reason = "weather data changed"
+
+        if reason is not None:
+            self.__logger.info(f"Dropping checkpoint of id {point_id} fxx {fxx} at {end}, {reason}")
+            self.invalidate(point_id, fxx)
+            return None
+
+        output = pd.read_csv(os.path.join(fp, "output.csv"), parse_dates=['timestamp'])
+        return Checkpoint(end, os.path.join(fp, "sno"), output)
+
+    def save(self, point_id: int, fxx: int, df: pd.DataFrame, end: pd.Timestamp, setup: str, sno_dir: str,
+             output: pd.DataFrame) -> str:
+        """Saves the state of a station at the end of a run, replacing its last checkpoint. A checkpoint at a later
+        hour is kept instead, so backfilling an older day doesn't move the station back.
+
+        Args:
+            point_id (int): Id of the station
+            fxx (int): fxx of the weather data
+            df (pd.DataFrame): Weather data the run was forced with
+            end (pd.Timestamp): Last hour simulated
+            setup (str): `config_hash` of the run
+            sno_dir (str): Directory of the .sno files SNOWPACK wrote at `end`, named like the input sno files
+            output (pd.DataFrame): Output of every virtual slope up to `end`
+
+        Returns:
+            str: Directory of the checkpoint
+        """
+        fp = self.path(point_id, fxx)
+        meta_fp = os.path.join(fp, "meta.json")
+        if os.path.exists(meta_fp):
+            with open(meta_fp, "r") as f:
+                if pd.Timestamp(json.load(f)['end']) > pd.Timestamp(end):
+                    self.__logger.debug(f"Keeping checkpoint of id {point_id} fxx {fxx}, it's later than {end}")
+                    return fp
+
+        # Written next to the checkpoint and swapped in, so a crashed run never leaves a partial checkpoint
+        tmp_fp = f"{fp}.{uuid.uuid4().hex}.tmp"
+        shutil.copytree(sno_dir, os.path.join(tmp_fp, "sno"))
+        output.to_csv(os.path.join(tmp_fp, "output.csv"), index=False)
+        with open(os.path.join(tmp_fp, "meta.json"), "w") as f:
+            json.dump({"end": pd.Timestamp(end).isoformat(), "forcing_hash": forcing_hash(df, end),
+                       "config_hash": setup, "rows": int(np.sum(df['time'] <= end))}, f)
+
+        self.invalidate(point_id, fxx)
+        os.replace(tmp_fp, fp)
+        self.__logger.debug(f"Saved checkpoint of id {point_id} fxx {fxx} at {end} to {fp}")
+        return fp
+
+    def invalidate(self, point_id: int, fxx: int) -> None:
+        """Removes the checkpoint of a station, its next run simulates from the start of its data"""
+        fp = self.path(point_id, fxx)
+        if os.path.exists(fp):
+            old_fp = f"{fp}.{uuid.uuid4().hex}.old"
+            os.replace(fp, old_fp)
+            shutil.rmtree(old_fp, ignore_errors=True)
@@ -0,0 +1,316 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional, Union
+
+import pandas as pd
+
+from src.config import SIM_WORK_DIR, SNO_FP, SNOWPACK_BIN, SNOWPACK_INI
+from src.sim.checkpoints import CheckpointStore, config_hash
+from src.util.file import csv_to_smet, read_smet, update_sno
+from src.util.schema import cast_dataset, read_dataset
+
+logger = logging.getLogger(__name__)
+
+# Return codes SNOWPACK exits with after a successful run
+SUCCESS_CODES = [-11, 0]
+
+@dataclass
+class SimJob():
+    """A single SNOWPACK run of one station, from weather data of one point and fxx (A csv, or a DataFrame in
+    `forcing`). Each job runs in its own directory under `work_dir` with its own smet, ini, sno and output files, so
+    jobs can run at the same time."""
+    # Weather csv, or the name of the job if `forcing` is set
+    input_fp: str
+    # Directory the combined output csv is written to, `None` to only return it in `SimResult.output`
+    output_dir: Optional[str] = None
+    forcing: Optional[pd.DataFrame] = field(default=None, repr=False)
+    ini_fp: str = SNOWPACK_INI
+    sno_dir: str = SNO_FP
+    work_dir: str = SIM_WORK_DIR
+    snowpack_bin: str = SNOWPACK_BIN
+    # Keep the jobs directory after it finishes, to look at SNOWPACK's input and output
+    keep_work_dir: bool = False
+    # Remove outliers from the input before simulating, not needed for data saved by HerbieFetcher
+    clean: bool = True
+    # Resume from and save the stations SNOWPACK state here, `None` to always simulate the whole input
+    checkpoints: Optional[CheckpointStore] = None
+    # Last hour whose weather won't change (The end of the analysis data, before any forecast hours), the state
+    # at this hour is saved to `checkpoints`
+    checkpoint_at: Optional[datetime] = None
+
+    @property
+    def name(self) -> str:
+        """Name of the input file without its extension"""
+        return os.path.splitext(os.path.basename(self.input_fp))[0]
+
+@dataclass
+class SimResult():
+    """Outcome of a `SimJob`"""
+    job: SimJob
+    failed: bool
+    # Combined output of every virtual slope, `None` if the job failed. The file is only written if the job
+    # has an `output_dir`
+    output: Optional[pd.DataFrame] = field(default=None, repr=False)
+    output_fp: Optional[str] = None
+    returncode: Optional[int] = None
+    seconds: float = 0.0
+    error: str = ""
+    point_id: Optional[int] = None
+    fxx: Optional[int] = None
+    work_dir: Optional[str] = field(default=None, repr=False)
+    # Hour the run resumed from a checkpoint at, `None` if it simulated the whole input
+    resumed_from: Optional[pd.Timestamp] = None
+
+def run_sim_job(job: SimJob) -> SimResult:
+    """Runs SNOWPACK for one station in a new working directory, and combines the output of each virtual slope
+    into one DataFrame. If the job has an output directory, it's also written to a csv there
+    (`snow_{start year}-{end year}_p{id}_fxx{fxx}.csv`). The working directory only holds the files SNOWPACK reads
+    and writes.
+
+    If the job has a checkpoint store, the run resumes from the station's checkpoint when the weather it was
+    simulated from hasn't changed, and only the hours after it are simulated. When `checkpoint_at` falls inside
+    the data, the run is split there and the state at `checkpoint_at` is saved for the next run.
+
+    Args:
+        job (SimJob): Job to run
+
+    Returns:
+        SimResult: Result of the job, failures are returned rather than raised
+    """
+    s_time = time.perf_counter()
+    os.makedirs(job.work_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f"{job.name}_", dir=job.work_dir)
+    result = SimResult(job, failed=True, work_dir=work_dir)
+
+    try:
+        input_dir = os.path.join(work_dir, "input")
+        sno_dir = os.path.join(input_dir, "sno")
+
+        # Get 'station' data and some config info
+        if job.forcing is not None:
+            df = cast_dataset(job.forcing.copy(), "weather")
+        else:
+            df = read_dataset(job.input_fp, "weather")
+        result.fxx = int(df['fxx'].unique()[0])
+        result.point_id = int(df['point_id'].unique()[0])
+
+        smet_name = f"{job.name}.smet"
+        station_data = csv_to_smet(df, os.path.basename(job.input_fp), input_dir, smet_name, clean=job.clean)
+
+        begin, end = df['time'].min(), df['time'].max()
+        frames = []
+        checkpoint = None
+        if job.checkpoints is not None:
+            setup = config_hash(job.ini_fp, job.sno_dir, job.snowpack_bin)
+            checkpoint = job.checkpoints.load(result.point_id, result.fxx, df, setup)
+
+        if checkpoint is not None:
+            shutil.copytree(checkpoint.sno_dir, sno_dir)
+            begin = checkpoint.end
+            frames.append(checkpoint.output)
+            result.resumed_from = checkpoint.end
+        else:
+            # Update the jobs copy of the sno files with the stations data
+            shutil.copytree(job.sno_dir, sno_dir)
+            update_sno(station_data["id"], station_data["lat"], station_data["lon"], station_data["alt"], sno_dir=sno_dir)
+
+        segments = [(begin, end)]
+        if job.checkpoints is not None and job.checkpoint_at is not None:
+            checkpoint_at = pd.Timestamp(job.checkpoint_at)
+            if begin < checkpoint_at < end:
+                segments = [(begin, checkpoint_at), (checkpoint_at, end)]
+
+        for i, (seg_begin, seg_end) in enumerate(segments):
+            output_dir = os.path.join(work_dir, f"output_{i}")
+            seg_frames = _run_snowpack(job, result, work_dir, output_dir, input_dir, sno_dir, smet_name, seg_begin, seg_end)
+            if seg_frames is None:
+                return result
+
+            # Rows at the hour a run starts from are already in the output of the run before it
+            if seg_begin != df['time'].min():
+                seg_frames = [f[f['timestamp'] > seg_begin] for f in seg_frames]
+            frames.extend(seg_frames)
+
+            # SNOWPACK's end of run state is where the next segment, or the next run, starts
+            sno_dir = _collect_sno(output_dir, os.path.join(work_dir, f"state_{i}"))
+            if job.checkpoints is not None and job.checkpoint_at is not None and seg_end == pd.Timestamp(job.checkpoint_at):
+                job.checkpoints.save(result.point_id, result.fxx, df, seg_end, setup, sno_dir, pd.concat(frames))
+
+        result.output = combine_output(frames)
+        if job.output_dir is not None:
+            result.output_fp = write_output(result.output, job.output_dir, result.point_id, result.fxx)
+        result.failed = False
+    except Exception as e:
+        result.error = str(e)
+        logger.warning(f"Simulation of {job.input_fp} failed: {e}")
+    finally:
+        result.seconds = time.perf_counter() - s_time
+        if not job.keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+def _run_snowpack(job: SimJob, result: SimResult, work_dir: str, output_dir: str, input_dir: str, sno_dir: str,
+                  smet_name: str, begin: pd.Timestamp, end: pd.Timestamp) -> Optional[list[pd.DataFrame]]:
+    """Runs SNOWPACK from `begin` to `end` with the sno files in `sno_dir`, and reads the output of each virtual slope.
+    Returns `None` and sets the error of the result if SNOWPACK failed."""
+    os.makedirs(output_dir)
+    ini_fp = os.path.join(work_dir, "io.ini")
+    _write_ini(job.ini_fp, ini_fp, smet_name, {
+        "[INPUT]": {"METEOPATH": input_dir, "SNOWPATH": sno_dir},
+        "[OUTPUT]": {"METEOPATH": output_dir, "SNOWPATH": output_dir},
+    })
+
+    logger.debug(f"Running SNOWPACK id {result.point_id} fxx {result.fxx} {begin.isoformat()} to {end.isoformat()} in {work_dir}")
+
+    process = subprocess.run([job.snowpack_bin, "-b", begin.isoformat(), "-e", end.isoformat(), "-c", ini_fp],
+                             capture_output=True, text=True, cwd=work_dir)
+    result.returncode = process.returncode
+
+    # Codes -11 and 0 usually mean SNOWPACK ran successfully
+    if process.returncode not in SUCCESS_CODES:
+        result.error = process.stderr or process.stdout or f"SNOWPACK exited with code {process.returncode}"
+        logger.warning(f"SNOWPACK failed for {job.input_fp} with code {process.returncode}: {process.stderr}")
+        logger.warning(process.stdout)
+        return None
+
+    # Read the smet output of each slope
+    frames = []
+    for of in sorted(os.listdir(output_dir)):
+        if of.endswith(".smet") and str(result.point_id) in of:
+            frames.append(read_smet(os.path.join(output_dir, of)).to_frame().drop_duplicates())
+
+    if len(frames) == 0:
+        result.error = "SNOWPACK wrote no output"
+        return None
+    return frames
+
+def _collect_sno(output_dir: str, sno_dir: str) -> str:
+    """Copies the .sno files SNOWPACK wrote at the end of a run into a directory of input sno files, SNOWPACK names
+    them `{station}_{experiment}.sno` while it reads `{station}.sno`"""
+    os.makedirs(sno_dir)
+    for of in os.listdir(output_dir):
+        if of.endswith(".sno"):
+            shutil.copy(os.path.join(output_dir, of), os.path.join(sno_dir, f"{of.split('.')[0].split('_')[0]}.sno"))
+    return sno_dir
+
+def combine_output(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Combines SNOWPACK output into one DataFrame sorted by time, without missing values or duplicate rows.
+
+    Args:
+        frames (list[pd.DataFrame]): Output of each virtual slope
+
+    Returns:
+        pd.DataFrame: Combined output
+    """
+    merged_df = pd.concat(frames)
+    merged_df['timestamp'] = pd.to_datetime(merged_df['timestamp'])
+    merged_df.sort_values(by='timestamp', inplace=True)
+    merged_df.dropna(inplace=True)
+    merged_df.drop_duplicates(inplace=True)
+    return merged_df.reset_index(drop=True)
+
+def write_output(frames: Union[pd.DataFrame, list[pd.DataFrame]], output_dir: str, point_id: int, fxx: int) -> str:
+    """Writes SNOWPACK output to one csv, combined by `combine_output` if it's the output of each virtual slope.
+
+    Args:
+        frames (Union[pd.DataFrame, list[pd.DataFrame]]): Combined output, or the output of each virtual slope
+        output_dir (str): Directory to write to
+        point_id (int): Id of the station, used in the file name
+        fxx (int): fxx of the input data, used in the file name
+
+    Returns:
+        str: File path of the csv
+    """
+    merged_df = combine_output(frames) if isinstance(frames, list) else frames
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_fp = os.path.join(output_dir, f"snow_{merged_df['timestamp'].min().year}-{merged_df['timestamp'].max().year}_p{point_id}_fxx{fxx}.csv")
+    merged_df.to_csv(output_fp, index=False)
+    return output_fp
+
+def simulate(forcing: pd.DataFrame, name: Optional[str] = None, **kwargs) -> pd.DataFrame:
+    """Runs SNOWPACK for one station in this process, from weather data in memory to output in memory.
+
+    Args:
+        forcing (pd.DataFrame): Weather data of one point and fxx
+        name (Optional[str], optional): Name of the job, used for its working directory. Defaults to None (The point id).
+        **kwargs: Other fields of the `SimJob`
+
+    Raises:
+        RuntimeError: If the simulation failed
+
+    Returns:
+        pd.DataFrame: Combined output of every virtual slope
+    """
+    name = name if name else str(int(forcing['point_id'].iloc[0]))
+    result = run_sim_job(SimJob(name, forcing=forcing, **kwargs))
+    if result.failed:
+        raise RuntimeError(f"Simulation of {name} failed: {result.error}")
+    return result.output # type: ignore
+
+def _write_ini(template_fp: str, output_fp: str, smet_name: str, paths: dict[str, dict[str, str]]) -> None:
+    """Writes a copy of a SNOWPACK ini file that reads the given station and uses the given paths for each section"""
+    with open(template_fp, "r") as ini_file:
+        lines = ini_file.readlines()
+
+    section = ""
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith("["):
+            section = stripped.upper()
+            continue
+        key = stripped.split("=")[0].strip().upper() if "=" in stripped else ""
+        if key == "STATION1":
+            lines[i] = f"STATION1 = {smet_name}\n"
+        elif key in paths.get(section, {}):
+            lines[i] = f"{key} = {os.path.abspath(paths[section][key])}\n"
+
+    with open(output_fp, "w") as ini_file:
+        ini_file.writelines(lines)
+
+class SimRunner():
+    def __init__(self, max_workers: Optional[int] = None):
+        """Runs `SimJob`s on a pool of worker processes, one SNOWPACK process per worker. Each job has its own
+        working directory, so any number of jobs can run at once.
+
+        Args:
+            max_workers (Optional[int], optional): Max number of simulations at once. Defaults to None (Number of cores).
+        """
+        self.__logger = logging.getLogger(__name__)
+        self.max_workers = max_workers if max_workers else os.cpu_count()
+
+    def run(self, jobs: list[SimJob]) -> list[SimResult]:
+        """Runs the given jobs and waits for all of them.
+
+        Args:
+            jobs (list[SimJob]): Jobs to run
+
+        Returns:
+            list[SimResult]: Result of each job, in the order of `jobs`
+        """
+        if len(jobs) == 0:
+            return []
+
+        s_time = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor: # type: ignore
+            futures = [executor.submit(run_sim_job, job) for job in jobs]
+            results = [self.__result(job, future) for job, future in zip(jobs, futures)]
+
+        n_failed = sum(r.failed for r in results)
+        self.__logger.info(f"Ran {len(jobs)} simulations ({n_failed} failed) in {time.perf_counter() - s_time:.1f}s")
+        return results
+
+    def __result(self, job: SimJob, future: Future) -> SimResult:
+        """Gets the result of a job, jobs whose worker died are returned as failed"""
+        try:
+            return future.result()
+        except Exception as e:
+            self.__logger.warning(f"Simulation of {job.input_fp} failed: {e}")
+            return SimResult(job, failed=True, error=str(e))
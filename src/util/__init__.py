@@ -1,4 +1,5 @@
-__all__ = ["df", "geo"]
+__all__ = ["df", "geo", "schema"]
 
 from .df import *
-from .geo import *
\ No newline at end of file
+from .geo import *
+from .schema import *
\ No newline at end of file
@@ -1,51 +1,164 @@
 import logging
-import pandas as pd
+from datetime import datetime
+from typing import Literal, Optional
 
-from datetime import timedelta
+import numpy as np
+import pandas as pd
 
-from src import REQ_COLS
+from src import OUTLIER_BOUNDS, REQ_COLS, SUMMER_MONTHS, VAR_OUTLIER_BOUNDS
 
 logger = logging.getLogger(__name__)
 
-def remove_outliers(df: pd.DataFrame, time_col: str = 'time') -> pd.DataFrame:
+def remove_outliers(df: pd.DataFrame, time_col: str = 'time', bounds: Optional[dict[str, tuple[float, float]]] = None) -> pd.DataFrame:
     """Removes outliers in each row of the given dataFrame. This is mainly used after pulling HRRR data as sometimes
-    the data will be extremely unrealistice (Like 10,000 for temperature). All of the data should never be outside
-    of -10 < x < 1000, so any of those 'bad' values get removed. 
+    the data will be extremely unrealistice (Like 10,000 for temperature). Values outside of the bounds of their
+    variable (`OUTLIER_BOUNDS` unless set in `VAR_OUTLIER_BOUNDS` or `bounds`) are replaced with the average of the
+    hour before and after at the same point (Or just one of them if the other is missing or also an outlier).
+
+    Every column is checked at once: rows are ordered by series (point_id and fxx) and hour, and the hours before
+    and after each row are found by shifting that order by one.
 
     Args:
         df (pd.DataFrame): DataFrame to remove outliers from
+        time_col (str, optional): Column with the hour of each row. Defaults to 'time'.
+        bounds (Optional[dict[str, tuple[float, float]]], optional): (min, max) of variables, overriding the bounds in
+            the config. Defaults to None.
 
     Returns:
-        pd.DataFrame: Cleaned dataFrame
+        pd.DataFrame: Cleaned dataFrame, sorted by `time_col`
     """
     df = df.sort_values(by=time_col)
-    for c in df.columns:
-        if c in ['time','point_id','fxx','valid_time']:
-            continue
-            
-        min_val = -10
-        max_val = 1000
-        
-        bad_vals = df[(df[c] > max_val) | (df[c] < min_val)]
-
-        if bad_vals.shape[0] != 0:
-            for index, row in bad_vals.iterrows():
-                # Get data from prev and next hours
-                prev = df[(df[time_col] == row[time_col] - timedelta(hours=1)) & (df['point_id'] == row['point_id'])]
-                next = df[(df[time_col] == row[time_col] + timedelta(hours=1)) & (df['point_id'] == row['point_id'])]
-
-                if index == 0:
-                    # First row, only next row exists
-                    df.loc[index, c] = next[c].values[0] # type: ignore
-                elif index == df.shape[0] - 1:
-                    # Last row, only previous row exists
-                    df.loc[index, c] = prev[c].values[0] # type: ignore
-                else:
-                    # Middle rows, average of previous and next
-                    df.loc[index, c] = (next[c].values[0] + prev[c].values[0]) / 2 # type: ignore
-            logger.info(f"Replaced {bad_vals.shape[0]} major outliers in col {c}")
+    bounds = {**VAR_OUTLIER_BOUNDS, **(bounds if bounds else {})}
+
+    data_cols = [c for c in df.columns if c not in REQ_COLS and pd.api.types.is_numeric_dtype(df[c])
+                 and not pd.api.types.is_bool_dtype(df[c])]
+    if df.empty or not data_cols:
+        return df
+
+    values = df[data_cols].to_numpy(dtype=np.float64)
+    mins = np.array([bounds.get(c, OUTLIER_BOUNDS)[0] for c in data_cols])
+    maxs = np.array([bounds.get(c, OUTLIER_BOUNDS)[1] for c in data_cols])
+    bad = (values < mins) | (values > maxs)
+
+    if not bad.any():
+        return df
+
+    # Order rows by series then hour, so the neighbors of a row are the rows next to it in that order
+    times = df[time_col] if pd.api.types.is_datetime64_any_dtype(df[time_col]) else pd.to_datetime(df[time_col], format='mixed')
+    times = times.to_numpy().astype('datetime64[ns]').view(np.int64)
+    series = [df[c].to_numpy() for c in ['fxx', 'point_id'] if c in df.columns]
+    order = np.lexsort([times] + series)
+
+    ordered = np.where(bad, np.nan, values)[order]
+    hour = np.int64(3600 * 10**9)
+    same_series = np.ones(len(order) - 1, dtype=bool)
+    for s in series:
+        same_series &= s[order][1:] == s[order][:-1]
+    # Row i + 1 is the hour after row i
+    adjacent = same_series & (np.diff(times[order]) == hour)
+
+    prev = np.full_like(ordered, np.nan)
+    next = np.full_like(ordered, np.nan)
+    prev[1:][adjacent] = ordered[:-1][adjacent]
+    next[:-1][adjacent] = ordered[1:][adjacent]
+
+    n_valid = (~np.isnan(prev)).astype(np.int8) + ~np.isnan(next)
+    with np.errstate(invalid='ignore'):
+        neighbors = (np.nan_to_num(prev) + np.nan_to_num(next)) / n_valid
+
+    fixed = values.copy()
+    fixed[order] = np.where(bad[order], neighbors, values[order])
+
+    for i in np.flatnonzero(bad.any(axis=0)):
+        c = data_cols[i]
+        n_missing = int(np.isnan(fixed[:, i][bad[:, i]]).sum())
+        df[c] = fixed[:, i].astype(df[c].dtype) if df[c].dtype.kind == 'f' else fixed[:, i]
+        logger.info(f"Replaced {int(bad[:, i].sum())} major outliers in col {c}"
+                    + (f", {n_missing} had no valid neighbors and were set to missing" if n_missing else ""))
     return df
 
+def fill_gaps(df: pd.DataFrame, time_col: str = 'time', method: Literal["linear", "nearest"] = "linear", max_gap: Optional[int] = None,
+              start: Optional[datetime] = None, end: Optional[datetime] = None, only_filled: bool = False) -> tuple[pd.DataFrame, dict[str, int]]:
+    """Fills missing hours and missing values in the given DataFrame. Each (point_id, fxx) series is reindexed onto
+    the full hourly calendar (Without summer months) once, and then every gap in every column is filled in one pass.
+    Only gaps with data on both sides are filled, gaps at the start or end of a series are left missing.
+
+    Args:
+        df (pd.DataFrame): DataFrame to fill, must have the `REQ_COLS` columns
+        time_col (str, optional): Column to build the calendar from, the other time column is derived using fxx. Defaults to 'time'.
+        method (Literal["linear", "nearest"], optional): Linear interpolation or nearest valid hour. Defaults to "linear".
+        max_gap (Optional[int], optional): Longest gap (In hours) to fill, longer gaps are left missing. Defaults to None (No limit).
+        start (Optional[datetime], optional): First hour of the calendar. Defaults to None (First hour of each series).
+        end (Optional[datetime], optional): Last hour of the calendar. Defaults to None (Last hour of each series).
+        only_filled (bool, optional): Only return rows with at least one filled value. Defaults to False.
+
+    Returns:
+        tuple[pd.DataFrame, dict[str, int]]: Filled DataFrame (Rows that still have no data are dropped) and the number of values filled in each column
+    """
+    validate_df(df)
+
+    other_col = 'valid_time' if time_col == 'time' else 'time'
+    data_cols = [c for c in df.columns if c not in REQ_COLS and pd.api.types.is_numeric_dtype(df[c])]
+    counts = dict.fromkeys(data_cols, 0)
+
+    df = df.copy()
+    df[time_col] = pd.to_datetime(df[time_col], format='mixed')
+
+    frames = []
+    for (point, fxx), group in df.groupby(['point_id', 'fxx']):
+        group = group.drop_duplicates(subset=[time_col], keep='last').set_index(time_col).sort_index()
+
+        calendar = pd.date_range(start if start else group.index.min(), end if end else group.index.max(), freq='1h')
+        calendar = calendar[~calendar.month.isin(SUMMER_MONTHS)]
+        group = group.reindex(calendar)
+
+        values = group[data_cols].to_numpy(dtype=np.float64)
+        n = values.shape[0]
+        valid = ~np.isnan(values)
+
+        # Position of the closest valid value before and after each cell
+        pos = np.arange(n)[:, None]
+        prev_pos = np.maximum.accumulate(np.where(valid, pos, -1), axis=0)
+        next_pos = np.minimum.accumulate(np.where(valid, pos, n)[::-1], axis=0)[::-1]
+
+        fill = ~valid & (prev_pos >= 0) & (next_pos < n)
+        if max_gap is not None:
+            fill &= (next_pos - prev_pos - 1) <= max_gap
+
+        prev_vals = np.take_along_axis(values, np.clip(prev_pos, 0, n - 1), axis=0)
+        next_vals = np.take_along_axis(values, np.clip(next_pos, 0, n - 1), axis=0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if method == "linear":
+                filled = prev_vals + (next_vals - prev_vals) * (pos - prev_pos) / (next_pos - prev_pos)
+            elif method == "nearest":
+                filled = np.where(pos - prev_pos <= next_pos - pos, prev_vals, next_vals)
+            else:
+                raise ValueError(f"Unknown fill method {method}")
+
+        group[data_cols] = np.where(fill, filled, values)
+        for c, n_filled in zip(data_cols, fill.sum(axis=0)):
+            counts[c] += int(n_filled)
+
+        group.index.name = time_col
+        group = group.reset_index()
+        group['point_id'] = point
+        group['fxx'] = fxx
+        offset = pd.to_timedelta(group['fxx'], unit='h')
+        group[other_col] = group[time_col] + offset if time_col == 'time' else group[time_col] - offset
+
+        keep = group[data_cols].notna().any(axis=1)
+        if only_filled:
+            keep &= fill.any(axis=1)
+        frames.append(group[keep])
+
+    filled_df = pd.concat(frames, ignore_index=True)[df.columns] if frames else df.iloc[0:0]
+
+    for c, n_filled in counts.items():
+        if n_filled > 0:
+            logger.info(f"Filled {n_filled} missing values in col {c}")
+    return filled_df, counts
+
 def validate_df(df: pd.DataFrame):
     """Validates given dataFrame by ensuring all of the `REQ_COLS` are present.
 
@@ -1,15 +1,19 @@
 import json
 import os
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any
+from functools import lru_cache
+from typing import Any, Optional, TextIO, Union
 from zoneinfo import ZoneInfo
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 
-from src.config import COORDS_FP, SNO_FP
+from src.config import COORDS_FP, SMET_NODATA, SMET_PRECISION, SNO_FP
 from src.util.df import remove_outliers, validate_df
 from src.util.geo import find_elevation
+from src.util.schema import read_dataset
 
 VAR_MAP = {
     "time":"timestamp",
@@ -28,7 +32,7 @@ VAR_MAP = {
     "sde":"HS"
 }
 
-def csv_to_smet(df: pd.DataFrame, data_source: str, output_file_path: str, output_file_name: str) -> dict[str,Any]:
+def csv_to_smet(df: pd.DataFrame, data_source: str, output_file_path: str, output_file_name: str, clean: bool = True) -> dict[str,Any]:
     """Converts the given data frame to a smet file. 
     
     #### SMET file specification
@@ -39,26 +43,30 @@ def csv_to_smet(df: pd.DataFrame, data_source: str, output_file_path: str, outpu
         data_source (str): File where data came from
         output_file_path (str): Directory to output data to
         output_file_name (str): Name of file to output to, **File is rewritten**
+        clean (bool, optional): Run `remove_outliers` on the data first, data saved by HerbieFetcher has already
+            been cleaned. Defaults to True.
 
     Returns:
         dict[str,str]: Dictionary with station data (Currently id, lat, lon, alt)
     """
     validate_df(df)
     
-    df = remove_outliers(df)
-    
-    df['time'] = pd.to_datetime(df['time'])
+    if clean:
+        df = remove_outliers(df)
     
     station_id = int(df['point_id'].unique()[0])
     
-    coords = gpd.read_file(COORDS_FP)
+    coords = _load_coords()
     
+    # Units are converted on a copy of the columns written, the callers frame is left as it is
+    df = df[list(VAR_MAP.keys())].copy()
+    df['time'] = pd.to_datetime(df['time'])
     df['r2'] = df['r2'] / 100 # Convert to decimal
     df['prate'] = df['prate'] * 60 * 60 # kg/m2/s = mm/s, so * 60 == mm/min * 60 = mm/hr
 
-    df = df[VAR_MAP.keys()].copy()
     df.rename(mapper=VAR_MAP, inplace=True, axis=1)
-    df.sort_values(by='timestamp',inplace=True)
+    # Stable, so the first row of an hour given more than once is the one kept
+    df.sort_values(by='timestamp',inplace=True,kind='stable')
     df.drop_duplicates(subset=['timestamp'],keep="first",inplace=True)
     
     station_coords = coords[coords['id'] == station_id]
@@ -67,34 +75,164 @@ def csv_to_smet(df: pd.DataFrame, data_source: str, output_file_path: str, outpu
 
     os.makedirs(output_file_path, exist_ok=True)
 
-    with open(os.path.join(output_file_path, output_file_name), "w") as file:
-        file.write("SMET 1.1 ASCII\n")
-        file.write("[HEADER]\n")
-        file.write(f"station_id = {station_id}\n")
-        file.write(f"station_name = s_{station_id}\n")
-        file.write(f"latitude = {station_coords['lat'].values[0]}\n")
-        file.write(f"longitude = {station_coords['lon'].values[0]}\n")
-        file.write(f"altitude = {station_altitude}\n")
-        file.write(f"epsg = 4326\n")
-        file.write("tz = 0\n")
-        file.write("nodata = -999\n")
-        file.write(f"source = {data_source}\n")
-        file.write(f"creation = {datetime.now().isoformat()}\n")
-        file.write(f"fields = {' '.join(df.columns)}\n")
-        
-        file.write(f"[DATA]\n")
-        
-        for _, row in df.iterrows():
-            row.iloc[0] = row.iloc[0].isoformat()
-            row = [str(d) for d in row]
-            file.write(' '.join(row) + "\n")
+    write_smet(df, os.path.join(output_file_path, output_file_name), {
+        "station_id": station_id,
+        "station_name": f"s_{station_id}",
+        "latitude": station_coords['lat'].values[0],
+        "longitude": station_coords['lon'].values[0],
+        "altitude": station_altitude,
+        "epsg": 4326,
+        "tz": 0,
+        "source": data_source,
+        "creation": datetime.now().isoformat(),
+    })
     return {
         "id":station_id,
         "lat":station_coords['lat'].values[0],
         "lon":station_coords['lon'].values[0],
         "alt":station_altitude
     }
+
+def write_smet(df: pd.DataFrame, output: Union[str, TextIO], header: dict[str, Any], precision: int = SMET_PRECISION,
+               nodata: float = SMET_NODATA) -> None:
+    """Writes a SMET file, with the data block built as one string and written at once instead of row by row.
+    Values are written with a fixed number of decimals, missing and infinite values are written as `nodata`.
+
+    Args:
+        df (pd.DataFrame): Data with the timestamp as the first column, the columns are the SMET fields
+        output (Union[str, TextIO]): File path to write to (**File is rewritten**), or an open text file or pipe
+        header (dict[str, Any]): Header values besides `nodata` and `fields`, in the order they're written
+        precision (int, optional): Decimals of each value. Defaults to SMET_PRECISION.
+        nodata (float, optional): Value written for missing data. Defaults to SMET_NODATA.
+    """
+    if isinstance(output, str):
+        with open(output, "w") as file:
+            write_smet(df, file, header, precision, nodata)
+        return
+
+    lines = ["SMET 1.1 ASCII", "[HEADER]"]
+    lines += [f"{k} = {v}" for k, v in header.items()]
+    lines += [f"nodata = {nodata:g}", f"fields = {' '.join(df.columns)}", "[DATA]"]
+    output.write("\n".join(lines) + "\n")
+
+    timestamps = np.datetime_as_string(pd.to_datetime(df.iloc[:, 0]).to_numpy(dtype="datetime64[s]"), unit="s")
+    values = df.iloc[:, 1:].to_numpy(dtype=np.float64)
+    values = np.where(np.isfinite(values), values, np.nan)
+
+    # One format string for the whole row, missing values are formatted as "nan" and swapped for nodata after
+    row_format = "%s" + f" %.{precision}f" * values.shape[1]
+    data = "\n".join([row_format % row for row in zip(timestamps.tolist(), *values.T.tolist())])
+    if len(timestamps) > 0:
+        output.write(data.replace("nan", f"{nodata:g}") + "\n")
+
+def legacy_write_smet_data(df: pd.DataFrame, file: TextIO) -> None:
+    """Writes the data block of a SMET file one row at a time, the way `csv_to_smet` did before `write_smet`. Kept
+    to benchmark against.
+
+    Args:
+        df (pd.DataFrame): Data with the timestamp as the first column
+        file (TextIO): File to write to
+    """
+    for _, row in df.iterrows():
+        row.iloc[0] = row.iloc[0].isoformat()
+        row = [str(d) for d in row]
+        file.write(' '.join(row) + "\n")
+
+@lru_cache(maxsize=1)
+def _load_coords() -> gpd.GeoDataFrame:
+    """Reads `COORDS_FP` once per process, every simulation looks up its station in it"""
+    return gpd.read_file(COORDS_FP)
             
+@dataclass
+class SmetData():
+    """Data and header of a SMET file, see `read_smet`"""
+    # Every header value, numbers are converted to floats
+    header: dict[str, Any]
+    # Values of each loaded field, the timestamp as datetime64 and every other field as float64
+    columns: dict[str, np.ndarray]
+
+    @property
+    def station_id(self) -> int:
+        """Id of the station, slopes of a station (`{id}{slope}`) have the id of the station"""
+        return int(str(self.header['station_id'])[:3])
+
+    @property
+    def altitude(self) -> float:
+        return float(self.header['altitude'])
+
+    @property
+    def slope_angle(self) -> float:
+        return float(self.header['slope_angle'])
+
+    @property
+    def slope_azi(self) -> float:
+        return float(self.header['slope_azi'])
+
+    def to_frame(self, metadata: bool = True) -> pd.DataFrame:
+        """Gets the data as a DataFrame.
+
+        Args:
+            metadata (bool, optional): Add 'id', 'altitude', 'slope_angle' and 'slope_azi' columns, like the csv
+                files `smet_to_csv` writes. Defaults to True.
+
+        Returns:
+            pd.DataFrame: One row per line of the data block
+        """
+        df = pd.DataFrame(self.columns)
+        if metadata:
+            df['id'] = self.station_id
+            df['altitude'] = self.altitude
+            df['slope_angle'] = self.slope_angle
+            df['slope_azi'] = self.slope_azi
+        return df
+
+def read_smet(data_source: str, columns: Optional[list[str]] = None, nodata_as_nan: bool = False) -> SmetData:
+    """Reads a SMET file, like the output of SNOWPACK. The header is parsed once and the data block is loaded in
+    bulk by pandas' C parser, with the type of each field set up front.
+
+    Args:
+        data_source (str): File to read
+        columns (Optional[list[str]], optional): Fields to load. Defaults to None (Every field).
+        nodata_as_nan (bool, optional): Replace the header's `nodata` value with NaN. Defaults to False.
+
+    Raises:
+        ValueError: If the file has no station_id or fields, or a column isn't one of its fields
+
+    Returns:
+        SmetData: Header and values of the loaded fields
+    """
+    header: dict[str, Any] = {}
+    with open(data_source, "r") as file:
+        line = file.readline()
+        while line and line.strip() != "[DATA]":
+            if "=" in line:
+                key, value = [v.strip() for v in line.split("=", 1)]
+                try:
+                    header[key] = float(value)
+                except ValueError:
+                    header[key] = value
+            line = file.readline()
+
+        if "station_id" not in header or "fields" not in header:
+            raise ValueError("No station_id or field names found!")
+
+        fields = str(header['fields']).split()
+        columns = fields if columns is None else columns
+        missing = [c for c in columns if c not in fields]
+        if missing:
+            raise ValueError(f"{data_source} has no fields {missing}, fields are {fields}")
+
+        time_fields = [f for f in fields if f in ("timestamp", "julian")]
+        df = pd.read_csv(file, sep=r"\s+", header=None, names=fields, usecols=columns, engine="c",
+                         dtype={f: (str if f in time_fields else np.float64) for f in columns})
+
+    if nodata_as_nan and "nodata" in header:
+        df = df.replace(header['nodata'], np.nan)
+    if "timestamp" in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format="ISO8601")
+
+    return SmetData(header, {c: df[c].to_numpy() for c in columns})
+
 def smet_to_csv(data_source: str, output_file_path: str,output_file_name: str) -> None:
     """Converts the data found in data source to a csv file. 
 
@@ -104,7 +242,23 @@ def smet_to_csv(data_source: str, output_file_path: str,output_file_name: str) -
         output_file_name (str): Name of file to output to, **File is rewritten**
 
     Raises:
-        ValueError: _description_
+        ValueError: If the file has no station_id or fields
+    """
+    df = read_smet(data_source).to_frame()
+    df.drop_duplicates(inplace=True)
+    
+    os.makedirs(output_file_path, exist_ok=True)
+    
+    df.to_csv(os.path.join(output_file_path,output_file_name), index=False)
+
+def legacy_read_smet(data_source: str) -> pd.DataFrame:
+    """Reads a SMET file line by line, the way `smet_to_csv` did before `read_smet`. Kept to benchmark against.
+
+    Args:
+        data_source (str): File to read
+
+    Returns:
+        pd.DataFrame: Data with 'id', 'altitude', 'slope_angle' and 'slope_azi' columns
     """
     data = []
     with open(data_source, "r") as file:
@@ -125,9 +279,6 @@ def smet_to_csv(data_source: str, output_file_path: str,output_file_name: str) -
             
             if not line:
                 break
-            
-        if not station_id or not col_names: # type: ignore
-            raise ValueError("No station_id or field names found!")
         
         while line:
             line = file.readline().strip().split()
@@ -138,19 +289,14 @@ def smet_to_csv(data_source: str, output_file_path: str,output_file_name: str) -
                     line[i] = line[i]
             data.append(line)
             
-    df = pd.DataFrame(data=data, columns=col_names)
-    df['id'] = station_id
+    df = pd.DataFrame(data=data, columns=col_names) # type: ignore
+    df['id'] = station_id # type: ignore
     df['altitude'] = altitude # type: ignore
     df['slope_angle'] = slope_angle # type: ignore
     df['slope_azi'] = slope_azi # type: ignore
-    
-    df.drop_duplicates(inplace=True)
-    
-    os.makedirs(output_file_path, exist_ok=True)
-    
-    df.to_csv(os.path.join(output_file_path,output_file_name), index=False)
-    
-def update_sno(id: int, lat: float, lon: float, altitude: float, year: int = 2020) -> None:
+    return df
+
+def update_sno(id: int, lat: float, lon: float, altitude: float, year: int = 2020, sno_dir: str = SNO_FP) -> None:
     """Updates sno files to work with given data. Since all sno files contain the same data
     besides the given parameters, this avoids having to have multiple sno files for each station.
 
@@ -160,9 +306,10 @@ def update_sno(id: int, lat: float, lon: float, altitude: float, year: int = 202
         lon (float): longitude of station
         altitude (float): altitude of station
         year (int, optional): Start year of simulation. Defaults to 2020.
+        sno_dir (str, optional): Directory of the sno files, they're renamed and rewritten in place. Defaults to SNO_FP.
     """
-    for fn in os.listdir(SNO_FP):
-        fp = os.path.join(SNO_FP, fn)
+    for fn in os.listdir(sno_dir):
+        fp = os.path.join(sno_dir, fn)
 
         # Read sno file
         with open(fp, 'r') as sno_file:
@@ -191,7 +338,7 @@ def update_sno(id: int, lat: float, lon: float, altitude: float, year: int = 202
             new_name = str(id) + new_name[-1]
         new_name += ".sno"
         
-        new_fp = os.path.join(SNO_FP, new_name)
+        new_fp = os.path.join(sno_dir, new_name)
         
         os.rename(fp, new_fp)
         
@@ -201,7 +348,7 @@ def update_sno(id: int, lat: float, lon: float, altitude: float, year: int = 202
         with open(new_fp, 'w') as new_sno:
             new_sno.writelines(lines) # type: ignore
 
-def csv_to_json(input_fp: str, output_fp: str) -> None:
+def csv_to_json(input_fp: str, output_fp: str, dataset: str = "day_predictions") -> None:
     """Converts the given csv file to json for web display.
 
     Output format:
@@ -213,11 +360,12 @@ def csv_to_json(input_fp: str, output_fp: str) -> None:
     Args:
         input_fp (str): Input file path
         output_fp (str): Output file path
+        dataset (str, optional): Schema of the input file (See `SCHEMAS`). Defaults to "day_predictions".
 
     Raises:
         ValueError: If the required columns aren't in the given df
     """
-    df = pd.read_csv(input_fp)
+    df = read_dataset(input_fp, dataset)
 
     required_cols = {
         "date",
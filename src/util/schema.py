@@ -0,0 +1,96 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import pandas as pd
+
+from src.config import EXP_COLS, REQ_COLS
+
+# HRRR variables are stored with ~7 significant digits at most, float32 keeps all of them
+HRRR_VARS = [c for c in EXP_COLS if c not in REQ_COLS]
+
+# Dtypes the reader can parse straight into, integer columns are cast after reading since older
+# files can have them written as floats (Like 3.0 when a column had missing values)
+_PARSE_KINDS = ("float32", "float64", "category")
+
+@dataclass
+class Schema():
+    """Columns of a dataset and the compact dtypes they are loaded as. Columns that aren't listed keep the dtype
+    they are read as, unless `default_dtype` is set, then any float64 column is cast to it."""
+    dtypes: dict[str, str]
+    dates: list[str] = field(default_factory=list)
+    default_dtype: Optional[str] = None
+
+SCHEMAS = {
+    # Fetched HRRR data, the csv files of HerbieFetcher and the partitions of WeatherStore
+    "weather": Schema({'fxx': 'int8', 'point_id': 'int32', **{c: 'float32' for c in HRRR_VARS}}, dates=['time', 'valid_time']),
+    # Averaged SNOWPACK output and the predictions of each point
+    "predictions": Schema({'id': 'int32', 'slope_angle': 'float32', 'slope_azi': 'float32', 'altitude': 'float32',
+                           'predicted_danger': 'Int8'}, dates=['date'], default_dtype='float32'),
+    # Predictions aggregated by zone, elevation band and slope
+    "day_predictions": Schema({'zone_name': 'category', 'elevation_band': 'category', 'slope_angle': 'category',
+                               'predicted_danger': 'Int8'}, dates=['date']),
+    # Scraped FAC forecasts, one row per zone and day
+    "fac_archive": Schema({'zone_name': 'category', 'upper': 'Int8', 'middle': 'Int8', 'lower': 'Int8'}, dates=['date']),
+    # Cleaned FAC forecasts, one row per zone, elevation band and day
+    "fac_danger": Schema({'zone_name': 'category', 'elevation_band': 'category', 'slope_angle': 'category',
+                          'actual_danger': 'Int8'}, dates=['date']),
+}
+
+def read_dataset(fp: str, name: str, columns: Optional[list[str]] = None) -> pd.DataFrame:
+    """Reads a csv file of one of the datasets in `SCHEMAS`. Only the given columns are parsed and each column
+    is parsed straight into the dtype of the schema, using the pyarrow csv reader.
+
+    Args:
+        fp (str): File path of the csv file
+        name (str): Name of the dataset in `SCHEMAS`
+        columns (Optional[list[str]], optional): Columns to read, columns that aren't in the file are skipped.
+            Defaults to None (All columns).
+
+    Returns:
+        pd.DataFrame: Data with the dtypes of the schema
+    """
+    schema = SCHEMAS[name]
+
+    # Only the header is read, to find which of the requested columns exist
+    header = pd.read_csv(fp, nrows=0).columns
+    usecols = [c for c in header if columns is None or c in columns]
+    dtype = {c: t for c, t in schema.dtypes.items() if c in usecols and t in _PARSE_KINDS}
+
+    df = pd.read_csv(fp, usecols=usecols, dtype=dtype, engine="pyarrow") # type: ignore
+    return cast_dataset(df, name)
+
+def cast_dataset(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """Casts the columns of a DataFrame to the dtypes of one of the datasets in `SCHEMAS`, for data that wasn't
+    read with `read_dataset`.
+
+    Args:
+        df (pd.DataFrame): Data to cast
+        name (str): Name of the dataset in `SCHEMAS`
+
+    Returns:
+        pd.DataFrame: Data with the dtypes of the schema
+    """
+    schema = SCHEMAS[name]
+    df = df.copy(deep=False)
+
+    for c in schema.dates:
+        if c in df.columns and not pd.api.types.is_datetime64_any_dtype(df[c]):
+            df[c] = pd.to_datetime(df[c], format='mixed')
+
+    for c, dtype in schema.dtypes.items():
+        if c not in df.columns:
+            continue
+        if dtype == "category":
+            # Categories are sorted so sorting by the column is the same as sorting the values
+            if not isinstance(df[c].dtype, pd.CategoricalDtype):
+                df[c] = df[c].astype("category")
+            df[c] = df[c].cat.reorder_categories(sorted(df[c].cat.categories))
+        elif df[c].dtype != dtype:
+            df[c] = df[c].astype(dtype) # type: ignore
+
+    if schema.default_dtype is not None:
+        for c in df.columns:
+            if c not in schema.dtypes and df[c].dtype == "float64":
+                df[c] = df[c].astype(schema.default_dtype) # type: ignore
+
+    return df
@@ -14,6 +14,7 @@ from pydantic import BaseModel, Field
 
 from src.config import COORDS_SUBSET_FP, ZONE_MAP
 from src.util.model import get_elevation_band, eval_model, plot_performance
+from src.util.schema import read_dataset
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +47,11 @@ Do not include conversational language.
 
 MT_TZ = ZoneInfo('America/Denver')
 
+# Columns of the predictions file used by get_daily_weather
+DAILY_WEATHER_COLS = ['date', 'id', 'slope_angle', 'slope_azi', 'altitude', 'predicted_danger', 'TA', 'RH', 'VW',
+                      'wind_trans24', 'HN24', 'HN12', 'HN72_24', 'PSUM24', 'HS_mod', 'SWE', 'ski_pen', 'hoar_size',
+                      'ColdContentSnow', 'MS_Water', 'MS_Rain', 'ISWR']
+
 
 class Forecast(BaseModel):
     zone: str = Field(description="The name of the forecast zone.")
@@ -175,19 +181,15 @@ def get_daily_weather(
 
     logger.info(f"Aggregating data for {date}")
 
-    actual_dangers = pd.read_csv(actual_dangers_fp)
-    actual_dangers['date'] = pd.to_datetime(
-        actual_dangers['date']).dt.tz_localize(MT_TZ)
-
-    all_danger = pd.read_csv(all_dangers_fp)
+    # Only read the columns that are merged on or aggregated below
+    all_danger = read_dataset(all_dangers_fp, "predictions", columns=DAILY_WEATHER_COLS)
     all_danger = all_danger[all_danger['slope_angle'] == 38.0]
-    all_danger['date'] = pd.to_datetime(
-        all_danger['date']).dt.tz_localize(MT_TZ)
+    all_danger['date'] = all_danger['date'].dt.tz_localize(MT_TZ)
 
     # Need day data to get days predictions
-    day_preds = pd.read_csv(day_dangers_fp)
+    day_preds = read_dataset(day_dangers_fp, "day_predictions")
     day_preds = day_preds[day_preds['slope_angle'] == "slope"]
-    day_preds['date'] = pd.to_datetime(day_preds['date']).dt.tz_localize(MT_TZ)
+    day_preds['date'] = day_preds['date'].dt.tz_localize(MT_TZ)
 
     fac_coords = gpd.read_file(COORDS_SUBSET_FP).rename(
         columns={'lat': 'latitude', 'lon': 'longitude'})
@@ -216,7 +218,7 @@ def get_daily_weather(
             'elevation_band',
             'slope_angle',
             'slope_azi'
-        ])
+        ], observed=True)
         .agg(
             # core weather
             temp_avg=('TA', 'mean'),
@@ -297,13 +299,12 @@ def get_daily_weather(
 
 
 def save_performance_data(actual_fp: str, predicted_fp: str, output_dir: str):
-    actual_dangers = pd.read_csv(actual_fp)
-    actual_dangers['date'] = pd.to_datetime(
-        actual_dangers['date']).dt.tz_localize(MT_TZ)
+    actual_dangers = read_dataset(actual_fp, "fac_danger")
+    actual_dangers['date'] = actual_dangers['date'].dt.tz_localize(MT_TZ)
 
-    day_preds = pd.read_csv(predicted_fp)
+    day_preds = read_dataset(predicted_fp, "day_predictions")
     day_preds = day_preds[day_preds['slope_angle'] == "slope"]
-    day_preds['date'] = pd.to_datetime(day_preds['date']).dt.tz_localize(MT_TZ)
+    day_preds['date'] = day_preds['date'].dt.tz_localize(MT_TZ)
 
     combined_df = pd.merge(actual_dangers, day_preds, on=[
                            "zone_name", "date", "elevation_band"], how='inner').sort_values(by="date")
@@ -2,17 +2,21 @@ import logging
 import os
 import pickle
 from datetime import date, datetime, timedelta
-from typing import Union
+from typing import Optional, Union
 
 import geopandas as gpd
 import pandas as pd
 from dotenv import load_dotenv
 
-from src.config import COORDS_SUBSET_FP, REGS
+from src.config import COORDS_SUBSET_FP, REGS, SUMMER_MONTHS
+from src.herbie.fetch_pool import FetchPool
 from src.herbie.herbie_fetch import HerbieFetcher
-from src.sim.simulation import run_simulation
+from src.herbie.sources import DataSource
+from src.sim.checkpoints import CheckpointStore
+from src.sim.runner import SimJob, SimRunner
 from src.util.file import csv_to_json
 from src.util.model import get_averages, get_elevation_band
+from src.util.schema import read_dataset
 
 load_dotenv()
 
@@ -25,32 +29,38 @@ class ForecastPipeline():
     def __init__(self):
         self.__logger = logging.getLogger(__name__)
 
-    def comebine_data(self,past_data_fp: str, forecast_data_fp: str, day: datetime, output_fp: str) -> None:
-        """Combines past data csv and forecasted data csv into one csv file. Past data is taken up to 
-        the given day whule forecast data is taken for the given day. 
+    def comebine_data(self,past_data_fp: str, forecast_data_fp: str, day: datetime, output_fp: Optional[str] = None) -> pd.DataFrame:
+        """Combines past data csv and forecasted data csv into one DataFrame. Past data is taken up to 
+        the given day whule forecast data is taken for the hours after the past data up to the end of the given day,
+        so days ahead of the past data (Like tomorrow) are filled in from the forecast horizons. 
 
         Args:
             past_data_fp (str): File path to csv with past data
             forecast_data_fp (str): File path to csv with forecast data
             day (datetime): Day of forecast data
-            output_fp (str): Where to output combined file (Path and name)
+            output_fp (Optional[str], optional): Where to also output combined file (Path and name). Defaults to None.
+
+        Returns:
+            pd.DataFrame: Combined data
         """
-        past_df = pd.read_csv(past_data_fp)
-        past_df['time'] = pd.to_datetime(past_df['time'])
+        past_df = read_dataset(past_data_fp, "weather")
         
         missing_hours = self.get_missing_hours(past_df, past_df['time'].min(),day - timedelta(days=1))
-        forecast_data = pd.read_csv(forecast_data_fp)
+        forecast_data = read_dataset(forecast_data_fp, "weather")
 
         # Get forecast data for point with id in past df
         forecast_data = forecast_data[forecast_data['point_id'] == past_df['point_id'].unique()[0]].drop_duplicates()
-        forecast_data['valid_time'] = pd.to_datetime(forecast_data['valid_time'])
+        
+        # Hours forecast by more than one run use the latest run (Shortest fxx)
+        forecast_data = forecast_data.sort_values('fxx').drop_duplicates(subset='valid_time')
         forecast_data['time'] = forecast_data['valid_time']
         
         # Filter past df for all data up to day
         past_df = past_df[past_df['time'] <= day]
 
-        # Filter forecast data for given day only
-        forecast_data = forecast_data[forecast_data['time'].dt.date == day.date()]
+        # Forecast hours after the past data up to the end of day, hours the past data already has (Like 00:00 of
+        # the day) keep their past row, so they're the same every day
+        forecast_data = forecast_data[(forecast_data['time'] > past_df['time'].max()) & (forecast_data['time'] <= day.replace(hour=23))]
         combined_df = pd.concat([past_df, forecast_data])
             
         missing_hours = self.get_missing_hours(combined_df, past_df['time'].min(),day)
@@ -58,7 +68,9 @@ class ForecastPipeline():
         assert not missing_hours, self.__logger.exception(f"Missing {missing_hours} for point {past_df['point_id'].unique()[0]}")
         assert combined_df['time'].max() == day.replace(hour=23), self.__logger.exception(f"DataFrame has more hours than expected, Max date should be {day.replace(hour=23)}, got {combined_df['time'].max()}")
         
-        combined_df.to_csv(output_fp, index=False)
+        if output_fp is not None:
+            combined_df.to_csv(output_fp, index=False)
+        return combined_df
         
     def get_missing_hours(self,df: pd.DataFrame,min: Union[pd.Timestamp, datetime, date],max: Union[pd.Timestamp, datetime, date]) -> list[pd.Timestamp]:
         """Gets the hours (In datetime form) missing in the given dataFrame, assuming it has a column named 'time' with hour
@@ -73,16 +85,12 @@ class ForecastPipeline():
             list[pd.Timestamp]: List of missing dates
         """
         
-        # Make range of dates from min to max time in output data
-        dates = pd.date_range( min, max, freq='1h').to_list()
-
-        # Remove summer months
-        for i in range(len(dates)-1, 0, -1):
-            if dates[i].month in [6,7,8,9]:
-                dates.pop(i)
+        # Make range of dates from min to max time in output data, without summer months
+        dates = pd.date_range(min, max, freq='1h')
+        dates = dates[~dates.month.isin(SUMMER_MONTHS)]
 
         # Get missing hours in output data
-        missing_hours = list(set(dates)-set(df['time'].to_list()))
+        missing_hours = dates.difference(pd.DatetimeIndex(df['time'].unique())).to_list()
 
         return missing_hours
 
@@ -101,8 +109,8 @@ class ForecastPipeline():
         with open(model_fp, "rb") as file:
             model = pickle.load(file)
 
-        pred_df = pd.read_csv(pred_fp)
-        pred_df['date'] = pd.to_datetime(pred_df['date'])
+        # Only the dates and ids are needed to find missing predictions
+        pred_df = read_dataset(pred_fp, "predictions", columns=['date', 'id'])
 
         # Get dates that have no predictions or not enough predictions
         counts = pred_df.groupby(pred_df["date"].dt.normalize()).size() # type: ignore
@@ -126,6 +134,7 @@ class ForecastPipeline():
 
         # Run simulation for each missing date
         start_time = datetime.now()
+        checkpoints = CheckpointStore()
         for day in missing_dates:
             self.__logger.info(f"Running simulations for {day}")
 
@@ -136,53 +145,15 @@ class ForecastPipeline():
             missing_set = id_set - set(day_df.index)
             missing_set.update(day_df[day_df < 5].index.to_list())
             
-            for id in missing_set:
-                # TODO: Always skip 202 because it causes consistent issues.
-                if id == 202:
-                    continue
-                
-                self.__logger.info(f"Predicting for #{id}")
-                
-                self.comebine_data(f"data/fetched/2526_split/weather_2025-2026_p{id}_fxx1/weather_2025_p{id}_fxx1.csv", f"data/fetched/2526_forc_split/weather_2025-2026_p{id}_fxx1/weather_2025_p{id}_fxx1.csv", day, f"data/sim_temp/{id}.csv")
-                    
-                failed, file_name = run_simulation("data/sim_temp", "data/input/avyIO.ini", output_dir="data/sim_fetch")
-                
-                os.remove(os.path.join("data/sim_temp",f"{id}.csv"))
-                
-                if not file_name or failed:
-                    self.__logger.error(f"Sim for {id} failed, skipping predictions")
-                    continue
-                        
-                sim_data = pd.read_csv(file_name)
-                sim_data['timestamp'] = pd.to_datetime(sim_data['timestamp'])
-                
-                if sim_data.empty:
-                    self.__logger.error(f"{id} missing data for {day.date()}, skipping")
-                    continue
-
-                df = sim_data.drop(columns=['MS_Soil_Runoff', 'TSS_meas'])
-                
-                daily_avg, removed_cols = get_averages(df)
-
-                # Make predictions
-                preds = model.predict(daily_avg)
-                predictions = pd.concat([daily_avg, removed_cols], axis=1)
-                
-                predictions['predicted_danger'] = preds
-                
-                predictions = predictions[predictions['date'].dt.date == day.date()] # type: ignore
-                
+            # Past data up to the start of the day won't change, so each station resumes from its state there
+            for predictions in self.__predict_day(day, missing_set, model, checkpoints, checkpoint_at=day):
                 predictions.to_csv(pred_fp, index=False, header=not os.path.exists(pred_fp), mode='a')
             
             # Remove dups from prediction file
-            pred_file = pd.read_csv(pred_fp)
+            pred_file = read_dataset(pred_fp, "predictions")
             pred_file = pred_file.drop_duplicates().sort_values(by=["date","id"])
             pred_file.to_csv(pred_fp, index=False)
             
-            # Clean up
-            for file in os.listdir("data/sim_fetch"):
-                os.remove(os.path.join("data/sim_fetch", file))
-                
             self.__logger.info(f"Finished making predictions in {datetime.now() - start_time}")
 
             pred_file = pd.merge(pred_file, fac_coords, on=['id'], how='inner').drop(columns=["latitude","longitude","geometry"])
@@ -193,55 +164,148 @@ class ForecastPipeline():
             day_data['slope_angle'] = day_data['slope_angle'].apply(lambda x: "flat" if x == 0 else "slope")
             day_data.to_csv("data/ops25_26/day_predictions.csv",index=False)
 
-    def fetch_missing_weather_data(self,output_file_dir: str, output_file_name: str ,error_file: str ,date_file: str, fac_coords_fp: str) -> None:
-        start_time = datetime.now()
+    def get_ahead_predictions(self, pred_fp: str, model_fp: str, fac_coords_fp: str, lead_days: int = 1) -> None:
+        """Simulate the snowpack with the forecast horizons of today's run and predict the danger of each of the next
+        `lead_days` days. Predictions are written to `pred_fp` with a 'lead_days' column, replacing the ones made from
+        earlier runs. Each day has to be covered by the forecast to its last hour, the 48 hours of the 00Z run reach
+        the end of tomorrow.
 
+        Args:
+            pred_fp (str): File to save predictions to.
+            model_fp (str): File where a model is stored that can be used to predict the danger.
+            fac_coords_fp (str): File where point coordinates are stored.
+            lead_days (int, optional): Number of days after today to predict. Defaults to 1.
+        """
         fac_coords = gpd.read_file(fac_coords_fp).rename(columns={'lat':'latitude','lon':'longitude'})
 
-        # HerbieFetcher for past data
-        hf = HerbieFetcher(
-            output_file_dir=output_file_dir,
-            output_file_name=output_file_name,
-            error_file_path=error_file,
-            date_file_path=date_file,
-            show_times=True
-        )
+        with open(model_fp, "rb") as file:
+            model = pickle.load(file)
 
-        day = pd.to_datetime(datetime.now().date())
-                
-        self.__logger.info("Checking for missing season data")
+        today = pd.Timestamp.today().normalize()
+        checkpoints = CheckpointStore()
+        frames = []
+        for lead in range(1, lead_days + 1):
+            day = today + timedelta(days=lead)
+            self.__logger.info(f"Running simulations for {day}, {lead} days ahead")
+
+            # Each station resumes from its state at the start of today, the forecast hours after it aren't saved
+            for predictions in self.__predict_day(day, set(fac_coords['id'].unique()), model, checkpoints, checkpoint_at=today):
+                frames.append(predictions.assign(lead_days=lead))
+
+        if len(frames) == 0:
+            self.__logger.error("No predictions were made for the days ahead")
+            return
+
+        pd.concat(frames, ignore_index=True).sort_values(by=["date","id"]).to_csv(pred_fp, index=False)
+
+    def __predict_day(self, day: pd.Timestamp, ids: set, model, checkpoints: CheckpointStore, checkpoint_at: pd.Timestamp) -> list[pd.DataFrame]:
+        """Simulates each of the given points up to the end of day and predicts the danger of the day, points whose
+        simulation fails are skipped.
+
+        Returns:
+            list[pd.DataFrame]: Predictions of the day for each point
+        """
+        jobs = []
+        for id in ids:
+            # TODO: Always skip 202 because it causes consistent issues.
+            if id == 202:
+                continue
+            
+            self.__logger.info(f"Predicting for #{id}")
+            
+            forcing = self.comebine_data(f"data/fetched/2526_split/weather_2025-2026_p{id}_fxx1/weather_2025_p{id}_fxx1.csv", f"data/fetched/2526_forc_split/weather_2025-2026_p{id}_fxx1/weather_2025_p{id}_fxx1.csv", day)
+            # Outliers were removed when the data was fetched
+            jobs.append(SimJob(str(id), forcing=forcing, checkpoints=checkpoints, checkpoint_at=checkpoint_at, clean=False))
         
-        # Fetch any missing data up to day
-        fetched = hf.fetch_missing_season_data(2025,day,REGS,[1],fac_coords)
-        hf.split_data(output_dir_name="2526_split", split_seasons=True)
-        if fetched:
-            self.__logger.info(f"Finished fetching data in {datetime.now() - start_time}")
+        # Every station is simulated at once, each in its own working directory
+        results = SimRunner().run(jobs)
+        
+        frames = []
+        for result in results:
+            id = result.job.name
+            
+            if result.output is None or result.failed:
+                self.__logger.error(f"Sim for {id} failed, skipping predictions")
+                continue
+                    
+            sim_data = result.output
+            
+            if sim_data.empty:
+                self.__logger.error(f"{id} missing data for {day.date()}, skipping")
+                continue
+
+            df = sim_data.drop(columns=['MS_Soil_Runoff', 'TSS_meas'])
+            
+            daily_avg, removed_cols = get_averages(df)
+
+            # Make predictions
+            preds = model.predict(daily_avg)
+            predictions = pd.concat([daily_avg, removed_cols], axis=1)
+            
+            predictions['predicted_danger'] = preds
+            
+            frames.append(predictions[predictions['date'].dt.date == day.date()]) # type: ignore
+        return frames
 
+    def fetch_missing_weather_data(self,output_file_dir: str, output_file_name: str ,error_file: str ,date_file: str, fac_coords_fp: str,
+                                   source: Optional[DataSource] = None) -> None:
         start_time = datetime.now()
+
+        fac_coords = gpd.read_file(fac_coords_fp).rename(columns={'lat':'latitude','lon':'longitude'})
+
+        # Both fetchers share one pool so workers are only started once per run, and are stopped even if a fetch fails
+        with FetchPool(source=source) as pool:
+            # HerbieFetcher for past data
+            hf = HerbieFetcher(
+                output_file_dir=output_file_dir,
+                output_file_name=output_file_name,
+                error_file_path=error_file,
+                date_file_path=date_file,
+                show_times=True,
+                pool=pool,
+                source=source
+            )
+
+            day = pd.to_datetime(datetime.now().date())
+                
+            self.__logger.info("Checking for missing season data")
+        
+            # Fetch any missing data up to day
+            fetched = hf.fetch_missing_season_data(2025,day,REGS,[1],fac_coords)
+            hf.split_data(output_dir_name="2526_split", split_seasons=True)
+            if fetched:
+                self.__logger.info(f"Finished fetching data in {datetime.now() - start_time}")
+
+            start_time = datetime.now()
             
-        # Fetch forecasted data 
-        hf = HerbieFetcher(
-            output_file_dir=output_file_dir,
-            output_file_name="forecast_25-26.csv",
-            error_file_path=error_file,
-            date_file_path=date_file,
-            show_times=True
-        )
+            # Fetch forecasted data 
+            hf = HerbieFetcher(
+                output_file_dir=output_file_dir,
+                output_file_name="forecast_25-26.csv",
+                error_file_path=error_file,
+                date_file_path=date_file,
+                show_times=True,
+                pool=pool,
+                source=source
+            )
                     
-        self.__logger.info(f"Fetching current day forecast {day}")
-        fetched = hf.fetch_missing_forecast_data(2025,day,REGS,fac_coords)    
-        hf.split_data(output_dir_name="2526_forc_split", split_seasons=True, time_col='valid_time')
+            # Every horizon of each day's run, so the days ahead can be predicted along with today
+            self.__logger.info(f"Fetching forecast horizons up to the run of {day}")
+            fetched = hf.fetch_forecast_horizons(2025,day,REGS,fac_coords)    
+        
+        hf.split_data(output_dir_name="2526_forc_split", split_seasons=True, time_col='valid_time', by_fxx=False)
         if fetched:
             self.__logger.info(f"Finished fetching forecast data in {datetime.now() - start_time}")
 
-    def run_pipeline(self,output_file_dir: str,output_file_name: str,error_file: str,date_file: str,fac_coords_fp: str,pred_output_fp: str,model_fp: str) -> None:
+    def run_pipeline(self,output_file_dir: str,output_file_name: str,error_file: str,date_file: str,fac_coords_fp: str,pred_output_fp: str,model_fp: str,
+                     source: Optional[DataSource] = None, ahead_pred_fp: Optional[str] = None) -> None:
         """
         Run the full data ingestion and prediction pipeline.
 
         This method first fetches any missing historical and forecast weather data
         for all forecast area coordinates, then simulates the snowpack and generates
         avalanche danger predictions for any dates with missing or incomplete
-        predictions.
+        predictions, and for the days ahead if `ahead_pred_fp` is given.
 
         Args:
             output_file_dir (str): Directory where fetched weather data files are written.
@@ -251,13 +315,18 @@ class ForecastPipeline():
             fac_coords_fp (str): File path to forecast area coordinate data.
             pred_output_fp (str): File path where prediction outputs are stored/appended.
             model_fp (str): File path to the trained model used for predictions.
+            source (Optional[DataSource], optional): Where weather data is fetched from, like `ZarrSource()` to read
+                the hrrrzarr archive. Defaults to None (GRIB2 files with Herbie).
+            ahead_pred_fp (Optional[str], optional): File path where predictions for the days ahead are written
+                (See `get_ahead_predictions`). Defaults to None (No predictions ahead).
         """
         self.fetch_missing_weather_data(
             output_file_dir,
             output_file_name,
             error_file,
             date_file,
-            fac_coords_fp
+            fac_coords_fp,
+            source
         )
 
         self.get_missing_predictions(
@@ -266,6 +335,13 @@ class ForecastPipeline():
             fac_coords_fp
         )
 
+        if ahead_pred_fp is not None:
+            self.get_ahead_predictions(
+                ahead_pred_fp,
+                model_fp,
+                fac_coords_fp
+            )
+
 if __name__ == "__main__":
     process_start = datetime.now()
     
@@ -279,6 +355,7 @@ if __name__ == "__main__":
 
     fp = ForecastPipeline()
 
-    fp.run_pipeline(output_file_dir,output_file_name,error_file,date_file, COORDS_SUBSET_FP,pred_output_file,"data/models/best_model_4.pkl")
+    fp.run_pipeline(output_file_dir,output_file_name,error_file,date_file, COORDS_SUBSET_FP,pred_output_file,"data/models/best_model_4.pkl",
+                    ahead_pred_fp="data/ops25_26/ahead_predictions.csv")
 
     print(f"Process completed in {datetime.now() - process_start}")
\ No newline at end of file
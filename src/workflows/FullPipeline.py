@@ -36,6 +36,7 @@ if __name__ == "__main__":
             COORDS_SUBSET_FP,
             pred_output_file,
             "data/models/best_model_4.pkl",
+            ahead_pred_fp="data/ops25_26/ahead_predictions.csv",
         )
 
         fs = FAC_Scraper()
@@ -43,7 +44,7 @@ if __name__ == "__main__":
 
         csv_to_json("data/ops25_26/day_predictions.csv","web/avyAI/public/data/ai_forecast.json")
 
-        csv_to_json("data/2526_FAC/FAC_danger_levels_25_cleaned.csv", "web/avyAI/public/data/actual_forecast.json")
+        csv_to_json("data/2526_FAC/FAC_danger_levels_25_cleaned.csv", "web/avyAI/public/data/actual_forecast.json", dataset="fac_danger")
         
         gen_ai_forecast(
             actual_dangers_fp="data/2526_FAC/FAC_danger_levels_25_cleaned.csv",
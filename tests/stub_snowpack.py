@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Stand-in for the SNOWPACK binary in tests, run like it: `stub_snowpack.py -b {begin} -e {end} -c {ini}`.
+
+Each virtual slope (A .sno file in the input SNOWPATH) carries one value of state, `stub_state` in its .sno file.
+Every hour after `begin` up to `end` the state decays a little and takes in the hour's PSUM and TA, so the output
+of an hour depends on every hour before it like a snowpack does. The output smet of a slope has the state at each
+hour from `begin`, and its end of run .sno file has the state at `end`, both named like SNOWPACK names them."""
+import argparse
+import os
+from datetime import datetime
+
+def read_ini(fp: str) -> dict[str, dict[str, str]]:
+    sections: dict[str, dict[str, str]] = {}
+    section = ""
+    with open(fp, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("["):
+                section = line.upper()
+            elif "=" in line:
+                key, value = [v.strip() for v in line.split("=", 1)]
+                sections.setdefault(section, {})[key.upper()] = value
+    return sections
+
+def read_smet(fp: str) -> list[dict[str, str]]:
+    with open(fp, "r") as file:
+        lines = file.read().splitlines()
+    data = lines.index("[DATA]")
+    fields = [l for l in lines[:data] if l.startswith("fields")][0].split("=", 1)[1].split()
+    return [dict(zip(fields, l.split())) for l in lines[data + 1:] if l.strip()]
+
+def read_sno(fp: str) -> dict[str, str]:
+    with open(fp, "r") as file:
+        return dict([v.strip() for v in l.split("=", 1)] for l in file if "=" in l) # type: ignore
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", required=True)
+    parser.add_argument("-e", required=True)
+    parser.add_argument("-c", required=True)
+    args = parser.parse_args()
+
+    begin, end = datetime.fromisoformat(args.b), datetime.fromisoformat(args.e)
+    ini = read_ini(args.c)
+    experiment = ini.get("[OUTPUT]", {}).get("EXPERIMENT", "stub")
+    station = [v for s in ini.values() for k, v in s.items() if k == "STATION1"][0]
+    forcing = [r for r in read_smet(os.path.join(ini["[INPUT]"]["METEOPATH"], station))
+               if begin < datetime.fromisoformat(r['timestamp']) <= end]
+
+    sno_dir = ini["[INPUT]"]["SNOWPATH"]
+    output_dir = ini["[OUTPUT]"]["METEOPATH"]
+    for fn in sorted(os.listdir(sno_dir)):
+        name = fn.split(".")[0]
+        sno = read_sno(os.path.join(sno_dir, fn))
+        state = float(sno.get("stub_state", 0.0))
+        angle = float(sno.get("slope_angle", 0.0))
+
+        rows = [(begin.isoformat(), state)]
+        for r in forcing:
+            state = 0.99 * state + float(r['PSUM']) * (1 + angle / 90) + 0.001 * float(r['TA'])
+            rows.append((r['timestamp'], state))
+
+        with open(os.path.join(output_dir, f"{name}_{experiment}.smet"), "w") as file:
+            file.write("SMET 1.1 ASCII\n[HEADER]\n")
+            file.write(f"station_id = {name}\naltitude = {sno.get('altitude', 0)}\nslope_angle = {angle}\n")
+            file.write(f"slope_azi = {sno.get('slope_azi', 0)}\nnodata = -999\nfields = timestamp HS_mod\n[DATA]\n")
+            file.writelines(f"{t} {v:.6f}\n" for t, v in rows)
+
+        sno['stub_state'] = repr(state)
+        sno['ProfileDate'] = end.isoformat()
+        with open(os.path.join(output_dir, f"{name}_{experiment}.sno"), "w") as file:
+            file.writelines(f"{k} = {v}\n" for k, v in sno.items())
+
+if __name__ == "__main__":
+    main()
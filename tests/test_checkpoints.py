@@ -0,0 +1,95 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.config import EXP_COLS
+from src.sim.checkpoints import CheckpointStore
+from src.sim.runner import SimJob, run_sim_job
+from src.util import file
+
+STUB_BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_snowpack.py")
+POINT_ID = 101
+DAY = pd.Timestamp(2025, 12, 3)
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    """ini and sno templates of a station with a flat and a sloped virtual slope, simulated by the stub binary"""
+    # The station is looked up in the coords file and elevation rasters otherwise
+    monkeypatch.setattr(file, "_load_coords", lambda: pd.DataFrame({'id': [POINT_ID], 'lat': [48.2], 'lon': [-114.3]}))
+    monkeypatch.setattr(file, "find_elevation", lambda *_: 1800.0)
+
+    ini_fp = tmp_path / "io.ini"
+    ini_fp.write_text("[INPUT]\nMETEOPATH = .\nSNOWPATH = .\nSTATION1 = x.smet\n[OUTPUT]\nMETEOPATH = .\nSNOWPATH = .\nEXPERIMENT = stub\n")
+
+    sno_dir = tmp_path / "sno"
+    sno_dir.mkdir()
+    for fn, angle in (("000.sno", 0), ("0001.sno", 38)):
+        (sno_dir / fn).write_text(f"station_id = 000\nstation_name = s_000\nlatitude = 0\nlongitude = 0\naltitude = 0\n"
+                                  f"ProfileDate = 2020-10-01T00:00:00\nslope_angle = {angle}\nslope_azi = 0\n")
+    return {"ini_fp": str(ini_fp), "sno_dir": str(sno_dir), "work_dir": str(tmp_path / "work"), "snowpack_bin": STUB_BIN,
+            "clean": False}
+
+def forcing(end: pd.Timestamp) -> pd.DataFrame:
+    """Hourly weather of the station from Dec 1st up to and including `end`"""
+    times = pd.date_range(datetime(2025, 12, 1), end, freq='1h')
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({c: rng.uniform(0, 5, len(times)) for c in EXP_COLS})
+    df['time'] = times
+    df['valid_time'] = times + pd.Timedelta(hours=1)
+    df['fxx'] = 1
+    df['point_id'] = POINT_ID
+    df['r2'] = 80.0
+    return df[EXP_COLS]
+
+def run(setup: dict, df: pd.DataFrame, **kwargs):
+    result = run_sim_job(SimJob(str(POINT_ID), forcing=df, **setup, **kwargs))
+    assert not result.failed, result.error
+    return result
+
+def sorted_output(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(['timestamp', 'slope_angle']).reset_index(drop=True)
+
+def test_resumed_run_matches_full_run(setup, tmp_path):
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints"))
+    next_day = DAY + pd.Timedelta(days=1)
+    df = forcing(next_day + pd.Timedelta(hours=23))
+
+    # Daily runs like ForecastPipeline, each checkpointed at the start of its day
+    first = run(setup, df[df['time'] <= DAY + pd.Timedelta(hours=23)], checkpoints=checkpoints, checkpoint_at=DAY)
+    assert first.resumed_from is None
+    resumed = run(setup, df, checkpoints=checkpoints, checkpoint_at=next_day)
+    assert resumed.resumed_from == DAY
+
+    full = run(setup, df)
+    pd.testing.assert_frame_equal(sorted_output(resumed.output), sorted_output(full.output), check_dtype=False) # type: ignore
+
+def test_changed_past_hour_reruns_from_start(setup, tmp_path):
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints"))
+    next_day = DAY + pd.Timedelta(days=1)
+    df = forcing(next_day + pd.Timedelta(hours=23))
+    run(setup, df[df['time'] <= DAY + pd.Timedelta(hours=23)], checkpoints=checkpoints, checkpoint_at=DAY)
+
+    # A past hour is refetched with different precipitation
+    edited = df.copy()
+    edited.loc[edited['time'] == pd.Timestamp(2025, 12, 2, 5), 'tp'] += 3.0
+    rerun = run(setup, edited, checkpoints=checkpoints, checkpoint_at=next_day)
+    assert rerun.resumed_from is None
+
+    full = run(setup, edited)
+    pd.testing.assert_frame_equal(sorted_output(rerun.output), sorted_output(full.output), check_dtype=False) # type: ignore
+
+def test_older_day_keeps_checkpoint(setup, tmp_path):
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints"))
+    df = forcing(DAY + pd.Timedelta(hours=23))
+    run(setup, df, checkpoints=checkpoints, checkpoint_at=DAY)
+
+    # Backfilling the day before doesn't resume from or replace the later checkpoint
+    older_day = DAY - pd.Timedelta(days=1)
+    backfill = run(setup, df[df['time'] <= older_day + pd.Timedelta(hours=23)], checkpoints=checkpoints, checkpoint_at=older_day)
+    assert backfill.resumed_from is None
+
+    resumed = run(setup, df, checkpoints=checkpoints, checkpoint_at=DAY)
+    assert resumed.resumed_from == DAY
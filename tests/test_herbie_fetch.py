@@ -0,0 +1,59 @@
+import os
+import time
+from datetime import datetime
+
+from src.config import REGS
+from src.herbie.bench import make_coords
+from src.herbie.fetch_pool import FetchPool
+from src.herbie.grib_cache import GribCache
+from src.herbie.herbie_fetch import HerbieFetcher
+from src.herbie.retry import LatencyTracker, RetryPolicy
+from src.herbie.sources import LocalSource
+
+class HangingSource(LocalSource):
+    """Hangs on its first fetch like a request that never returns, every later fetch reads the local files"""
+    def fetch(self, job, stages=None):
+        try:
+            os.close(os.open(os.path.join(self.root, "_hung"), os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return super().fetch(job, stages)
+        time.sleep(600)
+
+def test_hung_job_frees_its_worker(tmp_path):
+    source = HangingSource(str(tmp_path / "hrrr"))
+    coords = make_coords(4, source)
+    error_fp = str(tmp_path / "errors.txt")
+
+    # One worker, so retries would queue behind the hung job if the pool wasn't recycled
+    pool = FetchPool(1, source)
+    hf = HerbieFetcher(str(tmp_path / "out"), "weather.csv", error_fp, str(tmp_path / "dates.txt"), pool=pool,
+                       cache=GribCache(str(tmp_path / "cache")), prefetch=1, retry_policy=RetryPolicy(base_delay=0.1), source=source)
+    hf.latency = LatencyTracker(initial_timeout=2, min_timeout=2)
+
+    s_time = time.monotonic()
+    try:
+        hf.fetch_data(REGS, [1], coords, intervals=[(datetime(2025, 12, 1, 0), datetime(2025, 12, 1, 2))]) # type: ignore
+    finally:
+        pool.shutdown()
+
+    assert time.monotonic() - s_time < 60
+    assert not os.path.exists(error_fp) or open(error_fp).read() == ""
+    assert hf.store.read().shape[0] == 3 * len(coords)
+    assert sum(v for (name, _), v in hf.metrics.counters.items() if name == "pool_recycles") >= 1
+
+def test_split_names_forecast_files_after_smallest_fxx(tmp_path):
+    source = LocalSource(str(tmp_path / "hrrr"))
+    coords = make_coords(2, source)
+    hf = HerbieFetcher(str(tmp_path / "out"), "forecast.csv", str(tmp_path / "errors.txt"), str(tmp_path / "dates.txt"),
+                       cache=GribCache(str(tmp_path / "cache")), source=source)
+
+    # A later horizon is saved before fxx 1, so the coverage index doesn't list fxx in order
+    interval = (datetime(2025, 12, 1, 0), datetime(2025, 12, 1, 0))
+    try:
+        hf.fetch_data(REGS, [2], coords, intervals=[interval]) # type: ignore
+        hf.fetch_data(REGS, [1], coords, intervals=[interval]) # type: ignore
+    finally:
+        hf.close()
+    hf.split_data(output_dir_name="split", time_col='valid_time', by_fxx=False)
+
+    assert sorted(os.listdir(tmp_path / "out" / "split")) == ["_watermarks.json"] + [f"weather_p{int(p)}_fxx1.csv" for p in sorted(coords['id'])]
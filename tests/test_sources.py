@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src.config import REGS
+from src.herbie.bench import make_coords
+from src.herbie.fetch_pool import FetchJob
+from src.herbie.sources import ZARR_MESSAGES, LocalSource
+
+DATES = [datetime(2025, 12, 1, 0), datetime(2025, 12, 1, 1)]
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    """A `LocalSource` and a `ZarrSource` reading a local Zarr archive of the same runs"""
+    # Point weights are cached in the home directory
+    monkeypatch.setenv("HOME", str(tmp_path))
+    local = LocalSource(str(tmp_path / "hrrr"))
+    # Chunks smaller than the grid, so reads span several chunks
+    return local, local.write_zarr(str(tmp_path / "zarr"), DATES, [0, 1, 2], chunks=(16, 16))
+
+@pytest.mark.parametrize("regex", REGS)
+def test_zarr_source_matches_local_source(sources, regex):
+    local, zarr_source = sources
+    job = FetchJob(DATES, [1, 2], regex, make_coords(5, local))
+
+    expected = local.fetch(job)
+    actual = zarr_source.fetch(job)
+
+    assert actual is not None and expected is not None
+    assert actual.index.equals(expected.index)
+    np.testing.assert_allclose(actual['latitude'], expected['latitude'])
+    np.testing.assert_allclose(actual['longitude'], expected['longitude'])
+
+    names = [c for c in (m[4] for m in ZARR_MESSAGES) if c in expected.columns]
+    assert len(names) > 0
+    for name in names:
+        np.testing.assert_allclose(actual[name], expected[name], rtol=1e-6, err_msg=name)
+
+def test_zarr_source_reads_analysis_store(sources):
+    local, zarr_source = sources
+    job = FetchJob(DATES, 0, REGS[1], make_coords(5, local))
+
+    expected = local.fetch(job)
+    actual = zarr_source.fetch(job)
+
+    assert actual is not None and expected is not None
+    assert (actual.index.get_level_values('step') == np.timedelta64(0, 'h')).all()
+    for name in ['t2m', 'r2']:
+        np.testing.assert_allclose(actual[name], expected[name], rtol=1e-6, err_msg=name)
+
+def test_zarr_source_reads_bounds(sources):
+    local, zarr_source = sources
+    # Crosses chunk edges of the archive in both directions
+    job = FetchJob(DATES, [1, 2], REGS[0], make_coords(1, local), bounds=(47.9, -115.0, 48.4, -114.2))
+
+    expected = local.fetch(job)
+    actual = zarr_source.fetch(job)
+
+    assert actual is not None and expected is not None
+    assert actual.shape[0] == expected.shape[0]
+    for col in ['y', 'x', 'latitude', 'longitude']:
+        np.testing.assert_allclose(actual[col], expected[col], err_msg=col)
+    for name in [c for c in (m[4] for m in ZARR_MESSAGES) if c in expected.columns]:
+        np.testing.assert_allclose(actual[name], expected[name], rtol=1e-6, err_msg=name)
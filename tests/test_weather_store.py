@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from src.config import EXP_COLS
+from src.herbie.weather_store import STORE_VERSION, WeatherStore
+
+def forecast_rows(run: pd.Timestamp, fxxs: list[int], value: float, fxx=None) -> pd.DataFrame:
+    """Rows of one point for the given horizons of a run, all saved at `fxx` if it's given"""
+    df = pd.DataFrame({c: np.full(len(fxxs), value) for c in EXP_COLS})
+    df['time'] = run
+    df['valid_time'] = [run + pd.Timedelta(hours=f) for f in fxxs]
+    df['fxx'] = fxxs if fxx is None else fxx
+    df['point_id'] = 101
+    return df[EXP_COLS]
+
+def test_migrate_sets_fxx_of_legacy_forecast_rows(tmp_path):
+    store = WeatherStore(str(tmp_path / "store"))
+    run = pd.Timestamp(2025, 12, 1)
+
+    # Rows saved with fxx 1 by older versions, and rows of the same run saved since with their real fxx
+    store.upsert(forecast_rows(run, [1, 2, 3], 1.0, fxx=1))
+    store.upsert(forecast_rows(run, [2], 2.0))
+    assert store.read().shape[0] == 4
+
+    assert store.migrate() == 1
+    df = store.read()
+    assert df['fxx'].to_list() == [1, 2, 3]
+    assert df['t'].to_list() == [1.0, 2.0, 1.0]
+    assert store.version == STORE_VERSION
+
+    # Changed rows are journaled for split_data, and the store is only migrated once
+    assert not store.changes_since(0).empty
+    assert store.migrate() == 0